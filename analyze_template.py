@@ -1,5 +1,5 @@
 import os
-from docx import Document
+from docx_text import iter_paragraphs, iter_table_rows
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, "invoice_templates")
@@ -11,20 +11,19 @@ def analyze_docx():
         print(f"File not found: {path}")
         return
 
-    doc = Document(path)
-    
     print(f"--- Analyzing {SAMPLE_FILE} ---")
     print("PARAGRAPHS:")
-    for i, p in enumerate(doc.paragraphs):
+    body = (p for p in iter_paragraphs(path) if p.table is None)
+    for i, p in enumerate(body):
         if p.text.strip():
             print(f"{i}: {p.text}")
             
     print("\nTABLES:")
-    for i, table in enumerate(doc.tables):
-        print(f"Table {i}:")
-        for row in table.rows:
-            row_text = [cell.text.strip() for cell in row.cells]
-            print(f"  {row_text}")
+    for table, row, cells in iter_table_rows(path):
+        if row == 0:
+            print(f"Table {table}:")
+        row_text = [text.strip() for text in cells]
+        print(f"  {row_text}")
 
 if __name__ == "__main__":
     analyze_docx()
@@ -1,28 +1,38 @@
 from datetime import date, timedelta
-from flask import Flask, render_template, request, redirect, url_for, send_file, jsonify, flash
-from apscheduler.schedulers.background import BackgroundScheduler
+from flask import Flask, render_template, stream_template, request, redirect, url_for, send_file, jsonify, flash, Response, stream_with_context
+import logging
 import os
-import sys
-import traceback
-from models import init_db, SessionLocal, Customer, Invoice, FeeType
+import threading
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from models import init_db, SessionLocal, Customer, CustomerFee, Invoice, InvoiceLine, FeeType
+from job_events import JobCancelled, start_job, get_run, find_running, sse_format, describe_event
+from job_lease import JobAlreadyRunning
+from reference_cache import get_fee_types, get_customer_index, invalidate_fee_types, invalidate_customers
+import http_cache
+import compression
+import scheduler
+import structured_logging
+from http_cache import cached_page
+from compression import buffered
+from reports import apply_invoice, rebuild_rollups, revenue_report, ar_aging_report, outstanding_by_customer
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
-from invoice_generator import generate_invoice_for_customer, get_invoice_templates, generate_invoice_with_template, generate_invoice_buffer, get_period_label
+structured_logging.init_app(app)
+http_cache.init_app(app)
+compression.init_app(app)
+logger = logging.getLogger(__name__)
+from invoice_generator import generate_invoice_for_customer, get_invoice_templates, generate_invoice_with_template, generate_invoice_buffer, get_period_label, load_property_fees, NO_PROPERTY_FEES
 
 # Initialize DB (safe to run multiple times)
 @app.route("/generate-invoice", methods=["GET", "POST"])
 def generate_invoice():
     session = SessionLocal()
     try:
-        customers = session.query(Customer).all()
-        templates = get_invoice_templates()
-        fee_types = session.query(FeeType).all()
-        
         if request.method == "POST":
-            # Debug logging
-            print(f"DEBUG: Form Data Received: {request.form}")
-            
+            logger.debug("generate_invoice form received", extra={"fields": sorted(request.form)})
+
             customer_id = int(request.form["customer_id"])
             customer = session.query(Customer).get(customer_id)
             
@@ -54,7 +64,10 @@ def generate_invoice():
             else:
                 additional_fee_amount = customer.additional_fee_amount
             
-            print(f"DEBUG: Final Fees: Fee2={fee_2_type}/${fee_2_amount}, Fee3={fee_3_type}/${fee_3_amount}")
+            logger.debug("generate_invoice fees resolved", extra={
+                "customer_id": customer_id, "fee_2_type": fee_2_type, "fee_2_amount": fee_2_amount,
+                "fee_3_type": fee_3_type, "fee_3_amount": fee_3_amount,
+            })
 
             # Pass extra fees as kwargs
             invoice = generate_invoice_with_template(
@@ -69,19 +82,32 @@ def generate_invoice():
                 additional_fee_amount=additional_fee_amount
             )
             return redirect(url_for("list_invoices"))
+
+        customers = get_customer_index()
+        templates = get_invoice_templates()
+        fee_types = get_fee_types()
         return render_template("generate_invoice.html", customers=customers, templates=templates, fee_types=fee_types, date=date)
     finally:
         session.close()
 
-def bill_due_customers():
-    """Run once a day: generate invoices for customers whose next_bill_date is today or in the past."""
+def bill_due_customers(events=None):
+    """
+    Run once a day: generate invoices for customers whose next_bill_date is today or in the past.
+    If given, events(kind, **data) is called for each invoice created or skipped, each failure,
+    and with a "progress" event after each customer. It may raise JobCancelled to stop the run;
+    customers finished so far are kept.
+    """
+    emit = events or (lambda kind, **data: None)
+    created = skipped = failed = 0
     session = SessionLocal()
     try:
         today = date.today()
         # Catch up on any missed invoices
-        customers = session.query(Customer).filter(Customer.next_bill_date <= today).all()
+        customers = session.query(Customer).options(selectinload(Customer.fees)).filter(Customer.next_bill_date <= today).all()
+        property_fees = load_property_fees(session, [c.id for c in customers])
         
-        for c in customers:
+        emit("progress", done=0, total=len(customers))
+        for n, c in enumerate(customers, start=1):
             # Process all due periods until next_bill_date is in the future
             # Limit iterations to prevent infinite loops in case of logic error
             max_iterations = 12 
@@ -92,16 +118,30 @@ def bill_due_customers():
                 
                 # Check if invoice already exists for this period
                 period_label = get_period_label(c.next_bill_date, c.cadence)
-                existing_invoice = session.query(Invoice).filter(
-                    Invoice.customer_id == c.id,
-                    Invoice.period_label == period_label
-                ).first()
+                # Don't flush the pending next_bill_date change here: on SQLite that would hold
+                # the write lock while generate_invoice_for_customer inserts from its own session
+                with session.no_autoflush:
+                    existing_invoice = session.query(Invoice).filter(
+                        Invoice.customer_id == c.id,
+                        Invoice.period_label == period_label
+                    ).first()
                 
                 if not existing_invoice:
-                    print(f"Generating invoice for {c.name} - {period_label}")
-                    generate_invoice_for_customer(c, c.next_bill_date)
+                    logger.info("billing customer", extra={"customer_id": c.id, "period_label": period_label})
+                    try:
+                        generate_invoice_for_customer(c, c.next_bill_date, property_fees.get(c.id, NO_PROPERTY_FEES))
+                    except Exception as e:
+                        # Leave next_bill_date alone so the next run retries this period
+                        logger.exception("billing failed", extra={"customer_id": c.id, "period_label": period_label})
+                        failed += 1
+                        emit("error", customer_id=c.id, period_label=period_label, error=str(e))
+                        break
+                    created += 1
+                    emit("invoice_created", customer_id=c.id, period_label=period_label)
                 else:
-                    print(f"Skipping {c.name} - {period_label} (Invoice already exists)")
+                    logger.info("invoice already exists, skipping", extra={"customer_id": c.id, "period_label": period_label})
+                    skipped += 1
+                    emit("skipped", customer_id=c.id, period_label=period_label, reason="invoice already exists")
 
                 # Advance next_bill_date based on cadence
                 if c.cadence == "monthly":
@@ -131,7 +171,14 @@ def bill_due_customers():
                     c.next_bill_date = c.next_bill_date.replace(year=c.next_bill_date.year + 1)
 
             session.add(c)
+            # Invoices are committed one by one, so commit each customer's schedule with them
+            session.commit()
+            emit("progress", done=n, total=len(customers), customer_id=c.id)
+        return {"created": created, "skipped": skipped, "failed": failed}
+    except JobCancelled:
+        # Keep the schedule advance for invoices already created for the current customer
         session.commit()
+        raise
     finally:
         session.close()
 
@@ -140,15 +187,14 @@ def index():
     return redirect(url_for("list_customers"))
 
 @app.route("/customers")
+@cached_page("customers")
 def list_customers():
     session = SessionLocal()
     try:
         customers = session.query(Customer).all()
         return render_template("customers.html", customers=customers)
     except Exception as e:
-        with open("debug.log", "a") as f:
-            import traceback
-            traceback.print_exc(file=f)
+        logger.exception("list_customers failed")
         return str(e), 500
     finally:
         session.close()
@@ -158,9 +204,8 @@ def new_customer():
     session = SessionLocal()
     try:
         if request.method == "POST":
-            # Debug logging
-            sys.stderr.write(f"DEBUG: Form Data Received: {request.form}\n")
-            
+            logger.debug("new_customer form received", extra={"fields": sorted(request.form)})
+
             name = request.form["name"]
             email = request.form["email"]
             property_address = request.form["property_address"]
@@ -206,15 +251,14 @@ def new_customer():
             )
             session.add(new_customer)
             session.commit()
+            invalidate_customers()
             return redirect(url_for('list_customers'))
         
         # GET request
-        fee_types = session.query(FeeType).all()
+        fee_types = get_fee_types()
         return render_template("new_customer.html", fee_types=fee_types)
     except Exception as e:
-        sys.stderr.write(f"DEBUG: Exception: {e}\n")
-        import traceback
-        traceback.print_exc()
+        logger.exception("new_customer failed")
         return str(e), 500
     finally:
         session.close()
@@ -231,7 +275,6 @@ def edit_customer(customer_id):
     session = SessionLocal()
     try:
         customer = session.query(Customer).get(customer_id)
-        fee_types = session.query(FeeType).all()
         if not customer:
             return redirect(url_for("list_customers"))
 
@@ -263,9 +306,10 @@ def edit_customer(customer_id):
             customer.additional_fee_amount = float(additional_fee_amount_str) if additional_fee_amount_str else None
             
             session.commit()
+            invalidate_customers()
             return redirect(url_for("list_customers"))
         
-        
+        fee_types = get_fee_types()
         return render_template("edit_customer.html", customer=customer, fee_types=fee_types)
     finally:
         session.close()
@@ -309,6 +353,37 @@ def delete_property(customer_id, property_id):
     finally:
         session.close()
 
+@app.route("/customers/<int:customer_id>/add-fee", methods=["POST"])
+def add_customer_fee(customer_id):
+    session = SessionLocal()
+    try:
+        fee_type = request.form.get("fee_type", "").strip()
+        amount_str = request.form.get("amount", "")
+        if fee_type and amount_str:
+            last = session.query(func.max(CustomerFee.position)).filter(CustomerFee.customer_id == customer_id).scalar()
+            session.add(CustomerFee(
+                customer_id=customer_id,
+                fee_type=fee_type,
+                amount=float(amount_str),
+                position=0 if last is None else last + 1
+            ))
+            session.commit()
+        return redirect(url_for("edit_customer", customer_id=customer_id))
+    finally:
+        session.close()
+
+@app.route("/customers/<int:customer_id>/delete-fee/<int:fee_id>", methods=["POST"])
+def delete_customer_fee(customer_id, fee_id):
+    session = SessionLocal()
+    try:
+        fee = session.query(CustomerFee).get(fee_id)
+        if fee and fee.customer_id == customer_id:
+            session.delete(fee)
+            session.commit()
+        return redirect(url_for("edit_customer", customer_id=customer_id))
+    finally:
+        session.close()
+
 @app.route("/customers/<int:customer_id>/delete", methods=["POST"])
 def delete_customer(customer_id):
     session = SessionLocal()
@@ -318,10 +393,54 @@ def delete_customer(customer_id):
             # Delete the customer. Invoices will remain (orphaned) but visible in the list.
             session.delete(customer)
             session.commit()
+            invalidate_customers()
         return redirect(url_for("list_customers"))
     finally:
         session.close()
 
+@app.route("/customers/export.<fmt>")
+def export_customers(fmt):
+    from bulk_customers import export_customers_csv, export_customers_json
+    if fmt == "csv":
+        chunks, mimetype = export_customers_csv(), "text/csv"
+    elif fmt == "json":
+        chunks, mimetype = export_customers_json(), "application/json"
+    else:
+        return f"Unknown export format: {fmt}", 404
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=customers.{fmt}"}
+    )
+
+@app.route("/customers/import", methods=["POST"])
+def import_customers_route():
+    from bulk_customers import import_customers, iter_rows
+    import io
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Choose a CSV or JSON file to import.", "error")
+        return redirect(url_for("list_customers"))
+
+    fmt = "json" if upload.filename.lower().endswith((".json", ".jsonl")) else "csv"
+    stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    try:
+        summary = import_customers(iter_rows(stream, fmt))
+    except Exception as e:
+        if request.args.get("format") == "json":
+            return jsonify({"error": str(e)}), 400
+        flash(f"Import failed: {e}", "error")
+        return redirect(url_for("list_customers"))
+
+    if request.args.get("format") == "json":
+        return jsonify(summary)
+    message = f"Imported customers: {summary['inserted']} added, {summary['updated']} updated."
+    if summary["errors"]:
+        first = summary["errors"][0]
+        message += f" Skipped {len(summary['errors'])} invalid rows (row {first['row']}: {first['error']})."
+    flash(message, "error" if summary["errors"] else "success")
+    return redirect(url_for("list_customers"))
+
 @app.route("/settings/fee-types", methods=["GET", "POST"])
 def manage_fee_types():
     session = SessionLocal()
@@ -335,9 +454,10 @@ def manage_fee_types():
                     session.commit()
                 except Exception:
                     session.rollback()
+                invalidate_fee_types()
             return redirect(url_for("manage_fee_types"))
         
-        fee_types = session.query(FeeType).all()
+        fee_types = get_fee_types()
         return render_template("fee_types.html", fee_types=fee_types)
     finally:
         session.close()
@@ -350,29 +470,242 @@ def delete_fee_type(fee_type_id):
         if ft:
             session.delete(ft)
             session.commit()
+            invalidate_fee_types()
         return redirect(url_for("manage_fee_types"))
     finally:
         session.close()
 
 @app.route("/invoices")
+@cached_page("invoices")
 def list_invoices():
+    def rows():
+        # The session lives as long as the response stream; rows are read from a
+        # server-side cursor in batches so memory doesn't grow with the invoice count
+        session = SessionLocal()
+        try:
+            # Sort by Customer Name then Invoice Date
+            # Use OUTER JOIN so we still see invoices even if the customer is deleted
+            query = session.query(
+                Invoice.id, Invoice.invoice_date, Invoice.period_label, Invoice.amount,
+                Invoice.status, Invoice.paid_date, Invoice.file_path, Customer.name.label("customer_name")
+            ).outerjoin(Customer, Invoice.customer_id == Customer.id).order_by(
+                Customer.name.asc(), Invoice.invoice_date.desc()
+            ).execution_options(stream_results=True, yield_per=500)
+            yield from query
+        finally:
+            session.close()
+
+    return Response(buffered(stream_template("invoices.html", invoices=rows())), mimetype="text/html")
+
+@app.route("/invoices/<int:invoice_id>/email")
+def invoice_email(invoice_id):
     session = SessionLocal()
     try:
-        # Sort by Customer Name then Invoice Date
-        # Use OUTER JOIN so we still see invoices even if the customer is deleted
-        invoices = session.query(Invoice).outerjoin(Customer, Invoice.customer_id == Customer.id).order_by(Customer.name.asc(), Invoice.invoice_date.desc()).all()
-        
-        # For simplicity, join customers manually (or use the join above)
-        customers_map = {c.id: c for c in session.query(Customer).all()}
-        return render_template("invoices.html", invoices=invoices, customers=customers_map)
+        row = session.query(Invoice.email_subject, Invoice.email_body).filter(Invoice.id == invoice_id).first()
+        if not row:
+            return jsonify({"error": "Invoice not found"}), 404
+        return jsonify({"subject": row.email_subject, "body": row.email_body})
+    finally:
+        session.close()
+
+@app.route("/search")
+def search_records():
+    from search import search
+    query = request.args.get("q", "").strip()
+    session = SessionLocal()
+    try:
+        results = search(session, query) if query else []
+        if request.args.get("format") == "json":
+            return jsonify(results)
+        return render_template("search.html", query=query, results=results)
+    finally:
+        session.close()
+
+@app.route("/reports")
+@cached_page("reports", daily=True)
+def reports_dashboard():
+    session = SessionLocal()
+    try:
+        return render_template(
+            "reports.html",
+            aging=ar_aging_report(session),
+            revenue=revenue_report(session, by="period"),
+            revenue_by_fee=revenue_report(session, by="fee_type"),
+            outstanding=outstanding_by_customer(session),
+        )
+    finally:
+        session.close()
+
+@app.route("/reports/<name>")
+def report_json(name):
+    session = SessionLocal()
+    try:
+        if name == "ar-aging":
+            as_of = request.args.get("as_of")
+            return jsonify(ar_aging_report(session, date.fromisoformat(as_of) if as_of else None))
+        if name == "revenue":
+            return jsonify(revenue_report(session, by=request.args.get("by", "period")))
+        if name == "outstanding":
+            return jsonify(outstanding_by_customer(session))
+        return jsonify({"error": f"Unknown report: {name}"}), 404
+    finally:
+        session.close()
+
+@app.route("/reports/rebuild", methods=["POST"])
+def rebuild_reports():
+    session = SessionLocal()
+    try:
+        rebuild_rollups(session)
+        session.commit()
+        return redirect(url_for("reports_dashboard"))
+    except Exception as e:
+        session.rollback()
+        return f"Error rebuilding reports: {e}", 500
     finally:
         session.close()
 
+def _run_invoice_batch(operation, on_commit=None):
+    """Run a batch operation in one transaction and return its per-item results as JSON."""
+    from invoice_batch import BatchError
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+
+    session = SessionLocal()
+    try:
+        results = operation(session, payload)
+        session.commit()
+        if on_commit:
+            on_commit(results)
+        return jsonify({"results": results})
+    except BatchError as e:
+        session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        session.rollback()
+        return jsonify({"error": f"Batch failed, nothing was changed: {e}"}), 500
+    finally:
+        session.close()
+
+@app.route("/api/invoices/generate", methods=["POST"])
+def api_generate_invoices():
+    from invoice_batch import generate_invoices
+    import prerender
+    return _run_invoice_batch(
+        lambda session, payload: generate_invoices(session, payload)[0],
+        on_commit=lambda results: prerender.schedule(r["invoice_id"] for r in results if r["status"] == "created"),
+    )
+
+@app.route("/api/invoices/mark-paid", methods=["POST"])
+def api_mark_invoices_paid():
+    from invoice_batch import mark_invoices_paid
+    return _run_invoice_batch(mark_invoices_paid)
+
+@app.route("/api/invoices/delete", methods=["POST"])
+def api_delete_invoices():
+    from invoice_batch import delete_invoices
+    return _run_invoice_batch(delete_invoices)
+
+@app.route("/api/invoices/email", methods=["POST"])
+def api_queue_invoice_emails():
+    from email_outbox import queue_invoices
+    return _run_invoice_batch(queue_invoices)
+
+def _already_running(e):
+    running = find_running(e.name)
+    return jsonify({"status": "already_running", "job": e.status, "run": _run_json(running) if running else None}), 409
+
+def _run_exclusive(name, job):
+    """Run job(lease) under the named job lease, or answer 409 with the running job's progress."""
+    from job_lease import job_lease
+    try:
+        with job_lease(name) as lease:
+            return job(lease)
+    except JobAlreadyRunning as e:
+        return _already_running(e)
+
+def _billing_job(run):
+    return bill_due_customers(events=run.emit)
+
+def _seeding_job(run):
+    from seed_from_templates import seed_customers
+    try:
+        return seed_customers(events=run.emit)
+    finally:
+        invalidate_customers()
+        invalidate_fee_types()
+
+def _email_job(run):
+    from email_outbox import deliver_outbox
+    return deliver_outbox(events=run.emit)
+
+JOBS = {"billing": _billing_job, "seeding": _seeding_job, "email": _email_job}
+# Vercel freezes the function once the response is sent, which would strand a background
+# job half done with its lease held, so there /jobs/<name>/start runs it inside the request
+JOBS_IN_BACKGROUND = not os.getenv("VERCEL")
+
+def _run_json(run):
+    return dict(
+        run.describe(),
+        events_url=url_for("job_event_stream", run_id=run.id),
+        stop_url=url_for("stop_job_run", run_id=run.id),
+    )
+
 @app.route("/run-today")
 def run_today():
-    bill_due_customers()
+    # Runs to completion inside the request, as the cron caller expects
+    try:
+        run = start_job("billing", _billing_job, background=False)
+    except JobAlreadyRunning as e:
+        return _already_running(e)
+    if run.status == "failed":
+        return f"Error running batch: {run.events[-1][2].get('error')}", 500
     return redirect(url_for("list_invoices"))
 
+@app.route("/jobs")
+def jobs_dashboard():
+    from job_lease import get_job_status
+    statuses = {name: get_job_status(name) for name in JOBS}
+    running = {name: find_running(name) for name in JOBS}
+    return render_template("jobs.html", statuses=statuses, running=running)
+
+@app.route("/jobs/<name>/start", methods=["POST"])
+def start_job_run(name):
+    if name not in JOBS:
+        return jsonify({"error": f"Unknown job: {name}"}), 404
+    try:
+        run = start_job(name, JOBS[name], background=JOBS_IN_BACKGROUND)
+    except JobAlreadyRunning as e:
+        return _already_running(e)
+    if JOBS_IN_BACKGROUND:
+        return jsonify(_run_json(run)), 202
+    # Finished already; another instance may serve the events URL, so send the log along
+    return jsonify(dict(_run_json(run), log=[describe_event(kind, data) for _, kind, data in run.events]))
+
+@app.route("/jobs/runs/<run_id>/events")
+def job_event_stream(run_id):
+    """Server-sent events for a run: everything so far, then live updates until it ends."""
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Unknown run"}), 404
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.args.get("after") or 0)
+    except ValueError:
+        after = 0
+    return Response(
+        (sse_format(event) for event in run.stream(after)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/jobs/runs/<run_id>/stop", methods=["POST"])
+def stop_job_run(run_id):
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Unknown run"}), 404
+    run.cancel()
+    return jsonify(_run_json(run)), 202
+
 @app.route("/invoices/<int:invoice_id>/download")
 def download_invoice(invoice_id):
     session = SessionLocal()
@@ -393,37 +726,69 @@ def download_invoice(invoice_id):
     finally:
         session.close()
 
+@app.route("/archive/<int:invoice_id>/download")
+def download_archived_invoice(invoice_id):
+    from models import ArchivedInvoice
+    from archive import get_archived_document
+    import io
+    session = SessionLocal()
+    try:
+        archived = session.query(ArchivedInvoice).get(invoice_id)
+        if not archived:
+            return "Invoice not found", 404
+
+        filename, data = get_archived_document(archived)
+        return send_file(
+            io.BytesIO(data),
+            as_attachment=True,
+            download_name=filename,
+            mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+    except Exception as e:
+        return f"Error generating invoice: {e}", 500
+    finally:
+        session.close()
+
+@app.route("/archive/run", methods=["POST"])
+def run_archive():
+    from archive import archive_paid_invoices
+    try:
+        days = request.form.get("days")
+        count = archive_paid_invoices(int(days) if days else None)
+        return f"Archived {count} invoices.", 200
+    except Exception as e:
+        return f"Error archiving invoices: {e}", 500
+
 @app.route("/seed-data")
 def run_seeding():
+    from markupsafe import escape
     try:
-        from seed_from_templates import seed_customers
-        # Capture output to return to user
-        import io
-        from contextlib import redirect_stdout
-        
-        f = io.StringIO()
-        with redirect_stdout(f):
-            seed_customers()
-        
-        output = f.getvalue()
-        return f"<pre>{output}</pre>"
-    except Exception as e:
-        return f"Error seeding data: {e}", 500
+        run = start_job("seeding", _seeding_job, background=False)
+    except JobAlreadyRunning as e:
+        return _already_running(e)
+    if run.status == "failed":
+        return f"Error seeding data: {escape(run.events[-1][2].get('error'))}", 500
+    output = "\n".join(describe_event(kind, data) for _, kind, data in run.events if kind != "finished")
+    return f"<pre>{escape(output)}</pre>"
 
 @app.route('/clear-invoices')
 def clear_invoices_route():
-    from models import Invoice
-    session = SessionLocal()
-    try:
-        count = session.query(Invoice).count()
-        session.query(Invoice).delete()
-        session.commit()
-        return f'Cleared {count} invoices from the database!', 200
-    except Exception as e:
-        session.rollback()
-        return f'Error: {str(e)}', 500
-    finally:
-        session.close()
+    def job(lease):
+        session = SessionLocal()
+        try:
+            count = session.query(Invoice).count()
+            session.query(InvoiceLine).filter(InvoiceLine.invoice_id.in_(session.query(Invoice.id))).delete(synchronize_session=False)
+            session.query(Invoice).delete()
+            rebuild_rollups(session)
+            session.commit()
+            return f'Cleared {count} invoices from the database!', 200
+        except Exception as e:
+            session.rollback()
+            return f'Error: {str(e)}', 500
+        finally:
+            session.close()
+    # Billing writes invoices, so clearing waits for it rather than racing it
+    return _run_exclusive("billing", job)
 
 @app.route('/migrate-db')
 def run_migration():
@@ -447,7 +812,8 @@ def run_migration():
                 ("additional_fee_amount", "FLOAT"),
                 ("additional_fee_amount", "FLOAT"),
                 ("status", "VARCHAR"),
-                ("paid_date", "DATE")
+                ("paid_date", "DATE"),
+                ("fee_type", "VARCHAR")
             ]
             
             results = []
@@ -495,11 +861,23 @@ def run_migration():
                 results.append("Added properties.fee_amount")
             except Exception as e:
                 results.append(f"Skipped properties.fee_amount: {str(e)}")
+
+            # Index used by the AR reports and unpaid-invoice lookups
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_invoices_status_date ON invoices (status, invoice_date)"))
+            results.append("Ensured ix_invoices_status_date index exists")
             
             # Commit all changes
             conn.commit()
-            
-            return f"Migration results:<br>" + "<br>".join(results)
+
+        # Needs the columns added above
+        from models import backfill_rollups, migrate_autoincrement
+        from search import ensure_search_index
+        for name in migrate_autoincrement():
+            results.append(f"Rebuilt {name} so ids are never reused")
+        ensure_search_index(engine)  # a rebuild drops the table's search triggers
+        if backfill_rollups():
+            results.append("Backfilled report rollups")
+        return f"Migration results:<br>" + "<br>".join(results)
     except Exception as e:
         return f"Migration failed: {e}", 500
 
@@ -509,6 +887,7 @@ def delete_invoice(invoice_id):
     try:
         invoice = session.query(Invoice).get(invoice_id)
         if invoice:
+            apply_invoice(session, invoice, sign=-1)
             session.delete(invoice)
             session.commit()
             flash("Invoice deleted successfully.", "success")
@@ -528,6 +907,7 @@ def toggle_invoice_status(invoice_id):
         invoice = session.query(Invoice).get(invoice_id)
         if invoice:
             new_status = "Paid" if invoice.status != "Paid" else "Unpaid"
+            apply_invoice(session, invoice, sign=-1)
             invoice.status = new_status
             
             if new_status == "Paid":
@@ -538,7 +918,8 @@ def toggle_invoice_status(invoice_id):
                     invoice.paid_date = date.today()
             else:
                 invoice.paid_date = None
-                
+
+            apply_invoice(session, invoice)
             session.commit()
             flash(f"Invoice marked as {new_status}.", "success")
         else:
@@ -550,18 +931,27 @@ def toggle_invoice_status(invoice_id):
         session.close()
     return redirect(url_for("list_invoices"))
 
-# Initialize database when module is loaded (for gunicorn compatibility)
-init_db()
+# Create tables lazily on the first request instead of at import time, so a cold
+# start can serve quickly. Deployments that create the schema out of band (e.g.
+# via /migrate-db) can skip the check entirely with INIT_DB_ON_REQUEST=0.
+INIT_DB_ON_REQUEST = os.getenv("INIT_DB_ON_REQUEST", "1") != "0"
+_db_ready = not INIT_DB_ON_REQUEST
+_db_lock = threading.Lock()
+
+@app.before_request
+def ensure_db():
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if not _db_ready:
+            init_db()
+            _db_ready = True
+
+# Self-hosted only (SCHEDULER_ENABLED=1); on Vercel the cron in vercel.json hits /run-today
+scheduler.init_app(app)
 
 if __name__ == "__main__":
     print(app.url_map)
 
-    # Only run scheduler if NOT in Vercel (check for VERCEL env var)
-    # In Vercel, we use Vercel Cron to hit /run-today
-    # if not os.environ.get("VERCEL"):
-    #     scheduler = BackgroundScheduler()
-    #     # Run once every day at 6am, for example
-    #     scheduler.add_job(bill_due_customers, "cron", hour=6, minute=0)
-    #     scheduler.start()
-
     app.run(debug=True)
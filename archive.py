@@ -0,0 +1,108 @@
+import argparse
+import logging
+import os
+from datetime import date, timedelta
+from sqlalchemy import select, insert, update, delete, literal, bindparam
+from models import SessionLocal, Invoice, ArchivedInvoice, InvoiceLine, ArchivedInvoiceLine
+
+# Paid invoices whose invoice_date is older than this are moved to invoices_archive
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = 200
+
+SHARED_COLUMNS = ["id"] + [name for name in Invoice.__table__.columns.keys() if name != "id"]
+LINE_COLUMNS = InvoiceLine.__table__.columns.keys()
+
+logger = logging.getLogger(__name__)
+
+
+def _render_documents(session, invoices):
+    """Render each invoice's docx so the archive keeps the artifact even if the customer changes later."""
+    from invoice_generator import generate_invoice_buffer, load_property_fees, NO_PROPERTY_FEES
+
+    property_fees = load_property_fees(session, {invoice.customer_id for invoice in invoices})
+    documents = {}
+    for invoice in invoices:
+        try:
+            _, buffer = generate_invoice_buffer(invoice, property_fees.get(invoice.customer_id, NO_PROPERTY_FEES))
+            documents[invoice.id] = buffer.getvalue()
+        except Exception as e:
+            # Customer deleted or template problem: archive the row anyway, download will report it
+            logger.warning("could not render invoice for archive", extra={"invoice_id": invoice.id, "error": str(e)})
+            documents[invoice.id] = None
+    return documents
+
+
+def archive_paid_invoices(max_age_days=None, batch_size=ARCHIVE_BATCH_SIZE, render=True):
+    """
+    Move paid invoices older than max_age_days into invoices_archive.
+    Each batch and its lines are copied with INSERT ... SELECT and removed with DELETEs in a single transaction.
+    Returns the number of invoices archived.
+    """
+    max_age_days = ARCHIVE_AFTER_DAYS if max_age_days is None else max_age_days
+    cutoff = date.today() - timedelta(days=max_age_days)
+    table = Invoice.__table__
+    archived = 0
+
+    while True:
+        session = SessionLocal()
+        try:
+            batch = session.query(Invoice).filter(
+                Invoice.status == "Paid",
+                Invoice.invoice_date < cutoff
+            ).order_by(Invoice.id).limit(batch_size).all()
+            if not batch:
+                break
+            ids = [inv.id for inv in batch]
+            documents = _render_documents(session, batch) if render else {}
+
+            session.execute(insert(ArchivedInvoice).from_select(
+                SHARED_COLUMNS + ["archived_at"],
+                select(*[table.c[name] for name in SHARED_COLUMNS], literal(date.today())).where(table.c.id.in_(ids))
+            ))
+            stored = [{"b_id": i, "document": doc} for i, doc in documents.items() if doc is not None]
+            if stored:
+                archive_table = ArchivedInvoice.__table__
+                session.execute(
+                    update(archive_table).where(archive_table.c.id == bindparam("b_id")).values(document=bindparam("document")),
+                    stored
+                )
+            # Lines move too: a new invoice may get an archived one's id and must not inherit its lines
+            line_table = InvoiceLine.__table__
+            session.execute(insert(ArchivedInvoiceLine).from_select(
+                LINE_COLUMNS, select(*[line_table.c[name] for name in LINE_COLUMNS]).where(line_table.c.invoice_id.in_(ids))
+            ))
+            session.execute(delete(InvoiceLine).where(InvoiceLine.invoice_id.in_(ids)))
+            session.execute(delete(Invoice).where(Invoice.id.in_(ids)))
+            session.commit()
+            archived += len(ids)
+            logger.info("archived invoices", extra={"archived": len(ids), "total": archived})
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    return archived
+
+
+def get_archived_document(archived):
+    """Return (filename, bytes) for an archived invoice, re-rendering if no artifact was stored."""
+    if archived.document is not None:
+        return archived.file_path, archived.document
+
+    from invoice_generator import generate_invoice_buffer
+    filename, buffer = generate_invoice_buffer(archived)
+    return filename, buffer.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old paid invoices into invoices_archive.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive paid invoices older than this many days")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--no-render", action="store_true", help="skip storing rendered docx files")
+    args = parser.parse_args()
+
+    from models import init_db
+    init_db()
+    count = archive_paid_invoices(args.days, args.batch_size, render=not args.no_render)
+    print(f"Done! Archived {count} invoices.")
@@ -0,0 +1,78 @@
+"""
+Compare python-docx with the streaming extractor in docx_text.py on the template corpus:
+time to read every paragraph and table cell, and peak memory for the largest file.
+
+    python bench_docx_text.py --repeat 5 --min-speedup 5
+
+Exits non-zero if the extractor's output differs from python-docx's or if it is
+less than --min-speedup times faster.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from docx import Document
+from docx_text import iter_paragraphs
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "invoice_templates")
+
+
+def with_python_docx(path):
+    doc = Document(path)
+    texts = [p.text for p in doc.paragraphs]
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                texts.extend(p.text for p in cell.paragraphs)
+    return texts
+
+
+def with_docx_text(path):
+    body, cells = [], []
+    for p in iter_paragraphs(path):
+        (body if p.table is None else cells).append(p.text)
+    return body + cells
+
+
+def timed(extract, paths, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            extract(path)
+    return time.perf_counter() - start
+
+
+def peak_kib(extract, path):
+    tracemalloc.start()
+    extract(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=TEMPLATE_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=0)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.dir, f) for f in os.listdir(args.dir)
+        if f.lower().endswith(".docx") and not f.startswith("~")
+    )
+    mismatched = [os.path.basename(p) for p in paths if with_python_docx(p) != with_docx_text(p)]
+
+    baseline = timed(with_python_docx, paths, args.repeat)
+    streaming = timed(with_docx_text, paths, args.repeat)
+    largest = max(paths, key=os.path.getsize)
+    count = len(paths) * args.repeat
+    print(f"python-docx: {baseline * 1000 / count:.2f} ms/file, peak {peak_kib(with_python_docx, largest):,.0f} KiB")
+    print(f"  docx_text: {streaming * 1000 / count:.2f} ms/file, peak {peak_kib(with_docx_text, largest):,.0f} KiB")
+    print(f"    speedup: {baseline / streaming:.1f}x over {len(paths)} files")
+    for name in mismatched:
+        print(f"   mismatch: {name}")
+
+    if mismatched or baseline / streaming < args.min_speedup:
+        sys.exit(1)
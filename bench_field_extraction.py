@@ -0,0 +1,99 @@
+"""
+Benchmark customer field extraction on the template corpus, repeated to simulate a
+large batch of legacy invoices.
+
+    python bench_field_extraction.py --copies 200 --workers 4 --filler 50
+
+Compares the old per-paragraph rules with the single-pass extractor on the same
+paragraph texts (so only extraction is timed), then times end-to-end parsing
+(reading the .docx plus extraction) through seed_from_templates._parse_all.
+--filler pads each document with paragraphs that match no rule, like the terms
+and notes of longer legacy invoices: the old rules cost grows with every
+paragraph, the extractor's mostly with the paragraphs that hold a field.
+"""
+import argparse
+import os
+import re
+import time
+from docx_text import iter_paragraphs
+from field_extraction import customer_extractor
+from seed_from_templates import TEMPLATE_DIR, _parse_all
+
+FIELDS = ("name", "address", "email", "rate", "cadence")
+FILLER = ["Payment is due upon receipt. Make checks payable to the company.", "Home Rental & Property Maintenance", ""]
+
+
+def _legacy_money(text):
+    matches = re.findall(r'\$\s?([0-9,]+(?:\.[0-9]{2})?)', text)
+    return float(matches[-1].replace(',', '')) if matches else 0.0
+
+
+def legacy_fields(texts):
+    """The rules seed_customers applied before the extractor, one paragraph and one check at a time."""
+    name = address = email = ""
+    rate, cadence = 0.0, "monthly"
+    for text in texts:
+        if not text:
+            continue
+        if text.upper().startswith("TO:"):
+            parts = text.split(":", 1)
+            if len(parts) > 1 and parts[1].strip():
+                name = parts[1].strip()
+        if text.upper().startswith("FOR:"):
+            parts = text.split(":", 1)
+            if len(parts) > 1 and parts[1].strip():
+                address = parts[1].strip()
+        for match in re.findall(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text):
+            if "linda" not in match.lower() and "stonegate" not in match.lower() and not email:
+                email = match
+        if "management" in text.lower() or "quarter" in text.lower():
+            line_rate = _legacy_money(text)
+            if line_rate > 0:
+                rate = line_rate
+            if "quarter" in text.lower():
+                cadence = "quarterly"
+            elif "year" in text.lower() or "annual" in text.lower():
+                cadence = "yearly"
+    if rate == 0:
+        for text in texts:
+            if "Total due" in text:
+                rate = _legacy_money(text)
+                break
+    return {"name": name, "address": address, "email": email, "rate": rate, "cadence": cadence}
+
+
+def timed(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>28}: {elapsed:.3f}s = {count / elapsed:,.0f} docs/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=200, help="times to repeat the corpus")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--filler", type=int, default=0, help="extra paragraphs (x3) per document")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(TEMPLATE_DIR, f) for f in os.listdir(TEMPLATE_DIR)
+        if f.lower().endswith(".docx") and not f.startswith("~")
+    )
+    documents = [[p.text.strip() for p in iter_paragraphs(path) if p.table is None] for path in paths]
+
+    for path, texts in zip(paths, documents):
+        old = legacy_fields(texts)
+        new = {name: field.value for name, field in customer_extractor.extract(texts).items()}
+        changed = {k: (old[k], new[k]) for k in FIELDS if old[k] != new[k]}
+        if changed:
+            print(f"differs from legacy rules: {os.path.basename(path)} {changed}")
+
+    batch = [texts + FILLER * args.filler for texts in documents] * args.copies
+    legacy = timed("legacy rules", lambda: [legacy_fields(t) for t in batch], len(batch))
+    engine = timed("single-pass extractor", lambda: [customer_extractor.extract(t) for t in batch], len(batch))
+    print(f"{'speedup':>28}: {legacy / engine:.1f}x")
+
+    files = paths * args.copies
+    timed(f"parse_template x{args.workers} workers", lambda: list(_parse_all(files, args.workers)), len(files))
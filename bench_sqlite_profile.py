@@ -0,0 +1,61 @@
+"""
+Compare SQLite write throughput with SQLite's defaults vs the production profile in models.py.
+
+    python bench_sqlite_profile.py --workers 4 --writes 500
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+from models import configure_sqlite_engine
+
+
+def _worker(url, profile, writes, result_queue):
+    engine = configure_sqlite_engine(create_engine(url), profile=profile)
+    locked = 0
+    for n in range(writes):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO events (payload) VALUES (:p)"), {"p": "x" * 200})
+                conn.execute(text("SELECT count(*) FROM events WHERE id > :n"), {"n": n}).scalar()
+        except Exception as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+    engine.dispose()
+    result_queue.put(locked)
+
+
+def run(profile, workers, writes):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = configure_sqlite_engine(create_engine(url), profile=profile)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE events (id INTEGER PRIMARY KEY, payload TEXT)"))
+        engine.dispose()
+
+        ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+        results = ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(url, profile, writes, results)) for _ in range(workers)]
+        start = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+        locked = sum(results.get() for _ in procs)
+
+    total = workers * writes
+    print(f"{profile:>10}: {total} commits in {elapsed:.2f}s = {total / elapsed:,.0f} commits/s, {locked} 'database is locked' errors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=500)
+    args = parser.parse_args()
+
+    for profile in ("default", "production"):
+        run(profile, args.workers, args.writes)
@@ -0,0 +1,378 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date
+from sqlalchemy import insert, update, delete
+from models import SessionLocal, Customer, CustomerFee, Property
+
+CUSTOMER_FIELDS = [
+    "id", "name", "email", "property_address", "property_city", "property_state", "property_zip",
+    "rate", "cadence", "fee_type", "fee_2_type", "fee_2_rate", "fee_3_type", "fee_3_rate",
+    "additional_fee_desc", "additional_fee_amount", "next_bill_date",
+]
+PROPERTY_FIELDS = ["address", "city", "state", "zip_code", "fee_amount", "is_primary"]
+FEE_FIELDS = ["fee_type", "amount"]  # list order is the order on the invoice
+REQUIRED_FIELDS = ["name", "property_address", "rate", "cadence"]
+FLOAT_FIELDS = {"rate", "fee_2_rate", "fee_3_rate", "additional_fee_amount"}
+CADENCES = {"monthly", "quarterly", "yearly"}
+DEFAULT_BATCH_SIZE = 1000
+
+
+class RowError(ValueError):
+    pass
+
+
+# --- Reading -----------------------------------------------------------------
+
+def iter_csv_rows(stream):
+    """Yield dicts from a CSV text stream. `properties` and `fees` columns may hold JSON lists (parsed by validate_row)."""
+    yield from csv.DictReader(stream)
+
+
+def iter_json_rows(stream, chunk_size=64 * 1024):
+    """
+    Yield objects from a JSON array or JSON Lines text stream without loading the whole file.
+    Objects are decoded one at a time from a rolling buffer.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    in_array = None
+
+    while True:
+        buffer = buffer.lstrip()
+        if in_array is None and buffer:
+            in_array = buffer.startswith("[")
+            if in_array:
+                buffer = buffer[1:]
+            continue
+        if in_array and buffer[:1] in (",", "]"):
+            if buffer[0] == "]":
+                return
+            buffer = buffer[1:]
+            continue
+        if buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Object is split across chunks; read more unless there is nothing left
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                yield obj
+                continue
+        if eof:
+            return
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+
+def _json_list(row, field):
+    """The row's list under `field`; None when absent or an empty CSV cell, which leaves the stored ones alone."""
+    value = row.get(field)
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip() else None
+        except json.JSONDecodeError as e:
+            raise RowError(f"{field} is not valid JSON: {e}")
+    if value is not None and not isinstance(value, list):
+        raise RowError(f"{field} must be a list")
+    return value
+
+
+def validate_row(row):
+    """Return a clean customer dict (plus `properties` and `fees` lists) or raise RowError."""
+    clean = {}
+    for field in CUSTOMER_FIELDS:
+        value = row.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        clean[field] = value if value not in ("", None) else None
+
+    missing = [f for f in REQUIRED_FIELDS if clean[f] is None]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+
+    for field in FLOAT_FIELDS:
+        if clean[field] is not None:
+            try:
+                clean[field] = float(clean[field])
+            except (TypeError, ValueError):
+                raise RowError(f"{field} is not a number: {clean[field]!r}")
+
+    clean["cadence"] = clean["cadence"].lower()
+    if clean["cadence"] not in CADENCES:
+        raise RowError(f"unknown cadence {clean['cadence']!r}")
+
+    if clean["id"] is not None:
+        try:
+            clean["id"] = int(clean["id"])
+        except (TypeError, ValueError):
+            raise RowError(f"id is not an integer: {clean['id']!r}")
+
+    if clean["next_bill_date"] is not None and not isinstance(clean["next_bill_date"], date):
+        try:
+            clean["next_bill_date"] = date.fromisoformat(str(clean["next_bill_date"]))
+        except ValueError:
+            raise RowError(f"next_bill_date is not YYYY-MM-DD: {clean['next_bill_date']!r}")
+
+    clean["email"] = clean["email"] or "change@me.com"
+    clean["fee_type"] = clean["fee_type"] or "Management Fee"
+
+    properties = _json_list(row, "properties")
+    if properties is not None:
+        clean_props = []
+        for prop in properties:
+            if not isinstance(prop, dict) or not prop.get("address"):
+                raise RowError("property without address")
+            fee = prop.get("fee_amount")
+            if fee not in (None, ""):
+                try:
+                    fee = float(fee)
+                except (TypeError, ValueError):
+                    raise RowError(f"property fee_amount is not a number: {fee!r}")
+            clean_props.append({
+                "address": prop["address"],
+                "city": prop.get("city"),
+                "state": prop.get("state"),
+                "zip_code": prop.get("zip_code"),
+                "fee_amount": fee if fee not in (None, "") else None,
+                "is_primary": bool(prop.get("is_primary", False)),
+            })
+        properties = clean_props
+    clean["properties"] = properties
+
+    fees = _json_list(row, "fees")
+    if fees is not None:
+        clean_fees = []
+        for position, fee in enumerate(fees):
+            if not isinstance(fee, dict) or not str(fee.get("fee_type") or "").strip():
+                raise RowError("fee without fee_type")
+            try:
+                amount = float(fee.get("amount"))
+            except (TypeError, ValueError):
+                raise RowError(f"fee amount is not a number: {fee.get('amount')!r}")
+            clean_fees.append({"fee_type": str(fee["fee_type"]).strip(), "amount": amount, "position": position})
+        fees = clean_fees
+    clean["fees"] = fees
+    return clean
+
+
+# --- Importing ---------------------------------------------------------------
+
+def _customer_values(row, with_id):
+    data = {f: row[f] for f in CUSTOMER_FIELDS if f != "id"}
+    if data["next_bill_date"] is None:
+        # Never reset an existing customer's billing schedule from an import without a date
+        del data["next_bill_date"]
+    if with_id:
+        data["id"] = row["id"]
+    return data
+
+
+def _upsert_batch(session, batch):
+    """Insert or update one batch of validated rows. Rows match existing customers by id, then by name."""
+    by_key = {}
+    for row in batch:
+        # Later rows for the same customer win, like sequential upserts would
+        by_key[row["id"] if row["id"] is not None else row["name"]] = row
+    rows = list(by_key.values())
+
+    ids = [r["id"] for r in rows if r["id"] is not None]
+    existing_ids = set()
+    if ids:
+        existing_ids = {cid for (cid,) in session.query(Customer.id).filter(Customer.id.in_(ids))}
+
+    # Ids only identify existing customers; unknown ids fall back to matching by name
+    names = [r["name"] for r in rows if r["id"] not in existing_ids]
+    existing_by_name = {}
+    if names:
+        for cid, name in session.query(Customer.id, Customer.name).filter(Customer.name.in_(names)).order_by(Customer.id):
+            existing_by_name.setdefault(name, cid)
+
+    new_rows, updates = [], []
+    for row in rows:
+        if row["id"] in existing_ids:
+            updates.append(row)
+        elif row["name"] in existing_by_name:
+            row["id"] = existing_by_name[row["name"]]
+            updates.append(row)
+        else:
+            row["next_bill_date"] = row["next_bill_date"] or date.today()
+            new_rows.append(row)
+
+    if new_rows:
+        # RETURNING with sort_by_parameter_order maps generated ids back onto the rows
+        result = session.execute(
+            insert(Customer).returning(Customer.id, sort_by_parameter_order=True),
+            [_customer_values(row, False) for row in new_rows]
+        )
+        for row, (cid,) in zip(new_rows, result):
+            row["id"] = cid
+    if updates:
+        session.execute(update(Customer), [_customer_values(row, True) for row in updates])
+
+    # Rows that carry a properties list replace that customer's properties
+    with_props = [row for row in rows if row["properties"] is not None]
+    if with_props:
+        session.execute(delete(Property).where(Property.customer_id.in_([row["id"] for row in with_props])))
+        prop_rows = [dict(prop, customer_id=row["id"]) for row in with_props for prop in row["properties"]]
+        if prop_rows:
+            session.execute(insert(Property), prop_rows)
+
+    # Likewise for fees
+    with_fees = [row for row in rows if row["fees"] is not None]
+    if with_fees:
+        session.execute(delete(CustomerFee).where(CustomerFee.customer_id.in_([row["id"] for row in with_fees])))
+        fee_rows = [dict(fee, customer_id=row["id"]) for row in with_fees for fee in row["fees"]]
+        if fee_rows:
+            session.execute(insert(CustomerFee), fee_rows)
+
+    return len(new_rows), len(updates)
+
+
+def import_customers(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Validate and upsert customers from an iterable of dicts, committing every batch_size rows.
+    Invalid rows are skipped and reported. Returns {"inserted", "updated", "errors"}.
+    """
+    summary = {"inserted": 0, "updated": 0, "errors": []}
+    session = SessionLocal()
+    batch = []
+
+    def flush():
+        try:
+            inserted, updated = _upsert_batch(session, batch)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        summary["inserted"] += inserted
+        summary["updated"] += updated
+        batch.clear()
+
+    try:
+        for line_no, row in enumerate(rows, start=1):
+            try:
+                batch.append(validate_row(row))
+            except (RowError, AttributeError, TypeError, ValueError) as e:
+                summary["errors"].append({"row": line_no, "error": str(e)})
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        session.close()
+
+    from reference_cache import invalidate_customers
+    invalidate_customers()
+    return summary
+
+
+# --- Exporting ---------------------------------------------------------------
+
+def _iter_export_rows(batch_size=DEFAULT_BATCH_SIZE):
+    """Yield customer dicts with their properties and fees, reading the table in server-side batches."""
+    session = SessionLocal()
+    try:
+        columns = [getattr(Customer, f) for f in CUSTOMER_FIELDS]
+        query = session.query(*columns).order_by(Customer.id).execution_options(stream_results=True, yield_per=batch_size)
+        pending = []
+
+        def drain():
+            ids = [r["id"] for r in pending]
+            props, fees = {}, {}
+            prop_columns = [Property.customer_id] + [getattr(Property, f) for f in PROPERTY_FIELDS]
+            for prop in session.query(*prop_columns).filter(Property.customer_id.in_(ids)).order_by(Property.id):
+                props.setdefault(prop[0], []).append(dict(zip(PROPERTY_FIELDS, prop[1:])))
+            fee_columns = [CustomerFee.customer_id] + [getattr(CustomerFee, f) for f in FEE_FIELDS]
+            for fee in session.query(*fee_columns).filter(CustomerFee.customer_id.in_(ids)).order_by(CustomerFee.position, CustomerFee.id):
+                fees.setdefault(fee[0], []).append(dict(zip(FEE_FIELDS, fee[1:])))
+            for row in pending:
+                row["properties"] = props.get(row["id"], [])
+                row["fees"] = fees.get(row["id"], [])
+                yield row
+            pending.clear()
+
+        for values in query:
+            row = dict(zip(CUSTOMER_FIELDS, values))
+            if isinstance(row["next_bill_date"], date):
+                row["next_bill_date"] = row["next_bill_date"].isoformat()
+            pending.append(row)
+            if len(pending) >= batch_size:
+                yield from drain()
+        if pending:
+            yield from drain()
+    finally:
+        session.close()
+
+
+def export_customers_csv(batch_size=DEFAULT_BATCH_SIZE):
+    """Yield CSV text chunks, one chunk per batch of customers."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=CUSTOMER_FIELDS + ["properties", "fees"])
+    writer.writeheader()
+    count = 0
+    for row in _iter_export_rows(batch_size):
+        row["properties"] = json.dumps(row["properties"]) if row["properties"] else ""
+        row["fees"] = json.dumps(row["fees"]) if row["fees"] else ""
+        writer.writerow(row)
+        count += 1
+        if count % batch_size == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+def export_customers_json(batch_size=DEFAULT_BATCH_SIZE):
+    """Yield a JSON array in text chunks, one chunk per batch of customers."""
+    parts = ["["]
+    first = True
+    for row in _iter_export_rows(batch_size):
+        parts.append(("" if first else ",") + "\n" + json.dumps(row))
+        first = False
+        if len(parts) >= batch_size:
+            yield "".join(parts)
+            parts = []
+    parts.append("\n]\n")
+    yield "".join(parts)
+
+
+def iter_rows(stream, fmt):
+    return iter_csv_rows(stream) if fmt == "csv" else iter_json_rows(stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import/export customers as CSV or JSON.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="upsert customers from a file ('-' for stdin)")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=["csv", "json"], help="defaults to the file extension")
+    imp.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    exp = sub.add_parser("export", help="write all customers to stdout")
+    exp.add_argument("--format", choices=["csv", "json"], default="csv")
+    exp.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from models import init_db
+    init_db()
+
+    if args.command == "import":
+        fmt = args.format or ("json" if args.path.lower().endswith((".json", ".jsonl")) else "csv")
+        stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+        with stream:
+            summary = import_customers(iter_rows(stream, fmt), args.batch_size)
+        print(f"Inserted {summary['inserted']}, updated {summary['updated']}, {len(summary['errors'])} invalid rows")
+        for err in summary["errors"][:20]:
+            print(f"  row {err['row']}: {err['error']}")
+    else:
+        export = export_customers_csv if args.format == "csv" else export_customers_json
+        for chunk in export(args.batch_size):
+            sys.stdout.write(chunk)
@@ -1,5 +1,5 @@
 import os
-from docx import Document
+from docx_text import iter_text
 import re
 
 GENERATED_DIR = r"C:\Development\invoice_automation\generated_invoices"
@@ -13,14 +13,9 @@ def check_invoices():
     for f in files[:2]:
         path = os.path.join(GENERATED_DIR, f)
         print(f"Checking {f}...")
-        doc = Document(path)
         found = set()
-        for para in doc.paragraphs:
-            found.update(PLACEHOLDER_PATTERN.findall(para.text))
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    found.update(PLACEHOLDER_PATTERN.findall(cell.text))
+        for text in iter_text(path):
+            found.update(PLACEHOLDER_PATTERN.findall(text))
         
         if found:
             print(f"  Missing values: {found}")
@@ -2,7 +2,7 @@
 Script to clear all invoices from the database.
 Use with caution - this will delete ALL invoice records!
 """
-from models import SessionLocal, Invoice
+from models import SessionLocal, Invoice, InvoiceLine
 
 def clear_all_invoices():
     session = SessionLocal()
@@ -13,6 +13,7 @@ def clear_all_invoices():
         if count > 0:
             confirm = input(f"Are you sure you want to delete all {count} invoices? (yes/no): ")
             if confirm.lower() == 'yes':
+                session.query(InvoiceLine).filter(InvoiceLine.invoice_id.in_(session.query(Invoice.id))).delete(synchronize_session=False)
                 session.query(Invoice).delete()
                 session.commit()
                 print(f"✓ Deleted {count} invoices")
@@ -0,0 +1,208 @@
+"""
+Cold-start and instance lifecycle analysis of the Vercel log exports.
+
+    python cold_starts.py                  # every log/*.csv
+    python cold_starts.py --json
+    python cold_starts.py exports/*.csv --routes 10
+
+Requests are grouped by instanceId to rebuild each lambda instance's lifetime
+(first to last request, requests served, peak concurrency and memory). An
+instance's first request is its cold start, all later ones are warm. The
+penalty of a cold start is its duration minus the median warm duration of the
+same route; the tables show the median penalty and the sum of penalties (the
+latency cold starts cost) per route and per deployment. Penalties are measured
+against the route, so deployments compare fairly whatever routes they served:
+one that imports less should show a smaller penalty than the ones before it.
+
+The exports only show the first request within their window, so an instance
+started just before an export begins is counted as a cold start too; requests
+that crashed while starting (no instanceId) are counted separately.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+from log_analytics import LOG_DIR, Histogram, iter_rows, route_of
+
+
+class Instance:
+    __slots__ = ("deployment", "first", "last_ts", "requests", "concurrency", "memory")
+
+    def __init__(self, row):
+        self.deployment = row["deploymentId"]
+        self.first = None  # (ts, route, duration) of the earliest request seen so far
+        self.last_ts = int(row["timestampInMs"])
+        self.requests = 0
+        self.concurrency = 0
+        self.memory = 0
+
+
+class Group:
+    """Cold and warm durations of a route or deployment."""
+
+    def __init__(self):
+        self.cold = Histogram()
+        self.warm = Histogram()
+        self.penalty = Histogram()  # per cold start, against the warm median of its route
+        self.excess = 0
+        self.failed = 0
+        self.first_ts = None
+
+    def as_dict(self):
+        return {
+            "cold_starts": self.cold.count,
+            "warm_requests": self.warm.count,
+            "failed_starts": self.failed,
+            "cold_p50_ms": self.cold.percentile(50),
+            "warm_p50_ms": self.warm.percentile(50),
+            "penalty_p50_ms": self.penalty.percentile(50),
+            "excess_ms": self.excess,
+        }
+
+
+class Analysis:
+    def __init__(self):
+        self.instances = {}
+        self.routes = {}
+        self.deployments = {}
+        self.total_ms = 0
+        self.requests = 0
+        self.failed = 0
+
+    def _group(self, groups, key):
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = Group()
+        return group
+
+    def add(self, row):
+        """Add a summary row; rows must come newest first (as from log_analytics.iter_rows)."""
+        duration = int(row["durationMs"])
+        route = route_of(row["requestPath"])
+        self.requests += 1
+        self.total_ms += duration
+        deployment = self._group(self.deployments, row["deploymentId"])
+        deployment.first_ts = int(row["timestampInMs"])
+        if not row["instanceId"]:
+            self.failed += 1
+            self._group(self.routes, route).failed += 1
+            deployment.failed += 1
+            return
+        self._group(self.routes, route)  # finish() scores the cold start against this route even if it never ran warm
+        instance = self.instances.get(row["instanceId"])
+        if instance is None:
+            instance = self.instances[row["instanceId"]] = Instance(row)
+        if instance.first is not None:
+            # An earlier request turned up, so the previous candidate was warm
+            _, previous_route, previous_duration = instance.first
+            self._group(self.routes, previous_route).warm.add(previous_duration)
+            deployment.warm.add(previous_duration)
+        instance.first = (int(row["timestampInMs"]), route, duration)
+        instance.requests += 1
+        instance.concurrency = max(instance.concurrency, int(row["concurrency"] or 0))
+        instance.memory = max(instance.memory, int(row["maxMemoryUsed"]))
+
+    def finish(self):
+        """Score each instance's first request as a cold start against its route's warm median."""
+        overall = Histogram()
+        for group in self.routes.values():
+            overall.counts.update(group.warm.counts)
+            overall.count += group.warm.count
+        fallback = overall.percentile(50) or 0
+        for instance in self.instances.values():
+            _, route, duration = instance.first
+            warm = self.routes[route].warm.percentile(50)
+            excess = max(duration - (fallback if warm is None else warm), 0)
+            for group in (self.routes[route], self.deployments[instance.deployment]):
+                group.cold.add(duration)
+                group.penalty.add(excess)
+                group.excess += excess
+        return self
+
+    def summary(self):
+        lifetimes = [(i.last_ts - i.first[0]) / 1000 for i in self.instances.values()]
+        served = [i.requests for i in self.instances.values()]
+        excess = sum(g.excess for g in self.routes.values())
+        return {
+            "requests": self.requests,
+            "instances": len(self.instances),
+            "failed_starts": self.failed,
+            "median_lifetime_s": statistics.median(lifetimes) if lifetimes else None,
+            "median_requests_per_instance": statistics.median(served) if served else None,
+            "max_concurrency": max((i.concurrency for i in self.instances.values()), default=None),
+            "peak_memory_mb": max((i.memory for i in self.instances.values()), default=None),
+            "total_ms": self.total_ms,
+            "cold_start_excess_ms": excess,
+            "cold_start_share": excess / self.total_ms if self.total_ms else 0.0,
+        }
+
+
+def analyze(rows):
+    analysis = Analysis()
+    for row in rows:
+        if row["durationMs"] != "-1":
+            analysis.add(row)
+    return analysis.finish()
+
+
+def _ms(value):
+    return "-" if value is None else str(value)
+
+
+def report(analysis, routes=None, out=None):
+    out = out or sys.stdout
+    s = analysis.summary()
+    print(f"{s['instances']} instances for {s['requests']} requests, {s['failed_starts']} crashed while starting", file=out)
+    if s["instances"]:
+        print(f"median lifetime {s['median_lifetime_s']:.0f}s, median {s['median_requests_per_instance']:g} requests "
+              f"per instance, concurrency up to {s['max_concurrency']}, memory up to {s['peak_memory_mb']} MB", file=out)
+    print(f"cold starts cost {s['cold_start_excess_ms'] / 1000:.1f}s of {s['total_ms'] / 1000:.1f}s total latency "
+          f"({s['cold_start_share']:.1%})\n", file=out)
+
+    def table(title, groups, limit=None):
+        header = f"{title:<36} {'cold':>5} {'warm':>5} {'fail':>5} {'cold p50':>9} {'warm p50':>9} {'penalty':>8} {'cost s':>7}"
+        print(header, file=out)
+        print("-" * len(header), file=out)
+        for key, group in groups[:limit]:
+            d = group.as_dict()
+            print(f"{key[:36]:<36} {d['cold_starts']:>5} {d['warm_requests']:>5} {d['failed_starts']:>5} "
+                  f"{_ms(d['cold_p50_ms']):>9} {_ms(d['warm_p50_ms']):>9} {_ms(d['penalty_p50_ms']):>8} "
+                  f"{d['excess_ms'] / 1000:>7.1f}", file=out)
+        print(file=out)
+
+    table("route", sorted(analysis.routes.items(), key=lambda item: -item[1].excess), routes)
+    # Deployments oldest first, to see whether a change moved the penalty
+    table("deployment (oldest first)", sorted(analysis.deployments.items(), key=lambda item: item[1].first_ts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="export files (default: log/*.csv)")
+    parser.add_argument("--json", action="store_true", help="print the analysis as JSON")
+    parser.add_argument("--routes", type=int, help="only the N routes with the largest cold-start cost")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(glob.glob(os.path.join(LOG_DIR, "*.csv")))
+    if not paths:
+        parser.error("no log exports found")
+    try:
+        analysis = analyze(iter_rows(paths))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.json:
+        json.dump({
+            "summary": analysis.summary(),
+            "routes": {key: group.as_dict() for key, group in sorted(analysis.routes.items())},
+            "deployments": {key: group.as_dict() for key, group in sorted(analysis.deployments.items())},
+        }, sys.stdout, indent=2)
+        print()
+    else:
+        report(analysis, args.routes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
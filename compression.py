@@ -0,0 +1,104 @@
+import zlib
+from flask import request
+
+try:
+    import brotli  # optional; gzip is used when it's not installed
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/html", "text/css", "text/csv", "text/plain", "application/json", "application/javascript")
+MIN_SIZE = 500
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def buffered(chunks, size=STREAM_CHUNK_SIZE):
+    """
+    Group many small template chunks into fewer, larger writes. Closing it closes chunks,
+    so a stream_template cut short pops its request context right away rather than
+    whenever the suspended generator is garbage collected (inside some later request).
+    """
+    parts, length = [], 0
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                yield "".join(parts)
+                parts, length = [], 0
+        if parts:
+            yield "".join(parts)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+class _Gzip:
+    def __init__(self):
+        self._obj = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data):
+        # Sync flush so the browser can start rendering each chunk as it arrives
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=5)
+
+    def chunk(self, data):
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+def _choose_encoding():
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+
+def _compress_stream(iterable, compressor):
+    try:
+        for data in iterable:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if data:
+                yield compressor.chunk(data)
+        yield compressor.finish()
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+
+
+def init_app(app):
+    """Negotiate gzip/brotli for text responses, including streamed ones."""
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = _choose_encoding()
+        if not encoding:
+            return response
+        compressor = _Brotli() if encoding == "br" else _Gzip()
+
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, compressor)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < MIN_SIZE:
+                return response
+            response.set_data(compressor.chunk(data) + compressor.finish())
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -1,5 +1,6 @@
 from docx import Document
 import os
+from invoice_generator import OPTIONAL_LINE_PLACEHOLDERS, PLACEHOLDERS
 
 def create_clean_template():
     # Load existing template if possible, or create new
@@ -17,12 +18,14 @@ def create_clean_template():
     # But we can create a text file listing what SHOULD be there.
     
     with open("TEMPLATE_CHECKLIST.txt", "w") as f:
-        f.write("Please ensure your base_invoice_template.docx contains the following placeholders in the table:\n\n")
-        f.write("{{FEE_LINE_1}}   {{AMOUNT_1}}\n")
-        f.write("{{FEE_LINE_2}}   {{AMOUNT_2}}\n")
-        f.write("{{FEE_LINE_3}}   {{AMOUNT_3}}\n")
-        f.write("{{ADDITIONAL_FEE_LINE}}   {{ADDITIONAL_FEE_AMOUNT}}\n")
-        f.write("Total: {{TOTAL_AMOUNT}}\n")
+        f.write("Please ensure your base_invoice_template.docx contains the placeholders the generator fills,\n")
+        f.write("each typed in one go so Word keeps it in a single run:\n\n")
+        for placeholder in PLACEHOLDERS:
+            f.write(placeholder + "\n")
+        f.write("\nThe line (paragraph or table row) of an empty ")
+        f.write(", ".join(OPTIONAL_LINE_PLACEHOLDERS) + " is removed.\n\n")
+        f.write("After editing a template, lint it and refresh the placeholder manifest the renderer loads:\n\n")
+        f.write("    python template_compiler.py --write\n")
     
     print("Created TEMPLATE_CHECKLIST.txt")
 
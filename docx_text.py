@@ -0,0 +1,166 @@
+"""
+Fast, constant-memory text extraction from .docx files.
+
+Instead of building a python-docx Document, this opens the zip and scans
+word/document.xml in fixed-size chunks, yielding paragraph text as soon as
+each paragraph closes. Paragraph text follows python-docx's rules (runs
+directly in the paragraph or in a hyperlink; tabs as "\\t", line breaks as
+"\\n"), so callers can switch over without changing what they match.
+
+    for p in iter_paragraphs(path):
+        print(p.table, p.row, p.cell, p.text)
+
+The scanner matches only the handful of tags that carry text or structure
+with a regex and never looks at the rest, which is what makes it much
+faster than a full XML parse (python-docx or iterparse both visit every
+formatting element). That is safe for WordprocessingML because markup
+never appears unescaped inside text or attribute values.
+"""
+import html
+import io
+import re
+import zipfile
+from collections import namedtuple
+from itertools import groupby
+
+W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+CHUNK_SIZE = 64 * 1024
+
+# Elements the scanner tracks. Everything else (formatting, drawings, bookmarks...) is
+# skipped by the regex itself; wrappers that can hold runs or paragraphs are tracked so
+# their text is left out, as python-docx does.
+TEXT_ELEMENTS = ("body", "p", "r", "t", "tab", "br", "cr", "noBreakHyphen", "ptab", "hyperlink", "tbl", "tr", "tc")
+WRAPPER_ELEMENTS = ("ins", "del", "moveFrom", "moveTo", "smartTag", "fldSimple", "sdt", "sdtContent",
+                    "customXml", "txbxContent", "dir", "bdo")
+PREFIX = re.compile(r'xmlns:([\w.\-]+)="' + re.escape(W_NAMESPACE) + '"')
+
+# table/row/cell are positions within the outermost table, or None outside tables
+Paragraph = namedtuple("Paragraph", "text table row cell")
+
+
+def iter_paragraphs(source):
+    """
+    Yield a Paragraph for each paragraph in the document body and in table cells,
+    in document order. `source` is a path or a binary file object.
+    """
+    with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as raw:
+        reader = io.TextIOWrapper(raw, encoding="utf-8")
+        buffer = reader.read(CHUNK_SIZE)
+        prefix = PREFIX.search(buffer)
+        w = (prefix.group(1) if prefix else "w") + ":"
+        BODY, P, R, T, BR = w + "body", w + "p", w + "r", w + "t", w + "br"
+        HYPERLINK, TBL, TR, TC = w + "hyperlink", w + "tbl", w + "tr", w + "tc"
+        run_text = {w + "tab": "\t", w + "cr": "\n", w + "noBreakHyphen": "-", w + "ptab": "\t"}
+        br_type = re.compile(r'\b' + w + r'type="([^"]*)"')
+        names = "|".join(sorted(TEXT_ELEMENTS + WRAPPER_ELEMENTS, key=len, reverse=True))
+        tag = re.compile(r"<(/?)(" + re.escape(w) + "(?:" + names + r"))(?=[\s/>])([^>]*)>")
+
+        stack = []              # names of the open elements
+        parts = None            # text pieces of the open body/cell paragraph
+        paragraph_depth = None  # that paragraph's index in the stack
+        run_depth = None        # len(stack) inside a run whose text belongs to that paragraph
+        text_start = None       # buffer offset where the open w:t's text begins
+        table_index = -1
+        row = cell = None
+        table_depth = 0
+
+        while buffer:
+            consumed = 0
+            for match in tag.finditer(buffer):
+                closing, name, attrs = match.groups()
+                empty = attrs.endswith("/")
+                consumed = match.end()
+
+                if closing:
+                    stack.pop()
+                    if name == T:
+                        if text_start is not None:
+                            text = buffer[text_start:match.start()]
+                            parts.append(html.unescape(text) if "&" in text else text)
+                            text_start = None
+                    elif name == R:
+                        if run_depth == len(stack) + 1:
+                            run_depth = None
+                    elif name == P:
+                        if paragraph_depth == len(stack):
+                            yield _paragraph("".join(parts), table_depth, table_index, row, cell)
+                            parts = paragraph_depth = None
+                    elif name == TBL:
+                        table_depth -= 1
+                        if table_depth == 0:
+                            row = cell = None
+                    continue
+
+                if run_depth == len(stack):
+                    # A direct child of a run we are reading
+                    if name == T:
+                        text_start = None if empty else match.end()
+                    elif name in run_text:
+                        parts.append(run_text[name])
+                    elif name == BR:
+                        kind = br_type.search(attrs)
+                        if kind is None or kind.group(1) == "textWrapping":
+                            parts.append("\n")
+                elif name == R:
+                    # python-docx only reads runs directly under w:p or under w:p/w:hyperlink
+                    # (not, say, in a paragraph of a text box inside one of its runs)
+                    if paragraph_depth is not None and not empty and (
+                        len(stack) == paragraph_depth + 1
+                        or (len(stack) == paragraph_depth + 2 and stack[-1] == HYPERLINK)
+                    ):
+                        run_depth = len(stack) + 1
+                elif name == P:
+                    if stack[-1] in (BODY, TC):
+                        if empty:
+                            yield _paragraph("", table_depth, table_index, row, cell)
+                        else:
+                            parts = []
+                            paragraph_depth = len(stack)
+                elif name == TBL:
+                    table_depth += 1
+                    if table_depth == 1:
+                        table_index += 1
+                        row = -1
+                elif name == TR and table_depth == 1:
+                    row += 1
+                    cell = -1
+                elif name == TC and table_depth == 1:
+                    cell += 1
+                if not empty:
+                    stack.append(name)
+
+            # Keep only what is still needed: the open w:t's text so far, or a tag cut off by the chunk
+            if text_start is not None:
+                keep = text_start
+                text_start = 0
+            else:
+                keep = buffer.rfind("<", consumed)
+                if keep == -1:
+                    keep = len(buffer)
+            more = reader.read(CHUNK_SIZE)
+            if not more:
+                break
+            buffer = buffer[keep:] + more
+
+
+def _paragraph(text, table_depth, table_index, row, cell):
+    if table_depth:
+        return Paragraph(text, table_index, row, cell)
+    return Paragraph(text, None, None, None)
+
+
+def iter_text(source):
+    """Yield the text of every paragraph (body and table cells)."""
+    for paragraph in iter_paragraphs(source):
+        yield paragraph.text
+
+
+def iter_table_rows(source):
+    """Yield (table index, row index, [cell text, ...]) for each row of each top-level table."""
+    in_tables = (p for p in iter_paragraphs(source) if p.table is not None)
+    for (table, row), paragraphs in groupby(in_tables, key=lambda p: (p.table, p.row)):
+        cells = [
+            "\n".join(p.text for p in cell_paragraphs)
+            for _, cell_paragraphs in groupby(paragraphs, key=lambda p: p.cell)
+        ]
+        yield table, row, cells
@@ -0,0 +1,327 @@
+"""
+Invoice email delivery through the email_outbox table.
+
+queue_invoices() adds a row per invoice with the invoice's finished subject and
+body and the customer's current address. deliver_outbox() then sends every due
+row with the rendered docx attached, in batches of EMAIL_BATCH_SIZE over one
+reused SMTP connection (reopened after EMAIL_MAX_PER_CONNECTION messages or when
+the server hangs up). With EMAIL_MAX_PER_MINUTE set, it waits between batches to
+stay under that rate.
+
+A 5xx reply fails a message for good. A 4xx reply, a dropped connection or a
+render error is retried on a later pass, EMAIL_RETRY_DELAY seconds after the
+first attempt and doubling up to EMAIL_RETRY_MAX_DELAY, until EMAIL_MAX_ATTEMPTS.
+Each outcome is committed as soon as it is known. If the server cannot be
+reached at all the pass stops, and the unsent rows stay queued as they were.
+"""
+import argparse
+import logging
+import os
+import smtplib
+import ssl
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from models import SessionLocal, Customer, Invoice, OutboxEmail
+
+SMTP_HOST = os.getenv("SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = 30  # seconds per SMTP command
+EMAIL_FROM = os.getenv("EMAIL_FROM", "") or SMTP_USER
+
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_MAX_PER_MINUTE = int(os.getenv("EMAIL_MAX_PER_MINUTE", "0"))  # 0 = no limit
+EMAIL_MAX_PER_CONNECTION = int(os.getenv("EMAIL_MAX_PER_CONNECTION", "100"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_DELAY = int(os.getenv("EMAIL_RETRY_DELAY", "300"))  # seconds before the first retry
+EMAIL_RETRY_MAX_DELAY = int(os.getenv("EMAIL_RETRY_MAX_DELAY", "21600"))
+
+DOCX_TYPE = ("application", "vnd.openxmlformats-officedocument.wordprocessingml.document")
+
+logger = logging.getLogger(__name__)
+
+
+class SmtpUnavailable(Exception):
+    """The SMTP server could not be reached or refused the login; no message was at fault."""
+
+
+def open_smtp():
+    """A logged-in SMTP session to SMTP_HOST."""
+    if not SMTP_HOST:
+        raise SmtpUnavailable("SMTP_HOST is not set")
+    smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    try:
+        if SMTP_STARTTLS:
+            smtp.starttls(context=ssl.create_default_context())
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+class SmtpConnection:
+    """One SMTP session reused for many messages: opened on the first send, reopened when needed."""
+
+    def __init__(self, connect=open_smtp, max_messages=EMAIL_MAX_PER_CONNECTION):
+        self.connect = connect
+        self.max_messages = max_messages
+        self.smtp = None
+        self.sent = 0
+        self.opened = 0
+
+    def _open(self):
+        try:
+            self.smtp = self.connect()
+        except OSError as e:  # includes smtplib.SMTPException
+            raise SmtpUnavailable(f"Could not connect to the SMTP server: {e}") from e
+        self.opened += 1
+        self.sent = 0
+
+    def send(self, message):
+        if self.smtp is not None and self.max_messages and self.sent >= self.max_messages:
+            self.close()
+        for retry in (False, True):
+            if self.smtp is None:
+                self._open()
+            try:
+                self.smtp.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # Servers hang up on idle sessions; reconnect once and send again
+                self.smtp = None
+                if retry:
+                    raise
+                continue
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                raise  # the server answered, so the session is still usable
+            except OSError:
+                self.abandon()
+                raise
+            self.sent += 1
+            return
+
+    def abandon(self):
+        if self.smtp is not None:
+            self.smtp.close()
+            self.smtp = None
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (OSError, smtplib.SMTPException):
+                self.smtp.close()
+            self.smtp = None
+
+
+def queue_invoices(session, payload):
+    """
+    Queue the invoice emails of payload["ids"] or of every invoice in payload["period_label"].
+    Invoices already queued or sent are skipped unless payload["resend"] is true.
+    """
+    from invoice_batch import BatchError, _int_list
+
+    if payload.get("period_label"):
+        ids = [row.id for row in session.query(Invoice.id)
+               .filter(Invoice.period_label == payload["period_label"]).order_by(Invoice.id)]
+    else:
+        ids = _int_list(payload.get("ids"), "ids")
+    if not ids:
+        raise BatchError("No invoices to queue")
+
+    rows = {
+        row.id: row for row in session.query(Invoice.id, Invoice.email_subject, Invoice.email_body, Customer.email)
+        .outerjoin(Customer, Customer.id == Invoice.customer_id).filter(Invoice.id.in_(ids))
+    }
+    already = {}
+    if not payload.get("resend"):
+        for invoice_id, status in session.query(OutboxEmail.invoice_id, OutboxEmail.status).filter(
+                OutboxEmail.invoice_id.in_(ids), OutboxEmail.status.in_(("queued", "sent"))):
+            if status == "sent" or invoice_id not in already:
+                already[invoice_id] = f"already_{status}"
+
+    results, queued = [], []
+    for invoice_id in ids:
+        row = rows.get(invoice_id)
+        if row is None:
+            results.append({"id": invoice_id, "status": "not_found"})
+        elif not row.email:
+            results.append({"id": invoice_id, "status": "no_email"})
+        elif invoice_id in already:
+            results.append({"id": invoice_id, "status": already[invoice_id]})
+        else:
+            queued.append(OutboxEmail(invoice_id=invoice_id, to_address=row.email,
+                                      subject=row.email_subject, body=row.email_body))
+            already[invoice_id] = "already_queued"
+            results.append({"id": invoice_id, "status": "queued"})
+    session.add_all(queued)
+    return results
+
+
+def _is_permanent(error):
+    """5xx replies will fail again; 4xx replies and network errors may not."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts."""
+    return min(EMAIL_RETRY_DELAY * 2 ** (attempts - 1), EMAIL_RETRY_MAX_DELAY)
+
+
+def build_message(row, attachment=None, sender=None):
+    """The EmailMessage for an outbox row; attachment is a (filename, bytes) docx."""
+    message = EmailMessage()
+    message["From"] = sender or EMAIL_FROM
+    message["To"] = row.to_address
+    message["Subject"] = row.subject
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid(idstring=f"outbox.{row.id}")
+    message.set_content(row.body)
+    if attachment:
+        filename, data = attachment
+        message.add_attachment(data, maintype=DOCX_TYPE[0], subtype=DOCX_TYPE[1], filename=filename)
+    return message
+
+
+def _render(session, invoices):
+    """{invoice id: (filename, bytes) or the exception raised rendering it}"""
+    from invoice_generator import generate_invoice_buffer, load_property_fees, NO_PROPERTY_FEES
+
+    property_fees = load_property_fees(session, {invoice.customer_id for invoice in invoices})
+    documents = {}
+    for invoice in invoices:
+        try:
+            filename, buffer = generate_invoice_buffer(invoice, property_fees.get(invoice.customer_id, NO_PROPERTY_FEES))
+            documents[invoice.id] = (os.path.basename(filename), buffer.getvalue())
+        except Exception as e:
+            documents[invoice.id] = e
+    return documents
+
+
+def _record_failure(row, error, permanent, now):
+    row.attempts += 1
+    row.last_error = str(error)[:500]
+    if permanent or row.attempts >= EMAIL_MAX_ATTEMPTS:
+        row.status = "failed"
+        return "failed"
+    row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+    return "retrying"
+
+
+def deliver_outbox(events=None, connect=open_smtp, sleep=time.sleep, now=datetime.utcnow):
+    """
+    Send every queued email that is due, in one pass. If given, events(kind, **data) is
+    called for each message sent, retried or failed and with "progress" events; it may
+    raise JobCancelled to stop the pass, keeping what was sent so far. Returns the counts.
+    Raises SmtpUnavailable, after recording what was sent, if the server cannot be reached.
+    """
+    emit = events or (lambda kind, **data: None)
+    counts = {"sent": 0, "retrying": 0, "failed": 0}
+    connection = SmtpConnection(connect)
+    session = SessionLocal()
+    try:
+        due = [row.id for row in session.query(OutboxEmail.id).filter(
+            OutboxEmail.status == "queued", OutboxEmail.next_attempt_at <= now()).order_by(OutboxEmail.id)]
+        emit("progress", done=0, total=len(due))
+        done = 0
+        for start in range(0, len(due), EMAIL_BATCH_SIZE):
+            batch_started = time.monotonic()
+            rows = session.query(OutboxEmail).filter(
+                OutboxEmail.id.in_(due[start:start + EMAIL_BATCH_SIZE])).order_by(OutboxEmail.id).all()
+            invoices = session.query(Invoice).filter(Invoice.id.in_({row.invoice_id for row in rows})).all()
+            documents = _render(session, invoices)
+            messages = {}
+            for row in rows:
+                document = documents.get(row.invoice_id)
+                if document is None:
+                    messages[row.id] = (ValueError(f"Invoice {row.invoice_id} no longer exists"), True)
+                elif isinstance(document, Exception):
+                    messages[row.id] = (document, False)
+                else:
+                    messages[row.id] = build_message(row, document)
+
+            for row in rows:
+                message = messages[row.id]
+                invoice_id = row.invoice_id
+                if isinstance(message, tuple):
+                    error, permanent = message
+                else:
+                    try:
+                        connection.send(message)
+                        error = None
+                    except OSError as e:
+                        error, permanent = e, _is_permanent(e)
+                if error is None:
+                    row.status = "sent"
+                    row.attempts += 1
+                    row.sent_at = now()
+                    row.last_error = None
+                    outcome = "sent"
+                else:
+                    outcome = _record_failure(row, error, permanent, now())
+                    logger.warning("email not sent", extra={"invoice_id": invoice_id, "outbox_id": row.id,
+                                                            "outcome": outcome, "error": str(error)})
+                # Commit each outcome so a crash re-sends at most the message in flight
+                session.commit()
+                counts[outcome] += 1
+                done += 1
+                if outcome == "sent":
+                    emit("email_sent", invoice_id=invoice_id, to=message["To"])
+                else:
+                    emit("error", invoice_id=invoice_id, outcome=outcome, error=str(error))
+                emit("progress", done=done, total=len(due))
+
+            if EMAIL_MAX_PER_MINUTE and start + EMAIL_BATCH_SIZE < len(due):
+                wait = len(rows) * 60 / EMAIL_MAX_PER_MINUTE - (time.monotonic() - batch_started)
+                if wait > 0:
+                    emit("progress", done=done, total=len(due),
+                         message=f"Waiting {wait:.0f}s to stay under {EMAIL_MAX_PER_MINUTE} emails per minute")
+                    sleep(wait)
+        emit("progress", done=done, total=len(due),
+             message=f"Done! Sent {counts['sent']} emails, {counts['retrying']} to retry, {counts['failed']} failed.")
+        return counts
+    finally:
+        connection.close()
+        session.close()
+
+
+def outbox_status(session):
+    """{status: count} over the outbox."""
+    from sqlalchemy import func
+    return dict(session.query(OutboxEmail.status, func.count()).group_by(OutboxEmail.status).all())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queue invoice emails and send everything due in the outbox.")
+    parser.add_argument("ids", nargs="*", type=int, help="invoice ids to queue")
+    parser.add_argument("--period", help="queue every invoice of this period, e.g. \"3rd quarter 2025\"")
+    parser.add_argument("--resend", action="store_true", help="queue again even if already sent")
+    parser.add_argument("--no-send", action="store_true", help="only queue, leave sending to the next pass")
+    args = parser.parse_args()
+
+    from models import init_db
+    from job_events import describe_event
+    from job_lease import job_lease
+    init_db()
+    if args.ids or args.period:
+        session = SessionLocal()
+        try:
+            results = queue_invoices(session, {"ids": args.ids, "period_label": args.period, "resend": args.resend})
+            session.commit()
+        finally:
+            session.close()
+        print(f"Queued {sum(r['status'] == 'queued' for r in results)} of {len(results)} invoices.")
+    if not args.no_send:
+        def print_event(kind, **data):
+            if kind != "progress" or "message" in data:
+                print(describe_event(kind, data))
+
+        with job_lease("email"):
+            deliver_outbox(events=print_event)
@@ -0,0 +1,189 @@
+"""
+Single-pass field extraction for legacy invoice text.
+
+An Extractor combines the keywords of all its rules into one compiled scanner
+and runs it once over a document (its paragraphs joined by newlines). Each hit
+hands the paragraph it is in to that keyword's Rule, whose own pattern pulls
+out the values, so a rule's regex only ever runs on the few paragraphs that
+can match it. Each Field of a rule turns the match into a value with a
+confidence between 0 and 1. When several paragraphs yield the same field, the
+most confident value wins, ties going to the first or last as the Field
+prefers.
+
+    result = customer_extractor.extract(paragraph_texts)
+    result["rate"].value, result["rate"].confidence
+"""
+import re
+from collections import namedtuple
+
+LOW_CONFIDENCE = 0.6  # below this a field is worth a human look
+
+# paragraph is the index of the paragraph the value came from, None for defaults
+FieldValue = namedtuple("FieldValue", "value confidence paragraph")
+
+MONEY = r"\$\s?([0-9][0-9,]*(?:\.[0-9]{2})?)"
+EMAIL = r"(?<![a-zA-Z0-9._%+-])[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
+
+# One pass over "street, city, ST 12345": state and zip only at the end, so house
+# numbers and abbreviations like "ST" (street) or "DR" aren't mistaken for them
+ADDRESS = re.compile(r"""
+    ^[\s,]*(?P<street>[^,]+?)
+    (?:\s*,\s*(?P<city>.*?))?
+    (?:(?(city)[\s,]+|\s*,\s*)(?P<state>[A-Z]{2}))?
+    (?:[\s,]+(?P<zip>\d{5}(?:-\d{4})?))?
+    [\s,]*$
+""", re.VERBOSE)
+
+
+class Field:
+    """
+    How a rule's match becomes a value for field `name`. `convert(match)` returns the
+    value, or None to ignore the match. `confidence` is a number or a function of the value.
+    """
+
+    def __init__(self, name, convert, confidence=0.9, prefer="last"):
+        self.name = name
+        self.convert = convert
+        self.confidence = confidence
+        self.prefer = prefer
+
+    def score(self, value):
+        return self.confidence(value) if callable(self.confidence) else self.confidence
+
+
+class Rule:
+    """
+    Fields found in paragraphs containing any of `keywords` (case-insensitive; only at
+    the start of the paragraph if `at_start`). `pattern` is searched in the paragraph,
+    or with `each`, every match of it is used. Without a pattern the Fields get a
+    match of the whole paragraph.
+    """
+
+    def __init__(self, keywords, *fields, pattern=None, at_start=False, each=False, flags=re.IGNORECASE):
+        self.keywords = keywords
+        self.fields = fields
+        self.at_start = at_start
+        self.each = each
+        self.regex = re.compile(pattern if pattern is not None else r".*", flags)
+
+    def matches(self, paragraph):
+        if self.each:
+            return self.regex.finditer(paragraph)
+        match = self.regex.search(paragraph)
+        return (match,) if match else ()
+
+
+class Extractor:
+    def __init__(self, rules, defaults):
+        self.rules = list(rules)
+        self.defaults = dict(defaults)
+        self._rules_by_keyword = {}
+        for rule in self.rules:
+            for keyword in rule.keywords:
+                self._rules_by_keyword.setdefault(keyword.lower(), []).append(rule)
+        # Plain literals, longest first: no groups or anchors, so the regex engine can skip
+        # ahead to the next possible first character instead of trying every position.
+        # It runs on lowercased text, as ignoring case in the regex is several times slower.
+        keywords = sorted(self._rules_by_keyword, key=len, reverse=True)
+        self.scanner = re.compile("|".join(map(re.escape, keywords)))
+        self.scanner_ignorecase = re.compile(self.scanner.pattern, re.IGNORECASE)
+
+    def extract(self, paragraphs):
+        """Return {field: FieldValue} for an iterable of paragraph texts; missing fields get their default."""
+        # Paragraphs are lines of the scanned text, so breaks inside one become spaces
+        lines = [p.strip() for p in paragraphs]
+        text = "\n".join(lines)
+        if text.count("\n") >= len(lines):
+            text = "\n".join(line.replace("\n", " ") for line in lines)
+        if "\r" in text:
+            text = text.replace("\r", " ")
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            hits = self.scanner.finditer(lowered)
+        else:
+            # A few characters change length when lowercased, which would shift offsets
+            hits = self.scanner_ignorecase.finditer(text)
+
+        best, seen = {}, set()
+        paragraph, counted_to = 0, 0
+        for hit in hits:
+            start = text.rfind("\n", 0, hit.start()) + 1
+            end = text.find("\n", start)
+            line = None
+            for rule in self._rules_by_keyword[hit.group().lower()]:
+                if (rule.at_start and hit.start() != start) or (rule, start) in seen:
+                    continue
+                seen.add((rule, start))
+                if line is None:
+                    line = text[start:] if end == -1 else text[start:end]
+                    paragraph += text.count("\n", counted_to, start)
+                    counted_to = start
+                for match in rule.matches(line):
+                    for field in rule.fields:
+                        value = field.convert(match)
+                        if value is None:
+                            continue
+                        confidence = field.score(value)
+                        current = best.get(field.name)
+                        if (current is None or confidence > current.confidence
+                                or (confidence == current.confidence and field.prefer == "last")):
+                            best[field.name] = FieldValue(value, confidence, paragraph)
+
+        return {name: best.get(name, FieldValue(default, 0.0, None)) for name, default in self.defaults.items()}
+
+
+def parse_money(amount):
+    """'1,192.50' -> 1192.5"""
+    return float(amount.replace(",", ""))
+
+
+def parse_address(full_address):
+    """Split "street, city, ST 12345" into (street, city, state, zip); missing parts are ''."""
+    match = ADDRESS.match(full_address)
+    if not match:
+        return full_address.strip(" ,"), "", "", ""
+    return tuple((match.group(g) or "").strip(" ,") for g in ("street", "city", "state", "zip"))
+
+
+def _cadence(match):
+    line = match.string.lower()
+    if "quarter" in line:
+        return "quarterly"
+    if "year" in line or "annual" in line:
+        return "yearly"
+    return None
+
+
+def _positive_money(match):
+    amount = parse_money(match.group(1))
+    return amount if amount > 0 else None
+
+
+def _last_money(match):
+    amounts = re.findall(MONEY, match.string)
+    if not amounts:
+        return None
+    amount = parse_money(amounts[-1])
+    return amount if amount > 0 else None
+
+
+# Addresses of StoneGate itself appear on every invoice
+SENDER_EMAIL = re.compile(r"linda|stonegate", re.IGNORECASE)
+
+CUSTOMER_RULES = [
+    Rule(["to:"], Field("name", lambda m: m.group(1)), pattern=r"^to:\s*(\S.*)", at_start=True),
+    Rule(["for:"],
+         Field("address", lambda m: m.group(1), confidence=lambda v: 0.9 if re.search(r"\d", v) else 0.6),
+         pattern=r"^for:\s*(\S.*)", at_start=True),
+    # The last amount on the management line is the customer's rate; the line also names the period
+    Rule(["management", "quarter"], Field("rate", _last_money), Field("cadence", _cadence, confidence=0.8)),
+    # Otherwise fall back to the invoice total
+    Rule(["total due"], Field("rate", _positive_money, confidence=0.5, prefer="first"),
+         pattern=r"Total due.*" + MONEY, flags=0),
+    Rule(["@"], Field("email", lambda m: None if SENDER_EMAIL.search(m.group(0)) else m.group(0), prefer="first"),
+         pattern=EMAIL, each=True, flags=0),
+]
+
+CUSTOMER_DEFAULTS = {"name": "", "address": "", "email": "", "rate": 0.0, "cadence": "monthly"}
+
+customer_extractor = Extractor(CUSTOMER_RULES, CUSTOMER_DEFAULTS)
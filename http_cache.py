@@ -0,0 +1,115 @@
+import functools
+import hashlib
+import os
+from datetime import date
+from flask import request, make_response, session as flask_session
+from models import get_data_version
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+# Identifies the deployed code in page ETags; derived from the app's files when unset
+BUILD_ID = os.getenv("VERCEL_GIT_COMMIT_SHA") or os.getenv("BUILD_ID")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_fingerprints = {}
+_build_id = None
+
+
+def build_id():
+    """
+    Short id of the code being served, so a deploy that changes templates, static files
+    or views invalidates cached pages even when the data has not changed. Without
+    BUILD_ID it hashes the names, sizes and mtimes of the app's files, which every
+    worker of a deploy agrees on.
+    """
+    global _build_id
+    if _build_id is None:
+        if BUILD_ID:
+            _build_id = BUILD_ID[:12]
+        else:
+            digest = hashlib.md5()
+            for folder, pattern in ((BASE_DIR, ".py"), (os.path.join(BASE_DIR, "templates"), ""),
+                                    (os.path.join(BASE_DIR, "static"), "")):
+                for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+                    if entry.is_file() and entry.name.endswith(pattern):
+                        stat = entry.stat()
+                        digest.update(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+            _build_id = digest.hexdigest()[:12]
+    return _build_id
+
+
+def static_fingerprint(static_folder, filename):
+    """Short content hash for a static file, recomputed only when its mtime changes."""
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.md5(f.read()).hexdigest()[:12]
+    _fingerprints[path] = (mtime, digest)
+    return digest
+
+
+def init_app(app):
+    """Fingerprint url_for('static', ...) URLs and serve fingerprinted files with long-lived cache headers."""
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            fingerprint = static_fingerprint(app.static_folder, values["filename"])
+            if fingerprint:
+                values["v"] = fingerprint
+
+    default_max_age = app.get_send_file_max_age
+
+    def get_send_file_max_age(filename):
+        # The URL changes whenever the content does, so a versioned URL can be cached forever
+        if request.endpoint == "static" and request.args.get("v"):
+            return STATIC_MAX_AGE
+        return default_max_age(filename)
+
+    app.get_send_file_max_age = get_send_file_max_age
+
+    @app.after_request
+    def mark_static_immutable(response):
+        if request.endpoint == "static" and request.args.get("v") and response.status_code == 200:
+            response.cache_control.immutable = True
+        return response
+
+
+def cached_page(name, daily=False):
+    """
+    Serve a page with a weak ETag and Last-Modified derived from the global data version
+    (and, for the ETag, the build_id, so a deploy is not answered with 304s for stale HTML).
+    If the client already has the current version, answer 304 without running the view.
+    Pages that depend on today's date (e.g. aging buckets) pass daily=True.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages carrying flash messages are one-off; never cache or revalidate them
+            if flask_session.get("_flashes"):
+                response = make_response(view(*args, **kwargs))
+                response.cache_control.no_store = True
+                return response
+
+            version, updated_at = get_data_version()
+            etag = f"{name}-{build_id()}-{version}"
+            if daily:
+                etag += f"-{date.today().isoformat()}"
+            # Only the ETag decides: Last-Modified has one-second resolution and can miss a quick second write
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = updated_at
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,141 @@
+from datetime import date
+from types import SimpleNamespace
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import selectinload
+from models import Customer, Invoice, InvoiceLine
+from reports import apply_invoices
+
+# Columns needed to keep the rollups in step with set-based changes
+ROLLUP_COLUMNS = [
+    Invoice.id, Invoice.period_label, Invoice.status, Invoice.amount, Invoice.fee_type,
+    Invoice.fee_2_type, Invoice.fee_2_amount, Invoice.fee_3_type, Invoice.fee_3_amount,
+    Invoice.additional_fee_amount,
+]
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _int_list(values, field):
+    if not isinstance(values, list):
+        raise BatchError(f"{field} must be a list")
+    try:
+        return [int(v) for v in values]
+    except (TypeError, ValueError):
+        raise BatchError(f"{field} must contain integers")
+
+
+def _parse_date(value, field):
+    if value in (None, ""):
+        return date.today()
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise BatchError(f"{field} must be YYYY-MM-DD")
+
+
+def _rollup_rows(session, ids):
+    rows = {row.id: SimpleNamespace(**row._mapping, lines=[])
+            for row in session.execute(select(*ROLLUP_COLUMNS).where(Invoice.id.in_(ids)))}
+    if rows:
+        for line in session.execute(select(InvoiceLine.invoice_id, InvoiceLine.fee_type, InvoiceLine.amount)
+                                    .where(InvoiceLine.invoice_id.in_(list(rows)))):
+            rows[line.invoice_id].lines.append(line)
+    return rows
+
+
+def generate_invoices(session, payload):
+    """Create invoices for a list of customers. Existing invoices for the same period are skipped."""
+    from invoice_generator import build_invoice_for_customer, get_period_label, load_property_fees, NO_PROPERTY_FEES
+
+    customer_ids = _int_list(payload.get("customer_ids"), "customer_ids")
+    invoice_date = _parse_date(payload.get("invoice_date"), "invoice_date")
+
+    customers = {
+        c.id: c for c in session.query(Customer).options(selectinload(Customer.fees)).filter(Customer.id.in_(customer_ids))
+    }
+    property_fees = load_property_fees(session, list(customers))
+    labels = {cid: get_period_label(invoice_date, c.cadence) for cid, c in customers.items()}
+    existing = set(session.query(Invoice.customer_id, Invoice.period_label).filter(
+        Invoice.customer_id.in_(list(customers)), Invoice.period_label.in_(set(labels.values()))
+    ))
+
+    results, created = [], []
+    for cid in customer_ids:
+        customer = customers.get(cid)
+        if customer is None:
+            results.append({"customer_id": cid, "status": "not_found"})
+        elif (cid, labels[cid]) in existing:
+            results.append({"customer_id": cid, "status": "skipped", "period_label": labels[cid]})
+        else:
+            try:
+                invoice = build_invoice_for_customer(customer, invoice_date, property_fees.get(cid, NO_PROPERTY_FEES))
+            except Exception as e:
+                results.append({"customer_id": cid, "status": "error", "error": str(e)})
+                continue
+            existing.add((cid, labels[cid]))
+            created.append(invoice)
+            results.append({"customer_id": cid, "status": "created", "invoice": invoice})
+
+    session.add_all(created)
+    apply_invoices(session, created)
+    session.flush()
+    for result in results:
+        if "invoice" in result:
+            invoice = result.pop("invoice")
+            result.update(invoice_id=invoice.id, period_label=invoice.period_label)
+    return results, created
+
+
+def mark_invoices_paid(session, payload):
+    """Mark invoices paid, one UPDATE per distinct paid date."""
+    items = payload.get("items")
+    if not isinstance(items, list):
+        raise BatchError("items must be a list of {id, paid_date}")
+    paid_dates = {}
+    for item in items:
+        if not isinstance(item, dict) or "id" not in item:
+            raise BatchError("each item needs an id")
+        paid_dates[_int_list([item["id"]], "id")[0]] = _parse_date(item.get("paid_date"), "paid_date")
+
+    current = _rollup_rows(session, list(paid_dates))
+    to_update = {iid: d for iid, d in paid_dates.items() if iid in current and current[iid].status != "Paid"}
+
+    by_date = {}
+    for iid, paid_date in to_update.items():
+        by_date.setdefault(paid_date, []).append(iid)
+    for paid_date, ids in by_date.items():
+        session.execute(
+            update(Invoice).where(Invoice.id.in_(ids)).values(status="Paid", paid_date=paid_date)
+            .execution_options(synchronize_session=False)
+        )
+
+    before = [current[iid] for iid in to_update]
+    apply_invoices(session, before, sign=-1)
+    apply_invoices(session, [SimpleNamespace(**dict(vars(row), status="Paid")) for row in before])
+
+    results = []
+    for iid, paid_date in paid_dates.items():
+        if iid not in current:
+            results.append({"id": iid, "status": "not_found"})
+        elif iid in to_update:
+            results.append({"id": iid, "status": "updated", "paid_date": paid_date.isoformat()})
+        else:
+            results.append({"id": iid, "status": "already_paid"})
+    return results
+
+
+def delete_invoices(session, payload):
+    """Delete invoices (and their fee lines) with one DELETE statement each."""
+    ids = _int_list(payload.get("ids"), "ids")
+    current = _rollup_rows(session, ids)
+    if current:
+        session.execute(
+            delete(Invoice).where(Invoice.id.in_(list(current))).execution_options(synchronize_session=False)
+        )
+        session.execute(
+            delete(InvoiceLine).where(InvoiceLine.invoice_id.in_(list(current))).execution_options(synchronize_session=False)
+        )
+        apply_invoices(session, list(current.values()), sign=-1)
+    return [{"id": iid, "status": "deleted" if iid in current else "not_found"} for iid in ids]
@@ -1,16 +1,42 @@
 import os
 import io
+import logging
+from collections import namedtuple
+from copy import deepcopy
 from datetime import date, timedelta
-from docx import Document
-from docx.shared import Pt
-from models import Invoice, SessionLocal, Customer
+from sqlalchemy import func
+from models import Invoice, InvoiceLine, ArchivedInvoice, ArchivedInvoiceLine, SessionLocal, Customer, CustomerFee, Property
+from reports import apply_invoice
+import prerender
+import template_compiler
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, "invoice_templates")
 TEMPLATE_PATH = os.path.join(TEMPLATE_DIR, "base_invoice_template.docx")
 OUTPUT_DIR = os.path.join(BASE_DIR, "generated_invoices")
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Every placeholder _generate_invoice_logic fills; template_compiler lints templates against these.
+# The line (paragraph or table row) of an empty OPTIONAL_LINE_PLACEHOLDERS one is removed,
+# and the line of REPEATED_LINE_PLACEHOLDER is repeated once per fee line item.
+OPTIONAL_LINE_PLACEHOLDERS = ("{{FEE_LINE_2}}", "{{FEE_LINE_3}}", "{{ADDITIONAL_FEE_LINE}}")
+REPEATED_LINE_PLACEHOLDER = "{{ADDITIONAL_FEE_LINE}}"
+PLACEHOLDERS = (
+    "{{CUSTOMER_NAME}}", "{{CUSTOMER_EMAIL}}",
+    "{{PROPERTY_ADDRESS}}", "{{PROPERTY_CITY}}", "{{PROPERTY_STATE}}", "{{PROPERTY_ZIP}}",
+    "{{PERIOD}}", "{{PERIOD_DATES}}", "{{AMOUNT}}", "{{INVOICE_DATE}}", "{{FEE_TYPE}}", "{{TOTAL_AMOUNT}}",
+) + OPTIONAL_LINE_PLACEHOLDERS
+
+# A customer's property fees: their sum and the (address, fee_amount) of each property with a fee
+PropertyFees = namedtuple("PropertyFees", ["total", "lines"])
+NO_PROPERTY_FEES = PropertyFees(0.0, ())
+
+# python-docx (and lxml under it) is imported on first render so that importing
+# this module stays cheap on a cold start.
+def Document(path=None):
+    from docx import Document as load_document
+    return load_document(path)
 
 def get_invoice_templates():
     """Return a list of available invoice template filenames (docx) in the invoice_templates folder."""
@@ -58,51 +84,113 @@ def get_period_label(invoice_date: date, cadence: str) -> str:
     else:
         return invoice_date.isoformat()
 
-def fill_invoice_template(doc, replacements):
-    """Replace placeholders in the document with values from replacements dict."""
-    # Define keys that need tight spacing
-    tight_spacing_keys = ["{{FEE_LINE_2}}", "{{FEE_LINE_3}}", "{{ADDITIONAL_FEE_LINE}}"]
+def fill_invoice_template(doc, replacements, paragraphs=None):
+    """
+    Replace placeholders in the document with values from replacements dict.
+    Only `paragraphs` are searched if given (the template manifest's); by default
+    every paragraph and table cell is.
+    """
+    from docx.shared import Pt
 
-    for p in doc.paragraphs:
+    if paragraphs is None:
+        paragraphs = list(doc.paragraphs)
+        for table in doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    paragraphs.extend(cell.paragraphs)
+
+    for p in paragraphs:
+        # Reading p.text walks the paragraph's XML, so read and write it once
+        text = p.text
         replaced = False
         for old, new in replacements.items():
-            if old in p.text:
-                p.text = p.text.replace(old, str(new))
+            if old in text:
+                text = text.replace(old, str(new))
                 replaced = True
                 # Apply standard spacing (12pt) if it's a fee line
-                if old in tight_spacing_keys:
+                if old in OPTIONAL_LINE_PLACEHOLDERS:
                     p.paragraph_format.space_after = Pt(12)
                     p.paragraph_format.line_spacing = 1.0
         if replaced:
+            p.text = text
             for run in p.runs:
                 run.font.name = 'Calibri'
                 run.font.size = Pt(14)
-    
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    replaced = False
-                    for old, new in replacements.items():
-                        if old in p.text:
-                            p.text = p.text.replace(old, str(new))
-                            replaced = True
-                            # Apply standard spacing (12pt) if it's a fee line
-                            if old in tight_spacing_keys:
-                                p.paragraph_format.space_after = Pt(12)
-                                p.paragraph_format.line_spacing = 1.0
-                    if replaced:
-                        for run in p.runs:
-                            run.font.name = 'Calibri'
-                            run.font.size = Pt(14)
-
-def _generate_invoice_logic(customer, invoice_date, period_label, period_dates, amount, return_buffer=True, **kwargs):
+
+def customer_fee_lines(customer):
+    """The customer's fees as (fee_type, amount) lines; queried if they weren't loaded with the customer."""
+    if "fees" in vars(customer):
+        return [(fee.fee_type, fee.amount) for fee in customer.fees]
+    session = SessionLocal()
+    try:
+        return [tuple(row) for row in session.query(CustomerFee.fee_type, CustomerFee.amount)
+                .filter(CustomerFee.customer_id == customer.id).order_by(CustomerFee.position)]
+    finally:
+        session.close()
+
+def load_property_fees(session, customer_ids):
+    """
+    {customer_id: PropertyFees} for the given customers (a list or a subquery of ids),
+    read in one query; customers without property fees are left out.
+    """
+    total = func.sum(Property.fee_amount).over(partition_by=Property.customer_id)
+    rows = session.query(Property.customer_id, Property.address, Property.fee_amount, total).filter(
+        Property.customer_id.in_(customer_ids), Property.fee_amount != 0
+    ).order_by(Property.customer_id, Property.id)
+    fees = {}
+    for customer_id, address, fee_amount, customer_total in rows:
+        if customer_id not in fees:
+            fees[customer_id] = PropertyFees(customer_total, [])
+        fees[customer_id].lines.append((address, fee_amount))
+    return fees
+
+def load_invoice_lines(session, invoice_ids, line_model=InvoiceLine):
+    """{invoice_id: [(fee_type, amount), ...]} for the given invoices, read in one query."""
+    lines = {invoice_id: [] for invoice_id in invoice_ids}
+    rows = session.query(line_model.invoice_id, line_model.fee_type, line_model.amount).filter(
+        line_model.invoice_id.in_(invoice_ids)).order_by(line_model.invoice_id, line_model.position)
+    for invoice_id, fee_type, amount in rows:
+        lines[invoice_id].append((fee_type, amount))
+    return lines
+
+def property_fees_of(customer):
+    """PropertyFees of one customer, from its properties if they are loaded, else with a query."""
+    if "properties" in vars(customer):
+        lines = [(p.address, p.fee_amount) for p in customer.properties if p.fee_amount]
+        return PropertyFees(sum(fee_amount for _, fee_amount in lines), lines)
+    session = SessionLocal()
+    try:
+        return load_property_fees(session, [customer.id]).get(customer.id, NO_PROPERTY_FEES)
+    finally:
+        session.close()
+
+def _repeat_line(paragraph, line, count):
+    """
+    Insert count - 1 copies of a placeholder's line (its paragraph or table row) after it,
+    and return the paragraph holding the placeholder in each, the original first.
+    """
+    from docx.oxml.ns import qn
+    from docx.text.paragraph import Paragraph
+
+    index = list(line.iter(qn("w:p"))).index(paragraph._p)
+    paragraphs, previous = [paragraph], line
+    for _ in range(count - 1):
+        copy = deepcopy(line)
+        previous.addnext(copy)
+        previous = copy
+        paragraphs.append(Paragraph(list(copy.iter(qn("w:p")))[index], paragraph._parent))
+    return paragraphs
+
+def _generate_invoice_logic(customer, invoice_date, period_label, period_dates, amount, return_buffer=True, lines=None,
+                            property_fees=None, **kwargs):
     """
     Shared logic to generate an invoice.
     If return_buffer is True, returns (filename, BytesIO_object).
     If return_buffer is False, saves to file and returns (filename, full_path).
     DEFAULT IS TRUE FOR VERCEL CLOUD COMPATIBILITY (read-only filesystem).
-    
+
+    lines is the invoice's (fee_type, amount) fee lines; by default the customer's fees.
+    property_fees is the customer's PropertyFees, preloaded by batch callers with load_property_fees.
     kwargs can contain:
     - fee_2_type, fee_2_amount
     - fee_3_type, fee_3_amount
@@ -111,10 +199,10 @@ def _generate_invoice_logic(customer, invoice_date, period_label, period_dates,
     try:
         doc = Document(TEMPLATE_PATH)
         
-        print(f"DEBUG: Generator Logic Called. Kwargs: {kwargs}")
-        if kwargs:
-            print(f"DEBUG: Using kwargs. fee_2_amount={kwargs.get('fee_2_amount')}, additional={kwargs.get('additional_fee_amount')}")
-        
+        logger.debug("rendering invoice", extra={
+            "customer_id": customer.id, "period_label": period_label, "override_fields": sorted(kwargs),
+        })
+
         if kwargs:
             # Manual generation: use provided values (even if None)
             fee_2_type = kwargs.get('fee_2_type')
@@ -131,6 +219,10 @@ def _generate_invoice_logic(customer, invoice_date, period_label, period_dates,
             fee_3_amount = customer.fee_3_rate
             additional_fee_desc = customer.additional_fee_desc
             additional_fee_amount = customer.additional_fee_amount
+        if lines is None:
+            lines = customer_fee_lines(customer)
+        if property_fees is None:
+            property_fees = property_fees_of(customer)
         
         # Calculate total amount including all fees
         # Start with base rate
@@ -147,13 +239,12 @@ def _generate_invoice_logic(customer, invoice_date, period_label, period_dates,
         # Add Additional Fee
         if additional_fee_amount:
             total_amount += additional_fee_amount
+
+        # Add the fee lines
+        total_amount += sum(line_amount for _, line_amount in lines)
             
         # Add Property Fees
-        property_fees_total = 0
-        for prop in customer.properties:
-            if prop.fee_amount:
-                property_fees_total += prop.fee_amount
-        total_amount += property_fees_total
+        total_amount += property_fees.total
         
         
         # Build complete fee lines (or empty strings if not used)
@@ -171,18 +262,16 @@ def _generate_invoice_logic(customer, invoice_date, period_label, period_dates,
             f3_type = fee_3_type or "Fee"
             fee_line_3 = f"{period_label} {f3_type} ({period_dates}) = ${fee_3_amount:,.2f}"
         
-        # Build additional fee line
-        additional_fee_parts = []
+        # Build the fee line items; each gets its own copy of the additional fee line
+        additional_fee_parts = [
+            f"{period_label} {fee_type} ({period_dates}) = ${line_amount:,.2f}" for fee_type, line_amount in lines if line_amount
+        ]
         if additional_fee_amount:
              additional_fee_parts.append(f"{additional_fee_desc} = ${additional_fee_amount:,.2f}")
         
         # Append property fees
-        if customer.properties:
-            for prop in customer.properties:
-                if prop.fee_amount:
-                    additional_fee_parts.append(f"Management Fee ({prop.address}) = ${prop.fee_amount:,.2f}")
-        
-        additional_fee_line = "\n\n".join(additional_fee_parts)
+        for address, fee_amount in property_fees.lines:
+            additional_fee_parts.append(f"Management Fee ({address}) = ${fee_amount:,.2f}")
         
         replacements = {
             "{{CUSTOMER_NAME}}": customer.name,
@@ -200,52 +289,36 @@ def _generate_invoice_logic(customer, invoice_date, period_label, period_dates,
             # Complete fee lines - these replace the entire row content
             "{{FEE_LINE_2}}": fee_line_2,
             "{{FEE_LINE_3}}": fee_line_3,
-            "{{ADDITIONAL_FEE_LINE}}": additional_fee_line,
+            "{{ADDITIONAL_FEE_LINE}}": additional_fee_parts[0] if additional_fee_parts else "",
         }
 
-        # Remove rows with empty fee lines to eliminate whitespace
-        rows_to_remove = []
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    # Check if this row contains an empty fee line placeholder
-                    if ("{{FEE_LINE_2}}" in cell.text and not fee_line_2) or \
-                       ("{{FEE_LINE_3}}" in cell.text and not fee_line_3) or \
-                       ("{{ADDITIONAL_FEE_LINE}}" in cell.text and not additional_fee_line):
-                        rows_to_remove.append((table._tbl, row._tr))
-                        break
-        
-        # Remove the rows
-        for tbl, tr in rows_to_remove:
-            tbl.remove(tr)
-        # Remove paragraphs containing empty fee line placeholders BEFORE replacement
-        # This preserves intentional spacing while removing only unused fee lines
-        paragraphs_to_remove = []
-        for paragraph in doc.paragraphs:
-            text = paragraph.text.strip()
-            # Only remove if it contains a fee line placeholder that will be empty
-            if ("{{FEE_LINE_2}}" in text and not fee_line_2) or \
-               ("{{FEE_LINE_3}}" in text and not fee_line_3) or \
-               ("{{ADDITIONAL_FEE_LINE}}" in text and not additional_fee_line):
-                paragraphs_to_remove.append(paragraph)
-        
-        # Remove the specific fee line paragraphs
-        for paragraph in paragraphs_to_remove:
-            p = paragraph._element
-            p.getparent().remove(p)
+        # The placeholder paragraphs come from the template manifest. They are looked up
+        # before anything is removed, while the recorded positions still hold.
+        try:
+            located = template_compiler.locate(doc, template_compiler.placeholder_paragraphs(TEMPLATE_PATH))
+        except IndexError:
+            # The document doesn't match the manifest (the template changed under us)
+            located = template_compiler.locate(doc, template_compiler.scan(doc))
 
-        fill_invoice_template(doc, replacements)
-        
-        # Add property fees as dynamic rows if they exist
-        # This is tricky with python-docx if we don't have a specific placeholder row to clone.
-        # For now, we will just ensure the total is correct. 
-        # If the user wants property fees listed, we'd need a more complex template logic.
-        # Given the constraints, let's assume the "Additional Fee" or similar might be used, 
-        # OR we just accept that they are summed in the total but not itemized unless we add more logic.
-        # WAIT: The user asked for "ability to add a fee when adding a property".
-        # Ideally this should be itemized.
-        # Let's try to append them to the table if possible, or just leave as is for now and verify total.
-        # Since I can't easily clone rows without a reference, I'll stick to the total for now.
+        # Remove the lines (paragraphs or table rows) of empty fee line placeholders
+        # to eliminate whitespace, keeping intentional spacing elsewhere
+        empty_lines = {name for name in OPTIONAL_LINE_PLACEHOLDERS if not replacements[name]}
+        removed = set()
+        for paragraph, line, names in located:
+            if empty_lines.intersection(names) and line not in removed:
+                line.getparent().remove(line)
+                removed.add(line)
+
+        # Copy the additional fee line for every further line item, before it is filled
+        repeated = []
+        for paragraph, line, names in located:
+            if REPEATED_LINE_PLACEHOLDER in names and line not in removed:
+                repeated = _repeat_line(paragraph, line, len(additional_fee_parts))[1:]
+                break
+
+        fill_invoice_template(doc, replacements, [p for p, line, _ in located if line not in removed])
+        for paragraph, text in zip(repeated, additional_fee_parts[1:]):
+            fill_invoice_template(doc, {REPEATED_LINE_PLACEHOLDER: text}, [paragraph])
 
         # Calculate street name (remove number)
         address_parts = customer.property_address.split(' ', 1)
@@ -266,12 +339,13 @@ def _generate_invoice_logic(customer, invoice_date, period_label, period_dates,
             buffer.seek(0)
             return filename, buffer, total_amount
         else:
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
             output_path = os.path.join(OUTPUT_DIR, filename)
             doc.save(output_path)
             return filename, output_path, total_amount
 
     except Exception as e:
-        print(f"Error generating invoice: {e}")
+        logger.exception("invoice render failed", extra={"customer_id": customer.id, "period_label": period_label})
         raise e
 
 def generate_invoice_with_template(customer, invoice_date, template_name, **kwargs):
@@ -283,8 +357,10 @@ def generate_invoice_with_template(customer, invoice_date, template_name, **kwar
         start_date, end_date = get_period_dates(invoice_date, customer.cadence)
         period_dates = f"{start_date.strftime('%m/%d/%Y')} - {end_date.strftime('%m/%d/%Y')}"
         
+        lines = customer_fee_lines(customer)
+
         # Generate invoice in-memory
-        filename, buffer, total_amount = _generate_invoice_logic(customer, invoice_date, period_label, period_dates, amount, **kwargs)
+        filename, buffer, total_amount = _generate_invoice_logic(customer, invoice_date, period_label, period_dates, amount, lines=lines, **kwargs)
         
         # Create email content
         fee_type_text = getattr(customer, "fee_type", "Management Fee") or "Management Fee"
@@ -329,29 +405,41 @@ def generate_invoice_with_template(customer, invoice_date, template_name, **kwar
             file_path=filename,
             email_subject=subject,
             email_body=body,
+            fee_type=fee_type_text,
             # Save extra fees if provided
             fee_2_type=kwargs.get("fee_2_type"),
             fee_2_amount=kwargs.get("fee_2_amount"),
             fee_3_type=kwargs.get("fee_3_type"),
             fee_3_amount=kwargs.get("fee_3_amount"),
             additional_fee_desc=kwargs.get("additional_fee_desc"),
-            additional_fee_amount=kwargs.get("additional_fee_amount")
+            additional_fee_amount=kwargs.get("additional_fee_amount"),
+            lines=_invoice_lines(lines),
         )
         session.add(invoice_record)
+        apply_invoice(session, invoice_record)
+        session.flush()
+        invoice_id = invoice_record.id
         session.commit()
+        prerender.schedule([invoice_id])
         
         return invoice_record
     finally:
         session.close()
 
-def generate_invoice_for_customer(customer, invoice_date):
+def _invoice_lines(lines):
+    return [InvoiceLine(fee_type=fee_type, amount=amount, position=n) for n, (fee_type, amount) in enumerate(lines)]
+
+def build_invoice_for_customer(customer, invoice_date, property_fees=None):
+    """Render the invoice with the customer's default fees and return an unsaved Invoice record."""
     period_label = get_period_label(invoice_date, customer.cadence)
     start_date, end_date = get_period_dates(invoice_date, customer.cadence)
     period_dates = f"{start_date.strftime('%m/%d/%Y')} - {end_date.strftime('%m/%d/%Y')}"
     amount = customer.rate
+    lines = customer_fee_lines(customer)
     
     # Generate invoice in-memory (don't write to disk - Vercel is read-only)
-    filename, buffer, total_amount = _generate_invoice_logic(customer, invoice_date, period_label, period_dates, amount)
+    filename, buffer, total_amount = _generate_invoice_logic(customer, invoice_date, period_label, period_dates, amount,
+                                                             lines=lines, property_fees=property_fees)
 
     fee_type_text = getattr(customer, "fee_type", "Management Fee") or "Management Fee"
     subject = f"Invoice – {period_label} – {customer.property_address}"
@@ -370,37 +458,62 @@ def generate_invoice_for_customer(customer, invoice_date):
         file_path=filename, # Store filename only for cloud compatibility
         email_subject=subject,
         email_body=body,
+        fee_type=fee_type_text,
         # Save fee details so they persist for regeneration
         fee_2_type=customer.fee_2_type,
         fee_2_amount=customer.fee_2_rate,
         fee_3_type=customer.fee_3_type,
         fee_3_amount=customer.fee_3_rate,
         additional_fee_desc=customer.additional_fee_desc,
-        additional_fee_amount=customer.additional_fee_amount
+        additional_fee_amount=customer.additional_fee_amount,
+        lines=_invoice_lines(lines),
     )
-    
+    return invoice
+
+def generate_invoice_for_customer(customer, invoice_date, property_fees=None):
+    invoice = build_invoice_for_customer(customer, invoice_date, property_fees)
+
     session = SessionLocal()
     session.add(invoice)
+    apply_invoice(session, invoice)
+    session.flush()
+    invoice_id = invoice.id
     session.commit()
     session.close()
+    prerender.schedule([invoice_id])
     
     return invoice
 
-def generate_invoice_buffer(invoice):
+def generate_invoice_buffer(invoice, property_fees=None, customer=None, lines=None):
     """
     Regenerates the invoice document in-memory for a given Invoice record.
+    Results are cached by content fingerprint, so repeat downloads (and invoices
+    already warmed by prerender) skip the render. Callers rendering many invoices
+    pass each customer's property_fees from one load_property_fees call, and may
+    pass the customer and the invoice's lines (from load_invoice_lines) as well,
+    in which case nothing is queried here.
     """
-    session = SessionLocal()
-    customer = session.query(Customer).get(invoice.customer_id)
-    
-    # Eagerly load properties to avoid lazy loading issues after session close
-    if customer and customer.properties:
-        _ = list(customer.properties)  # Force load
-    
-    session.close()
-    
+    if customer is None or property_fees is None or lines is None:
+        session = SessionLocal()
+        try:
+            if customer is None:
+                customer = session.query(Customer).get(invoice.customer_id)
+            if property_fees is None:
+                property_fees = load_property_fees(session, [invoice.customer_id]).get(invoice.customer_id, NO_PROPERTY_FEES)
+            if lines is None:
+                line_model = ArchivedInvoiceLine if isinstance(invoice, ArchivedInvoice) else InvoiceLine
+                lines = load_invoice_lines(session, [invoice.id], line_model)[invoice.id]
+        finally:
+            session.close()
+
     if not customer:
         raise ValueError("Customer not found")
+
+    key = prerender.render_fingerprint(invoice, customer, lines, property_fees)
+    cached = prerender.render_cache.get(key)
+    if cached:
+        filename, data = cached
+        return filename, io.BytesIO(data)
         
     # Reconstruct parameters
     # Note: In a real app, we might want to store period_dates in the Invoice model too.
@@ -417,6 +530,8 @@ def generate_invoice_buffer(invoice):
         period_dates, 
         invoice.amount, 
         return_buffer=True,
+        lines=lines,
+        property_fees=property_fees,
         fee_2_type=invoice.fee_2_type,
         fee_2_amount=invoice.fee_2_amount,
         fee_3_type=invoice.fee_3_type,
@@ -424,4 +539,5 @@ def generate_invoice_buffer(invoice):
         additional_fee_desc=invoice.additional_fee_desc,
         additional_fee_amount=invoice.additional_fee_amount
     )
+    prerender.render_cache.put(key, filename, buffer.getvalue())
     return filename, buffer
@@ -0,0 +1,159 @@
+"""
+In-process progress events for long-running jobs (daily billing, seeding).
+
+A job is a function taking a JobRun; it reports with run.emit(kind, **data).
+Anyone can follow a run through JobRun.stream(), which replays past events and
+then waits for new ones. That is what the /jobs/<run_id>/events SSE endpoint serves.
+Stopping a run sets a flag; the job's next emit() raises JobCancelled, so jobs
+stop between items and never mid-write.
+
+Runs live in memory in the process that started them. On a multi-process
+deployment the events endpoint only sees runs started by the same process.
+"""
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict, deque
+from job_lease import job_lease
+
+MAX_EVENTS_PER_RUN = 5000  # older events are dropped from the replay buffer
+MAX_RUNS = 20
+
+logger = logging.getLogger(__name__)
+
+_runs = OrderedDict()
+_runs_lock = threading.Lock()
+
+
+class JobCancelled(BaseException):
+    """Raised from emit() after a stop request. A BaseException so a job's own `except Exception` can't swallow it."""
+
+
+class JobRun:
+    def __init__(self, name, lease=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.lease = lease
+        self.events = deque(maxlen=MAX_EVENTS_PER_RUN)
+        self.status = "running"
+        self.cancel_requested = False
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def emit(self, kind, **data):
+        """Record an event. Raises JobCancelled if a stop was requested."""
+        if self.cancel_requested:
+            raise JobCancelled()
+        self._append(kind, data)
+        if kind == "progress" and self.lease is not None:
+            self.lease.progress(data.get("done", 0), data.get("total"))
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def finish(self, kind, **data):
+        """Record the final event (finished, failed or cancelled) and wake all followers."""
+        with self._cond:
+            self.status = kind
+            self._append(kind, data)
+
+    @property
+    def finished(self):
+        return self.status != "running"
+
+    def _append(self, kind, data):
+        with self._cond:
+            self._seq += 1
+            self.events.append((self._seq, kind, data))
+            self._cond.notify_all()
+
+    def stream(self, after=0, heartbeat=15):
+        """
+        Yield (seq, kind, data) for events after `after`, waiting for new ones until
+        the run finishes. Yields None every `heartbeat` seconds of silence.
+        """
+        while True:
+            with self._cond:
+                pending = [e for e in self.events if e[0] > after]
+                if not pending and not self.finished:
+                    self._cond.wait(heartbeat)
+                    pending = [e for e in self.events if e[0] > after]
+                done = self.finished
+            if not pending and not done:
+                yield None
+            for event in pending:
+                after = event[0]
+                yield event
+            if done and not pending:
+                return
+
+    def describe(self):
+        return {"run_id": self.id, "job": self.name, "status": self.status, "events": self._seq}
+
+
+def sse_format(event):
+    if event is None:
+        return ": keep-alive\n\n"
+    seq, kind, data = event
+    return f"id: {seq}\nevent: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def describe_event(kind, data):
+    """One line of plain text for an event, for non-streaming callers and the CLI."""
+    if "message" in data:
+        return data["message"]
+    details = ", ".join(f"{k}={v}" for k, v in data.items())
+    return f"{kind}: {details}" if details else kind
+
+
+def get_run(run_id):
+    with _runs_lock:
+        return _runs.get(run_id)
+
+
+def find_running(name):
+    """The most recent unfinished run of job `name` started by this process, if any."""
+    with _runs_lock:
+        runs = list(_runs.values())
+    for run in reversed(runs):
+        if run.name == name and not run.finished:
+            return run
+    return None
+
+
+def _register(run):
+    with _runs_lock:
+        _runs[run.id] = run
+        while len(_runs) > MAX_RUNS:
+            _runs.popitem(last=False)
+
+
+def _execute(run, target, lease_cm):
+    try:
+        result = target(run)
+        run.finish("finished", **(result or {}))
+    except JobCancelled:
+        run.finish("cancelled")
+    except Exception as e:
+        logger.exception("job failed", extra={"job": run.name, "run_id": run.id})
+        run.finish("failed", error=str(e))
+    finally:
+        lease_cm.__exit__(None, None, None)
+
+
+def start_job(name, target, background=True):
+    """
+    Take the job's lease and run target(run). Raises job_lease.JobAlreadyRunning if the
+    job is already running anywhere. In the background the call returns immediately;
+    otherwise it returns once the run has finished.
+    """
+    lease_cm = job_lease(name)
+    lease = lease_cm.__enter__()
+    run = JobRun(name, lease)
+    _register(run)
+    if background:
+        threading.Thread(target=_execute, args=(run, target, lease_cm), name=f"job-{name}", daemon=True).start()
+    else:
+        _execute(run, target, lease_cm)
+    return run
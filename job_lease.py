@@ -0,0 +1,158 @@
+"""
+Database-backed mutex for maintenance jobs (daily billing, seeding, clearing invoices).
+
+On PostgreSQL a job holds a session-level advisory lock for its whole run, so a
+crashed worker gives it up as soon as its connection drops. On SQLite a row in
+job_leases with an expiry is the lock; a worker that dies without releasing it
+blocks others only until the lease expires. In both cases the row carries the
+job's progress, so a second caller can be told how far the running job has got.
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import or_, text
+from sqlalchemy.exc import IntegrityError
+from models import engine, JobLease
+
+JOB_LEASE_TTL = int(os.getenv("JOB_LEASE_TTL", "900"))  # seconds; extended on every progress update
+PROGRESS_INTERVAL = 1.0  # minimum seconds between progress writes
+
+logger = logging.getLogger(__name__)
+leases = JobLease.__table__
+
+
+class JobAlreadyRunning(Exception):
+    def __init__(self, name, status):
+        super().__init__(f"{name} is already running")
+        self.name = name
+        self.status = status
+
+
+class Lease:
+    """Handle given to the running job for reporting progress (which also renews the lease)."""
+
+    def __init__(self, name, owner, ttl):
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self._last_write = 0.0
+
+    def progress(self, done, total=None, message=None):
+        now = time.monotonic()
+        finished = total is not None and done >= total
+        if now - self._last_write < PROGRESS_INTERVAL and not finished:
+            return
+        self._last_write = now
+        utcnow = datetime.utcnow()
+        with engine.begin() as conn:
+            result = conn.execute(
+                leases.update()
+                .where(leases.c.name == self.name, leases.c.owner == self.owner)
+                .values(done=done, total=total, message=message, heartbeat_at=utcnow,
+                        expires_at=utcnow + timedelta(seconds=self.ttl))
+            )
+        if result.rowcount == 0:
+            logger.warning("job lease lost", extra={"job": self.name})
+
+    def renew(self):
+        """Push the expiry out by another ttl; False if the lease has been lost to someone else."""
+        with engine.begin() as conn:
+            result = conn.execute(
+                leases.update()
+                .where(leases.c.name == self.name, leases.c.owner == self.owner)
+                .values(heartbeat_at=datetime.utcnow(), expires_at=datetime.utcnow() + timedelta(seconds=self.ttl))
+            )
+        return result.rowcount > 0
+
+    def release(self):
+        _release(self.name, self.owner)
+
+
+def _new_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _claim(name, owner, ttl, force=False):
+    """Take the lease row if it is free or expired (or unconditionally when force is set)."""
+    now = datetime.utcnow()
+    values = dict(owner=owner, started_at=now, heartbeat_at=now, expires_at=now + timedelta(seconds=ttl),
+                  finished_at=None, done=0, total=None, message=None)
+    stmt = leases.update().where(leases.c.name == name)
+    if not force:
+        stmt = stmt.where(or_(leases.c.owner.is_(None), leases.c.expires_at < now))
+    with engine.begin() as conn:
+        if conn.execute(stmt.values(**values)).rowcount:
+            return True
+    try:
+        with engine.begin() as conn:
+            conn.execute(leases.insert().values(name=name, **values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def _release(name, owner):
+    with engine.begin() as conn:
+        conn.execute(
+            leases.update()
+            .where(leases.c.name == name, leases.c.owner == owner)
+            .values(owner=None, expires_at=None, finished_at=datetime.utcnow())
+        )
+
+
+def get_job_status(name):
+    """Return the job's lease row as a dict (None if the job has never run)."""
+    with engine.connect() as conn:
+        row = conn.execute(leases.select().where(leases.c.name == name)).first()
+    if row is None:
+        return None
+    status = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row._mapping.items()}
+    status["running"] = row.owner is not None and row.expires_at is not None and row.expires_at >= datetime.utcnow()
+    return status
+
+
+@contextmanager
+def job_lease(name, ttl=JOB_LEASE_TTL):
+    """
+    Run the body only if no one else is running job `name`; otherwise raise
+    JobAlreadyRunning carrying the current holder's status.
+    """
+    owner = _new_owner()
+    lock_conn = None
+    if engine.dialect.name == "postgresql":
+        key = zlib.crc32(f"job:{name}".encode())
+        lock_conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": key}).scalar():
+            lock_conn.close()
+            raise JobAlreadyRunning(name, get_job_status(name))
+
+    try:
+        # With the advisory lock held the row is ours even if a dead worker left it unexpired
+        if not _claim(name, owner, ttl, force=lock_conn is not None):
+            raise JobAlreadyRunning(name, get_job_status(name))
+        try:
+            yield Lease(name, owner, ttl)
+        finally:
+            _release(name, owner)
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": key})
+            lock_conn.close()
+
+
+def try_lease(name, ttl=JOB_LEASE_TTL):
+    """
+    Claim job `name` without a context manager, for holders that keep it far longer
+    than one run (the scheduler's leader). Returns a Lease that must be renewed within
+    ttl seconds and released when done, or None if someone else holds it. Uses the
+    expiring row on every database, so a holder that stops renewing loses it.
+    """
+    owner = _new_owner()
+    if not _claim(name, owner, ttl):
+        return None
+    return Lease(name, owner, ttl)
@@ -0,0 +1,225 @@
+"""
+Analyze the Vercel log exports in log/: per-route latency percentiles, memory
+high-water marks, error rates and cold starts.
+
+    python log_analytics.py                    # every log/*.csv
+    python log_analytics.py exports/*.csv --json
+    python log_analytics.py --top 10
+
+Vercel writes several rows per request: a summary row with the response status,
+durationMs, maxMemoryUsed and instanceId, and a row for each message the
+function logged (durationMs -1). Messages such as tracebacks span several lines
+inside one quoted CSV field.
+
+Exports overlap, so a row can appear in several files. Each export is sorted
+newest first, so the files are merged by timestamp and a duplicate always comes
+right after its twin. Deduplication only remembers the rows of the current
+millisecond, and percentiles come from histograms with 3 significant digits, so
+memory stays bounded however large the exports are. Rows are keyed by requestId
+and timestampInMs plus status, level and message: a request's access log line
+and its traceback are often logged in the same millisecond.
+
+A cold start is the first request an instance served within the exports.
+Requests that failed before an instance came up ("Error importing app.py") have
+no instanceId and count as failed cold starts.
+"""
+import argparse
+import csv
+import glob
+import heapq
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "log")
+
+ID_SEGMENT = re.compile(r"(?<=/)\d+(?=/|$)")
+
+csv.field_size_limit(sys.maxsize)  # tracebacks can exceed the 128 KiB default
+
+
+def iter_export(path):
+    """(timestampInMs, row dict) for each row of one export, checking it is sorted newest first."""
+    previous = None
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            ts = int(row["timestampInMs"])
+            if previous is not None and ts > previous:
+                raise ValueError(f"{path} is not sorted newest first (row at {row['TimeUTC']})")
+            previous = ts
+            yield ts, row
+
+
+def iter_rows(paths):
+    """Rows of all exports, newest first, without the duplicates of overlapping exports."""
+    merged = heapq.merge(*(iter_export(p) for p in paths), key=lambda item: -item[0])
+    current, seen = None, set()
+    for ts, row in merged:
+        if ts != current:
+            current, seen = ts, set()
+        key = (row["requestId"], row["responseStatusCode"], row["level"], row["message"])
+        if key in seen:
+            continue
+        seen.add(key)
+        yield row
+
+
+def route_of(request_path):
+    """'host.vercel.app/invoices/49/download' -> '/invoices/<id>/download'"""
+    path = "/" + request_path.split("/", 1)[1] if "/" in request_path else "/"
+    return ID_SEGMENT.sub("<id>", path)
+
+
+class Histogram:
+    """Counts of values rounded down to 3 significant digits: a bounded size, and percentiles within 1%."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.count = 0
+        self.max = None
+
+    def add(self, value):
+        scale = 10 ** max(len(str(value)) - 3, 0)
+        self.counts[value // scale * scale] += 1
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * q // 100))  # nearest rank
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen >= rank:
+                return value
+        return self.max
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.status = Counter()  # "2xx", "3xx", ...
+        self.duration = Histogram()
+        self.memory = Histogram()
+        self.memory_size = 0
+        self.cold_starts = 0
+        self.failed_starts = 0
+
+    def add(self, row):
+        self.requests += 1
+        self.status[row["responseStatusCode"][0] + "xx"] += 1
+        self.duration.add(int(row["durationMs"]))
+        memory = int(row["maxMemoryUsed"])
+        if memory >= 0:
+            self.memory.add(memory)
+        self.memory_size = max(self.memory_size, int(row["memorySize"]))
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.status.update(other.status)
+        for mine, theirs in ((self.duration, other.duration), (self.memory, other.memory)):
+            mine.counts.update(theirs.counts)
+            mine.count += theirs.count
+            if theirs.max is not None:
+                mine.max = theirs.max if mine.max is None else max(mine.max, theirs.max)
+        self.memory_size = max(self.memory_size, other.memory_size)
+        self.cold_starts += other.cold_starts
+        self.failed_starts += other.failed_starts
+
+    def rate(self, count):
+        return count / self.requests if self.requests else 0.0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "p50_ms": self.duration.percentile(50),
+            "p95_ms": self.duration.percentile(95),
+            "p99_ms": self.duration.percentile(99),
+            "max_ms": self.duration.max,
+            "memory_p95_mb": self.memory.percentile(95),
+            "memory_max_mb": self.memory.max,
+            "memory_size_mb": self.memory_size,
+            "status": dict(sorted(self.status.items())),
+            "error_rate": self.rate(self.status["5xx"]),
+            "client_error_rate": self.rate(self.status["4xx"]),
+            "cold_starts": self.cold_starts,
+            "cold_start_rate": self.rate(self.cold_starts),
+            "failed_starts": self.failed_starts,
+        }
+
+
+def analyze(rows):
+    """{route: RouteStats} from the summary rows of deduplicated export rows."""
+    routes = {}
+    first_request = {}  # instanceId -> route of its earliest request
+    for row in rows:
+        if row["durationMs"] == "-1":
+            continue
+        route = route_of(row["requestPath"])
+        stats = routes.get(route)
+        if stats is None:
+            stats = routes[route] = RouteStats()
+        stats.add(row)
+        instance = row["instanceId"]
+        if not instance:
+            stats.failed_starts += 1
+            continue
+        # Rows arrive newest first, so the last one seen per instance is its first request
+        first_request[instance] = route
+    for route in first_request.values():
+        routes[route].cold_starts += 1
+    return routes
+
+
+def report(routes, top=None, out=None):
+    out = out or sys.stdout
+    total = RouteStats()
+    for stats in routes.values():
+        total.merge(stats)
+    ordered = sorted(routes.items(), key=lambda item: -item[1].requests)[:top]
+
+    def ms(value):
+        return "-" if value is None else str(value)
+
+    header = f"{'route':<28} {'reqs':>6} {'p50':>6} {'p95':>6} {'p99':>6} {'max':>6} {'mem':>5} {'5xx':>6} {'4xx':>6} {'cold':>6} {'fail':>5}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for route, stats in ordered + [("(all)", total)]:
+        print(f"{route[:28]:<28} {stats.requests:>6} {ms(stats.duration.percentile(50)):>6} "
+              f"{ms(stats.duration.percentile(95)):>6} {ms(stats.duration.percentile(99)):>6} "
+              f"{ms(stats.duration.max):>6} {ms(stats.memory.max):>5} "
+              f"{stats.rate(stats.status['5xx']):>6.1%} {stats.rate(stats.status['4xx']):>6.1%} "
+              f"{stats.rate(stats.cold_starts):>6.1%} {stats.failed_starts:>5}", file=out)
+    print(f"\nLatency in ms; mem is the peak maxMemoryUsed in MB of {total.memory_size or '?'} MB; "
+          f"cold is the share of requests that started an instance, fail the requests whose start crashed.", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="export files (default: log/*.csv)")
+    parser.add_argument("--json", action="store_true", help="print the stats as JSON")
+    parser.add_argument("--top", type=int, help="only the N busiest routes")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(glob.glob(os.path.join(LOG_DIR, "*.csv")))
+    if not paths:
+        parser.error("no log exports found")
+    try:
+        routes = analyze(iter_rows(paths))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.json:
+        json.dump({route: stats.as_dict() for route, stats in sorted(routes.items())}, sys.stdout, indent=2)
+        print()
+    else:
+        report(routes, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
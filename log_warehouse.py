@@ -0,0 +1,273 @@
+"""
+Local SQLite warehouse of the Vercel log exports, for questions that would
+otherwise re-parse every CSV in log/.
+
+    python log_warehouse.py ingest                      # new exports in log/
+    python log_warehouse.py latency --deployment dpl_5dQti4BBGKZvrF2E9ePHdBoghnd4
+    python log_warehouse.py errors --since 24h
+    python log_warehouse.py deployments
+
+Ingesting skips exports already loaded (by content hash) and adds only rows not
+yet stored: one row per request in `requests` (keyed by request id, from the
+export's summary row) and the messages each request logged in `messages`.
+Requests are indexed by timestamp, route, status and deployment, so the queries
+read an index range instead of scanning the table.
+
+--since and --until take a duration back from now (90m, 24h, 7d) or a date
+(2025-11-21, UTC).
+"""
+import argparse
+import csv
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from log_analytics import LOG_DIR, route_of
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WAREHOUSE_PATH = os.path.join(BASE_DIR, "log_warehouse.db")
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    requests_added INTEGER NOT NULL,
+    messages_added INTEGER NOT NULL,
+    ingested_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS requests (
+    request_id TEXT PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    path TEXT NOT NULL,
+    method TEXT,
+    status INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    memory_mb INTEGER,
+    memory_size_mb INTEGER,
+    deployment_id TEXT,
+    instance_id TEXT,
+    region TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS requests_ts ON requests (ts);
+CREATE INDEX IF NOT EXISTS requests_route ON requests (route, duration_ms);
+CREATE INDEX IF NOT EXISTS requests_status ON requests (status, ts);
+CREATE INDEX IF NOT EXISTS requests_deployment ON requests (deployment_id, route, duration_ms);
+CREATE TABLE IF NOT EXISTS messages (
+    request_id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (request_id, ts, digest)
+);
+"""
+
+SINCE = re.compile(r"^(\d+)([mhd])$")
+EXCEPTION_LINE = re.compile(r"^[A-Za-z_][\w.]*: ")
+UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+csv.field_size_limit(sys.maxsize)
+
+
+def connect(path=WAREHOUSE_PATH):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    return conn
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _int(value):
+    return int(value) if value not in ("", None) else None
+
+
+def _rows(path):
+    """(request row or None, message row or None) for each export row."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            ts = int(row["timestampInMs"])
+            if row["durationMs"] != "-1":
+                yield (row["requestId"], ts, route_of(row["requestPath"]), row["requestPath"], row["requestMethod"],
+                       int(row["responseStatusCode"]), int(row["durationMs"]), _int(row["maxMemoryUsed"]),
+                       _int(row["memorySize"]), row["deploymentId"], row["instanceId"], row["region"]), None
+            if row["message"]:
+                message = row["message"]
+                digest = hashlib.blake2b(f"{row['level']}\0{message}".encode(), digest_size=8).digest()
+                yield None, (row["requestId"], ts, row["level"], digest, message)
+
+
+def ingest_export(conn, path, batch_size=5000):
+    """Add one export's new requests and messages; returns (requests, messages) added, or None if already ingested."""
+    sha = _file_sha256(path)
+    if conn.execute("SELECT 1 FROM exports WHERE sha256 = ?", (sha,)).fetchone():
+        return None
+    added = [0, 0]
+    total = 0
+    statements = ("INSERT OR IGNORE INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                  "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)")
+    batches = ([], [])
+
+    def flush(kind):
+        before = conn.total_changes
+        conn.executemany(statements[kind], batches[kind])
+        added[kind] += conn.total_changes - before
+        batches[kind].clear()
+
+    with conn:
+        for request, message in _rows(path):
+            total += 1
+            for kind, row in enumerate((request, message)):
+                if row is not None:
+                    batches[kind].append(row)
+                    if len(batches[kind]) >= batch_size:
+                        flush(kind)
+        flush(0)
+        flush(1)
+        conn.execute("INSERT INTO exports VALUES (?, ?, ?, ?, ?, ?)",
+                     (sha, os.path.basename(path), total, added[0], added[1], int(time.time())))
+    return tuple(added)
+
+
+def ingest(conn, paths):
+    """Ingest exports; returns {path: (requests, messages) added or None if skipped}."""
+    return {path: ingest_export(conn, path) for path in paths}
+
+
+def parse_time(value, now=None):
+    """Milliseconds since the epoch for '24h'/'7d'/'90m' back from now, or an ISO date/time (UTC)."""
+    match = SINCE.match(value)
+    if match:
+        now = time.time() if now is None else now
+        return int((now - int(match.group(1)) * UNITS[match.group(2)]) * 1000)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _where(deployment=None, route=None, since=None, until=None):
+    clauses, params = [], []
+    for clause, value in (("deployment_id = ?", deployment), ("route = ?", route),
+                          ("ts >= ?", since), ("ts < ?", until)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def latency_by_route(conn, deployment=None, since=None, until=None):
+    """[(route, requests, p50, p95, p99, max_ms, error_rate)] busiest first; nearest-rank percentiles."""
+    where, params = _where(deployment=deployment, since=since, until=until)
+    return conn.execute(f"""
+        WITH ranked AS (
+            SELECT route, duration_ms, status,
+                   ROW_NUMBER() OVER (PARTITION BY route ORDER BY duration_ms) AS n,
+                   COUNT(*) OVER (PARTITION BY route) AS total
+            FROM requests{where}
+        )
+        SELECT route, total,
+               MIN(CASE WHEN n >= total * 0.50 THEN duration_ms END),
+               MIN(CASE WHEN n >= total * 0.95 THEN duration_ms END),
+               MIN(CASE WHEN n >= total * 0.99 THEN duration_ms END),
+               MAX(duration_ms),
+               AVG(status >= 500)
+        FROM ranked GROUP BY route ORDER BY total DESC, route
+    """, params).fetchall()
+
+
+def errors(conn, deployment=None, route=None, since=None, until=None, limit=50):
+    """[(ts, route, status, deployment_id, error)] for 5xx requests, newest first; error is the exception logged."""
+    where, params = _where(deployment=deployment, route=route, since=since, until=until)
+    where = (where + " AND" if where else " WHERE") + " status >= 500"
+    rows = conn.execute(f"""
+        SELECT r.ts, r.route, r.status, r.deployment_id,
+               (SELECT m.message FROM messages m
+                WHERE m.request_id = r.request_id AND m.level = 'error' ORDER BY m.ts DESC LIMIT 1)
+        FROM requests r{where} ORDER BY r.ts DESC LIMIT ?
+    """, params + [limit]).fetchall()
+    return [(ts, route, status, deployment, _exception(message)) for ts, route, status, deployment, message in rows]
+
+
+def deployments(conn):
+    """[(deployment_id, first ts, last ts, requests, error_rate)], newest first."""
+    return conn.execute("""
+        SELECT deployment_id, MIN(ts), MAX(ts), COUNT(*), AVG(status >= 500)
+        FROM requests GROUP BY deployment_id ORDER BY MAX(ts) DESC
+    """).fetchall()
+
+
+def _exception(message):
+    """The last 'module.Error: text' line of a traceback, else its last line."""
+    lines = [line.strip() for line in (message or "").splitlines() if line.strip()]
+    for line in reversed(lines):
+        if EXCEPTION_LINE.match(line):
+            return line
+    return lines[-1] if lines else ""
+
+
+def _timestamp(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=WAREHOUSE_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="load new exports")
+    ingest_parser.add_argument("paths", nargs="*", help="export files (default: log/*.csv)")
+    for name in ("latency", "errors"):
+        query = commands.add_parser(name)
+        query.add_argument("--deployment")
+        query.add_argument("--since")
+        query.add_argument("--until")
+        if name == "errors":
+            query.add_argument("--route")
+            query.add_argument("--limit", type=int, default=50)
+    commands.add_parser("deployments")
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    try:
+        start = time.perf_counter()
+        if args.command == "ingest":
+            paths = args.paths or sorted(
+                os.path.join(LOG_DIR, f) for f in os.listdir(LOG_DIR) if f.lower().endswith(".csv"))
+            for path, added in ingest(conn, paths).items():
+                status = "already ingested" if added is None else f"+{added[0]} requests, +{added[1]} messages"
+                print(f"{os.path.basename(path)}: {status}")
+        elif args.command == "deployments":
+            for deployment, first, last, count, error_rate in deployments(conn):
+                print(f"{deployment:<36} {_timestamp(first)} .. {_timestamp(last)} {count:>6} requests {error_rate:>6.1%} 5xx")
+        else:
+            since = parse_time(args.since) if args.since else None
+            until = parse_time(args.until) if args.until else None
+            if args.command == "latency":
+                print(f"{'route':<28} {'reqs':>6} {'p50':>6} {'p95':>6} {'p99':>6} {'max':>6} {'5xx':>6}")
+                for route, count, p50, p95, p99, longest, error_rate in latency_by_route(
+                        conn, args.deployment, since, until):
+                    print(f"{route[:28]:<28} {count:>6} {p50:>6} {p95:>6} {p99:>6} {longest:>6} {error_rate:>6.1%}")
+            else:
+                for ts, route, status, deployment, error in errors(
+                        conn, args.deployment, args.route, since, until, args.limit):
+                    print(f"{_timestamp(ts)} {status} {route:<24} {deployment} {error[:100]}")
+        print(f"({(time.perf_counter() - start) * 1000:.1f} ms)", file=sys.stderr)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,10 @@
-from datetime import date
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, Text, ForeignKey, Boolean
+from datetime import date, datetime
+from sqlalchemy import create_engine, event, Column, Integer, String, Date, DateTime, Float, Text, ForeignKey, Boolean, Index, UniqueConstraint, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import DatabaseError
 from sqlalchemy.orm import sessionmaker, relationship
 
+import logging
 import os
 
 # Use DATABASE_URL if available (Vercel/Heroku), else local SQLite
@@ -12,7 +14,35 @@ database_url = os.getenv("POSTGRES_URL") or os.getenv("DATABASE_URL") or "sqlite
 if database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(database_url, echo=False)
+# SQLite tuning for multiple gunicorn workers sharing one file. WAL lets readers
+# run alongside a writer, busy_timeout makes writers wait instead of failing with
+# "database is locked", and synchronous=NORMAL skips the fsync on every commit
+# (still crash-safe in WAL mode). Set SQLITE_PROFILE=default to keep SQLite's defaults.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -20000,  # negative = KiB, so ~20MB per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def configure_sqlite_engine(engine, profile=SQLITE_PROFILE):
+    """Apply SQLITE_PRAGMAS to every new connection of a SQLite engine."""
+    if engine.dialect.name == "sqlite" and profile == "production":
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+engine = configure_sqlite_engine(create_engine(database_url, echo=False))
 SessionLocal = sessionmaker(bind=engine)
 
 Base = declarative_base()
@@ -39,6 +69,7 @@ class Customer(Base):
     next_bill_date = Column(Date, nullable=False)
 
     properties = relationship("Property", back_populates="customer", cascade="all, delete-orphan")
+    fees = relationship("CustomerFee", back_populates="customer", cascade="all, delete-orphan", order_by="CustomerFee.position")
 
 class Property(Base):
     __tablename__ = "properties"
@@ -54,10 +85,20 @@ class Property(Base):
 
     customer = relationship("Customer", back_populates="properties")
 
-class Invoice(Base):
-    __tablename__ = "invoices"
+class CustomerFee(Base):
+    """A fee billed every period on top of the rate; a customer can have any number of them."""
+    __tablename__ = "customer_fees"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
+    fee_type = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    position = Column(Integer, nullable=False, default=0)  # order on the invoice
+
+    customer = relationship("Customer", back_populates="fees")
+
+class InvoiceColumns:
+    """Columns shared by live invoices and the archive."""
     customer_id = Column(Integer, nullable=False)
     invoice_date = Column(Date, nullable=False)
     period_label = Column(String, nullable=False)   # e.g. "3rd quarter 2025"
@@ -65,6 +106,7 @@ class Invoice(Base):
     file_path = Column(String, nullable=False)      # path to generated docx
     email_subject = Column(String, nullable=False)
     email_body = Column(Text, nullable=False)
+    fee_type = Column(String, nullable=True)  # base fee type at the time of billing
     
     # Multiple fees
     fee_2_type = Column(String, nullable=True)
@@ -73,15 +115,244 @@ class Invoice(Base):
     fee_3_amount = Column(Float, nullable=True)
     additional_fee_desc = Column(String, nullable=True)
     additional_fee_amount = Column(Float, nullable=True)
-    additional_fee_amount = Column(Float, nullable=True)
     status = Column(String, default="Unpaid")
     paid_date = Column(Date, nullable=True)
 
+class Invoice(InvoiceColumns, Base):
+    __tablename__ = "invoices"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    lines = relationship("InvoiceLine", primaryjoin="Invoice.id == foreign(InvoiceLine.invoice_id)",
+                         cascade="all, delete-orphan", order_by="InvoiceLine.position")
+
+    __table_args__ = (
+        Index("ix_invoices_status_date", "status", "invoice_date"),
+        # Never hand out an id again: the archive and the email outbox still refer to it
+        {"sqlite_autoincrement": True},
+    )
+
+class ArchivedInvoice(InvoiceColumns, Base):
+    """Paid invoices moved out of the hot table by archive.archive_paid_invoices."""
+    __tablename__ = "invoices_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # keeps the original invoice id
+    archived_at = Column(Date, nullable=False)
+    document = Column(LargeBinary, nullable=True)  # rendered docx at archive time
+
+    lines = relationship("ArchivedInvoiceLine", primaryjoin="ArchivedInvoice.id == foreign(ArchivedInvoiceLine.invoice_id)",
+                         cascade="all, delete-orphan", order_by="ArchivedInvoiceLine.position")
+
+class InvoiceLineColumns:
+    """Columns shared by live invoice lines and the archive's."""
+    id = Column(Integer, primary_key=True)
+    invoice_id = Column(Integer, nullable=False, index=True)  # no foreign key: archived lines point into the archive
+    fee_type = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+
+class InvoiceLine(InvoiceLineColumns, Base):
+    """A fee line of an invoice, copied from the customer's fees when it was billed."""
+    __tablename__ = "invoice_lines"
+    __table_args__ = {"sqlite_autoincrement": True}  # archived lines keep their ids
+
+class ArchivedInvoiceLine(InvoiceLineColumns, Base):
+    """Lines of archived invoices, moved along with them by archive.archive_paid_invoices."""
+    __tablename__ = "invoice_archive_lines"
+
+class InvoiceRollup(Base):
+    """Running totals per (period, status, fee type), maintained incrementally by reports.apply_invoice."""
+    __tablename__ = "invoice_rollups"
+
+    id = Column(Integer, primary_key=True)
+    period_label = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    fee_type = Column(String, nullable=False)
+    line_count = Column(Integer, nullable=False, default=0)
+    amount = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint("period_label", "status", "fee_type", name="uq_invoice_rollups_key"),
+    )
+
 class FeeType(Base):
     __tablename__ = "fee_types"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
 
+class DataVersion(Base):
+    """Single-row counter bumped by every committed write; used as a cheap change token for HTTP caching."""
+    __tablename__ = "data_versions"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class JobLease(Base):
+    """One row per maintenance job; whoever holds an unexpired lease is the only one running it."""
+    __tablename__ = "job_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)  # NULL when nobody holds the lease
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    done = Column(Integer, nullable=True)
+    total = Column(Integer, nullable=True)
+    message = Column(String, nullable=True)
+
+class TemplateManifest(Base):
+    """What seed_from_templates last ingested from each template file, so unchanged files can be skipped."""
+    __tablename__ = "template_manifest"
+
+    filename = Column(String, primary_key=True)
+    size = Column(Integer, nullable=False)
+    mtime = Column(Float, nullable=False)
+    sha256 = Column(String, nullable=False)
+    customer_name = Column(String, nullable=True)  # NULL when the file yielded no customer
+    ingested_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class OutboxEmail(Base):
+    """An invoice email queued for email_outbox.deliver_outbox, and what became of it."""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    invoice_id = Column(Integer, nullable=False, index=True)
+    to_address = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # "queued", "sent", "failed"
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_due", "status", "next_attempt_at"),
+    )
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _track_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["data_changed"] = True
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_flushed_writes(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info["data_changed"] = True
+
+@event.listens_for(SessionLocal, "before_commit")
+def _bump_data_version(session):
+    if not (session.info.get("data_changed") or session.new or session.dirty or session.deleted):
+        return
+    table = DataVersion.__table__
+    result = session.execute(
+        table.update().where(table.c.id == 1).values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        session.execute(table.insert().values(id=1, version=1, updated_at=datetime.utcnow()))
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _reset_data_changed(session):
+    session.info.pop("data_changed", None)
+
+def get_data_version():
+    """Return (version, updated_at) of the last committed write."""
+    with engine.connect() as conn:
+        row = conn.execute(DataVersion.__table__.select().where(DataVersion.id == 1)).first()
+    if row is None:
+        return 0, datetime(2000, 1, 1)
+    return row.version, row.updated_at
+
+def backfill_rollups():
+    """
+    Rebuild the rollups if there are invoices but no rollup rows, as on installs that predate
+    them: reports.apply_invoice only adjusts existing totals. Returns True if it rebuilt.
+    """
+    session = SessionLocal()
+    try:
+        if session.query(InvoiceRollup.id).first() is not None:
+            return False
+        if session.query(Invoice.id).first() is None and session.query(ArchivedInvoice.id).first() is None:
+            return False
+        from reports import rebuild_rollups
+        rebuild_rollups(session)
+        session.commit()
+        return True
+    finally:
+        session.close()
+
+# Tables created before they were declared with sqlite_autoincrement, and the (table, column)
+# pairs holding ids of theirs that are gone from the table but must not be handed out again
+AUTOINCREMENT_TABLES = {
+    "invoices": [("invoices_archive", "id"), ("email_outbox", "invoice_id")],
+    "invoice_lines": [("invoice_archive_lines", "id")],
+}
+
+def migrate_autoincrement(bind=engine):
+    """
+    Rebuild SQLite tables in AUTOINCREMENT_TABLES that were created without AUTOINCREMENT,
+    which hands the highest id out again once its row is deleted or archived. Returns the
+    names of the tables rebuilt.
+    """
+    if bind.dialect.name != "sqlite":
+        return []  # Postgres sequences never go back
+    with bind.connect() as conn:
+        pending = [name for name in AUTOINCREMENT_TABLES if _needs_autoincrement(conn, name)]
+    if not pending:
+        return []
+    with bind.connect() as conn:
+        # pysqlite would run the DDL outside a transaction; this also makes other workers wait
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        rebuilt = [name for name in pending if _needs_autoincrement(conn, name)]
+        for name in rebuilt:
+            _rebuild_with_autoincrement(conn, Base.metadata.tables[name], AUTOINCREMENT_TABLES[name])
+        conn.commit()
+    return rebuilt
+
+def _needs_autoincrement(conn, name):
+    sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).scalar()
+    return sql is not None and "AUTOINCREMENT" not in sql.upper()
+
+def _rebuild_with_autoincrement(conn, table, reserved):
+    old = f"_{table.name}_old"
+    conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {old}")
+    # Indexes move with the table under their old names; its triggers go when it is dropped
+    for (index,) in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (old,)).all():
+        conn.exec_driver_sql(f"DROP INDEX {index}")
+    table.create(conn)
+    existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({old})")}
+    columns = ", ".join(name for name in table.columns.keys() if name in existing)
+    conn.exec_driver_sql(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}")
+    conn.exec_driver_sql(f"DROP TABLE {old}")
+
+    top = conn.exec_driver_sql(f"SELECT max(id) FROM {table.name}").scalar() or 0
+    for other, column in reserved:
+        if conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (other,)).first():
+            top = max(top, conn.exec_driver_sql(f"SELECT max({column}) FROM {other}").scalar() or 0)
+    conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+    conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table.name, top))
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    try:
+        Base.metadata.create_all(bind=engine)
+    except DatabaseError:
+        # Another worker created a table between our existence check and CREATE TABLE; the retry skips it
+        Base.metadata.create_all(bind=engine)
+    try:
+        migrate_autoincrement()
+    except DatabaseError:
+        logging.getLogger(__name__).warning("could not rebuild tables with AUTOINCREMENT ids", exc_info=True)
+    try:
+        backfill_rollups()
+    except DatabaseError:
+        # Invoices still missing columns: /migrate-db adds them and then backfills
+        logging.getLogger(__name__).warning("could not backfill report rollups", exc_info=True)
+
+    from search import ensure_search_index
+    ensure_search_index(engine)
@@ -0,0 +1,172 @@
+"""
+Render cache for invoice downloads, plus a small background warmer that fills it
+for newly created invoices so their first download doesn't pay the render cost.
+
+Entries are keyed by a fingerprint of everything the document is rendered from
+(invoice fields, customer fields, properties and the template file), so an edit
+to any of them simply misses the cache; nothing has to be invalidated.
+
+Environment:
+    PRERENDER_WORKERS      warmer threads (2); 0 disables warming. Always off on Vercel,
+                           where the process may be frozen as soon as the response is sent.
+    PRERENDER_QUEUE_LIMIT  max invoices waiting to be warmed (200); extra ones are skipped
+    RENDER_CACHE_MAX_MB    memory budget for cached documents (64)
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from models import SessionLocal, Invoice, Customer
+
+PRERENDER_WORKERS = 0 if os.getenv("VERCEL") else int(os.getenv("PRERENDER_WORKERS", "2"))
+PRERENDER_QUEUE_LIMIT = int(os.getenv("PRERENDER_QUEUE_LIMIT", "200"))
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+INVOICE_RENDER_FIELDS = (
+    "customer_id", "invoice_date", "period_label", "amount", "fee_2_type", "fee_2_amount",
+    "fee_3_type", "fee_3_amount", "additional_fee_desc", "additional_fee_amount",
+)
+# Every customer attribute the invoice_generator render paths read
+CUSTOMER_RENDER_FIELDS = (
+    "name", "email", "cadence", "property_address", "property_city", "property_state", "property_zip",
+    "fee_type", "rate", "fee_2_type", "fee_2_rate", "fee_3_type", "fee_3_rate", "additional_fee_desc", "additional_fee_amount",
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered documents, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, filename, data):
+        if not data or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = (filename, data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+
+render_cache = RenderCache()
+
+
+def render_fingerprint(invoice, customer, lines=(), property_fees=None):
+    """
+    Cache key of an invoice's rendered document; lines are its (fee_type, amount) fee lines
+    and property_fees the customer's invoice_generator.PropertyFees (looked up if not given).
+    """
+    from invoice_generator import TEMPLATE_PATH, property_fees_of
+    stat = os.stat(TEMPLATE_PATH)
+    property_fees = property_fees_of(customer) if property_fees is None else property_fees
+    parts = [
+        [getattr(invoice, f) for f in INVOICE_RENDER_FIELDS],
+        [getattr(customer, f) for f in CUSTOMER_RENDER_FIELDS],
+        list(property_fees.lines),
+        list(lines),
+        (stat.st_mtime_ns, stat.st_size),
+    ]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+# --- Warmer ------------------------------------------------------------------
+
+_executor = None
+_pending = 0
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PRERENDER_WORKERS, thread_name_prefix="prerender")
+        return _executor
+
+
+def _warm(invoice_ids):
+    """Render a batch of invoices, reading everything they are rendered from in one query per table."""
+    global _pending
+    try:
+        from invoice_generator import generate_invoice_buffer, load_invoice_lines, load_property_fees, NO_PROPERTY_FEES
+        session = SessionLocal()
+        try:
+            invoices = session.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
+            customer_ids = {invoice.customer_id for invoice in invoices}
+            customers = {c.id: c for c in session.query(Customer).filter(Customer.id.in_(customer_ids))}
+            property_fees = load_property_fees(session, customer_ids)
+            lines = load_invoice_lines(session, [invoice.id for invoice in invoices])
+        finally:
+            session.close()
+        for invoice in invoices:
+            customer = customers.get(invoice.customer_id)
+            if customer is None:
+                continue  # deleted since; the download reports it
+            try:
+                # Stores the result in render_cache
+                generate_invoice_buffer(invoice, property_fees.get(invoice.customer_id, NO_PROPERTY_FEES),
+                                        customer=customer, lines=lines[invoice.id])
+            except Exception:
+                logger.warning("prerender failed", exc_info=True, extra={"invoice_id": invoice.id})
+    except Exception:
+        logger.warning("prerender failed", exc_info=True, extra={"invoice_ids": invoice_ids})
+    finally:
+        with _lock:
+            _pending -= len(invoice_ids)
+
+
+def schedule(invoice_ids):
+    """
+    Queue committed invoices for background rendering and return how many were queued.
+    They are split into one batch per warmer thread, each loaded with a handful of queries.
+    Never blocks: once PRERENDER_QUEUE_LIMIT renders are pending the rest are skipped
+    and will simply be rendered on first download.
+    """
+    global _pending
+    if PRERENDER_WORKERS <= 0:
+        return 0
+    invoice_ids = list(invoice_ids)
+    with _lock:
+        queued = invoice_ids[:max(PRERENDER_QUEUE_LIMIT - _pending, 0)]
+        _pending += len(queued)
+    if len(queued) < len(invoice_ids):
+        logger.info("prerender queue full, skipping", extra={"skipped": len(invoice_ids) - len(queued)})
+    if queued:
+        size = math.ceil(len(queued) / PRERENDER_WORKERS)
+        for start in range(0, len(queued), size):
+            _get_executor().submit(_warm, queued[start:start + size])
+    return len(queued)
+
+
+def pending():
+    with _lock:
+        return _pending
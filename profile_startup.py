@@ -0,0 +1,103 @@
+"""
+Measure cold-start cost: how long `import app` takes in a fresh interpreter, which
+modules dominate it, and how long the first request takes after that.
+
+    python profile_startup.py --runs 5 --max-ms 800
+
+Exits non-zero if the median import time exceeds --max-ms or if any module that
+should be loaded lazily (python-docx, lxml, APScheduler) is imported at startup.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Only needed to render documents or run the scheduler; never on the import path
+LAZY_MODULES = ["docx", "lxml", "apscheduler"]
+
+FIRST_REQUEST_SNIPPET = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get("/")
+print(f"{(imported - start) * 1000:.1f} {(time.perf_counter() - imported) * 1000:.1f}")
+"""
+
+
+def _parse_importtime(stderr):
+    """Return {module imported directly by app: cumulative microseconds} from -X importtime output."""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(cumulative)
+        except ValueError:
+            continue  # header line
+        # Each nesting level adds two spaces; `app` itself sits at depth 1, its imports at depth 2
+        if len(name) - len(name.lstrip()) == 3:
+            totals[name.strip()] = totals.get(name.strip(), 0) + cumulative
+    return totals
+
+
+def profile_imports():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    return _parse_importtime(result.stderr)
+
+
+def time_startup():
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUEST_SNIPPET],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    import_ms, request_ms = result.stdout.split()[-2:]
+    return float(import_ms), float(request_ms)
+
+
+def loaded_lazy_modules():
+    check = f"import sys, app; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", check], cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    return result.stdout.split()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the app's cold-start import and first request.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--max-ms", type=float, help="fail if the median import time is above this")
+    args = parser.parse_args()
+
+    timings = [time_startup() for _ in range(args.runs)]
+    import_median = statistics.median(t[0] for t in timings)
+    request_median = statistics.median(t[1] for t in timings)
+    print(f"import app:    median {import_median:.1f} ms over {args.runs} runs (min {min(t[0] for t in timings):.1f})")
+    print(f"first request: median {request_median:.1f} ms")
+
+    print("\nSlowest imports made by app.py:")
+    totals = profile_imports()
+    for name, micros in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = loaded_lazy_modules()
+    if eager:
+        print(f"\nFAIL: imported at startup but should be lazy: {', '.join(eager)}")
+        failed = True
+    if args.max_ms is not None and import_median > args.max_ms:
+        print(f"\nFAIL: median import time {import_median:.1f} ms exceeds {args.max_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
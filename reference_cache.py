@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from models import SessionLocal, Customer, FeeType
+
+# Each worker keeps its own copy; the TTL bounds how long a worker can serve
+# data that another worker has already changed.
+CACHE_TTL_SECONDS = float(os.getenv("REFERENCE_CACHE_TTL", "60"))
+
+FeeTypeEntry = namedtuple("FeeTypeEntry", ["id", "name"])
+CustomerEntry = namedtuple("CustomerEntry", ["id", "name", "property_address"])
+
+
+class ReadThroughCache:
+    """Hold the result of `loader()` for `ttl` seconds, reloading on expiry or invalidation."""
+
+    def __init__(self, loader, ttl=CACHE_TTL_SECONDS):
+        self.loader = loader
+        self.ttl = ttl
+        self._value = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if time.monotonic() < self._expires_at:
+            return self._value
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if time.monotonic() >= self._expires_at:
+                self._value = self.loader()
+                self._expires_at = time.monotonic() + self.ttl
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._expires_at = 0.0
+            self._value = None
+
+
+def _load_fee_types():
+    session = SessionLocal()
+    try:
+        rows = session.query(FeeType.id, FeeType.name).order_by(FeeType.id).all()
+        return [FeeTypeEntry(*row) for row in rows]
+    finally:
+        session.close()
+
+
+def _load_customer_index():
+    session = SessionLocal()
+    try:
+        rows = session.query(Customer.id, Customer.name, Customer.property_address).order_by(Customer.name).all()
+        return [CustomerEntry(*row) for row in rows]
+    finally:
+        session.close()
+
+
+fee_types_cache = ReadThroughCache(_load_fee_types)
+customer_index_cache = ReadThroughCache(_load_customer_index)
+
+
+def get_fee_types():
+    """Return the fee types as (id, name) tuples."""
+    return fee_types_cache.get()
+
+
+def get_customer_index():
+    """Return a compact (id, name, property_address) list for customer pickers."""
+    return customer_index_cache.get()
+
+
+def invalidate_fee_types():
+    fee_types_cache.invalidate()
+
+
+def invalidate_customers():
+    customer_index_cache.invalidate()
@@ -0,0 +1,180 @@
+from datetime import date, timedelta
+from sqlalchemy import func, case, literal, select, union_all, insert, delete
+from models import Invoice, ArchivedInvoice, InvoiceLine, ArchivedInvoiceLine, InvoiceRollup, Customer
+
+DEFAULT_FEE_TYPE = "Management Fee"
+ADDITIONAL_FEE_TYPE = "Additional Fee"
+AGING_BUCKETS = [(0, 30, "0-30"), (31, 60, "31-60"), (61, 90, "61-90")]
+AGING_OVERFLOW = "90+"
+
+
+def invoice_lines(invoice):
+    """Return the (fee_type, amount) lines an invoice contributes to the rollups."""
+    lines = [(invoice.fee_type or DEFAULT_FEE_TYPE, invoice.amount or 0.0)]
+    if invoice.fee_2_amount:
+        lines.append((invoice.fee_2_type or "Fee", invoice.fee_2_amount))
+    if invoice.fee_3_amount:
+        lines.append((invoice.fee_3_type or "Fee", invoice.fee_3_amount))
+    if invoice.additional_fee_amount:
+        lines.append((ADDITIONAL_FEE_TYPE, invoice.additional_fee_amount))
+    for line in getattr(invoice, "lines", None) or ():
+        if line.amount:
+            lines.append((line.fee_type, line.amount))
+    return lines
+
+
+def _upsert_statement(dialect_name):
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(InvoiceRollup.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=["period_label", "status", "fee_type"],
+        set_={
+            "line_count": InvoiceRollup.__table__.c.line_count + stmt.excluded.line_count,
+            "amount": InvoiceRollup.__table__.c.amount + stmt.excluded.amount,
+        },
+    )
+
+
+def apply_invoice(session, invoice, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) an invoice's contribution to the rollups.
+    Runs inside the caller's transaction, so it commits or rolls back with the invoice change.
+    """
+    apply_invoices(session, [invoice], sign)
+
+
+def apply_invoices(session, invoices, sign=1):
+    """Like apply_invoice for many invoices, merging deltas per rollup key into one statement."""
+    deltas = {}
+    for invoice in invoices:
+        status = invoice.status or "Unpaid"
+        for fee_type, amount in invoice_lines(invoice):
+            key = (invoice.period_label, status, fee_type)
+            count, total = deltas.get(key, (0, 0.0))
+            deltas[key] = (count + sign, total + sign * amount)
+    if not deltas:
+        return
+    params = [
+        {"period_label": period_label, "status": status, "fee_type": fee_type, "line_count": count, "amount": total}
+        for (period_label, status, fee_type), (count, total) in deltas.items()
+    ]
+
+    upsert = _upsert_statement(session.get_bind().dialect.name)
+    if upsert is not None:
+        session.execute(upsert, params)
+        return
+
+    table = InvoiceRollup.__table__
+    for p in params:
+        key = (table.c.period_label == p["period_label"]) & (table.c.status == p["status"]) & (table.c.fee_type == p["fee_type"])
+        result = session.execute(
+            table.update().where(key).values(line_count=table.c.line_count + p["line_count"], amount=table.c.amount + p["amount"])
+        )
+        if result.rowcount == 0:
+            session.execute(table.insert().values(**p))
+
+
+def _or_default(column, default):
+    """SQL for Python's `value or default`: empty strings fall back too, as they do in invoice_lines."""
+    return func.coalesce(func.nullif(column, ""), default)
+
+
+def _line_selects(table, line_table):
+    """One SELECT per fee column and one for the line table, unpivoting invoices into (period, status, fee type, amount) lines."""
+    c = table.c
+    status = _or_default(c.status, "Unpaid")
+    line = line_table.c
+    return [
+        select(c.period_label, status.label("status"), _or_default(c.fee_type, DEFAULT_FEE_TYPE).label("fee_type"), c.amount.label("amount")),
+        select(c.period_label, status, _or_default(c.fee_2_type, "Fee"), c.fee_2_amount).where(c.fee_2_amount != 0),
+        select(c.period_label, status, _or_default(c.fee_3_type, "Fee"), c.fee_3_amount).where(c.fee_3_amount != 0),
+        select(c.period_label, status, literal(ADDITIONAL_FEE_TYPE), c.additional_fee_amount).where(c.additional_fee_amount != 0),
+        select(c.period_label, status, line.fee_type, line.amount).join_from(table, line_table, line.invoice_id == c.id)
+        .where(line.amount != 0),
+    ]
+
+
+def rebuild_rollups(session):
+    """Recompute every rollup row from the live and archived invoice tables in one INSERT ... SELECT."""
+    lines = union_all(*_line_selects(Invoice.__table__, InvoiceLine.__table__),
+                      *_line_selects(ArchivedInvoice.__table__, ArchivedInvoiceLine.__table__)).subquery()
+    grouped = select(
+        lines.c.period_label, lines.c.status, lines.c.fee_type,
+        func.count().label("line_count"), func.sum(lines.c.amount).label("amount"),
+    ).group_by(lines.c.period_label, lines.c.status, lines.c.fee_type)
+
+    session.execute(delete(InvoiceRollup))
+    session.execute(insert(InvoiceRollup).from_select(["period_label", "status", "fee_type", "line_count", "amount"], grouped))
+
+
+def revenue_report(session, by="period"):
+    """Billed amounts from the rollup table, grouped by period or fee type and split by status."""
+    group_col = InvoiceRollup.period_label if by == "period" else InvoiceRollup.fee_type
+    rows = session.query(
+        group_col, InvoiceRollup.status, func.sum(InvoiceRollup.amount)
+    ).group_by(group_col, InvoiceRollup.status).order_by(group_col).all()
+
+    report = {}
+    for key, status, amount in rows:
+        entry = report.setdefault(key, {"key": key, "billed": 0.0, "paid": 0.0, "unpaid": 0.0})
+        entry["billed"] += amount or 0.0
+        entry["paid" if status == "Paid" else "unpaid"] += amount or 0.0
+    return [
+        {k: round(v, 2) if isinstance(v, float) else v for k, v in entry.items()}
+        for entry in report.values()
+    ]
+
+
+def _invoice_total():
+    line_total = select(func.sum(InvoiceLine.amount)).where(InvoiceLine.invoice_id == Invoice.id).scalar_subquery()
+    return (
+        Invoice.amount
+        + func.coalesce(Invoice.fee_2_amount, 0)
+        + func.coalesce(Invoice.fee_3_amount, 0)
+        + func.coalesce(Invoice.additional_fee_amount, 0)
+        + func.coalesce(line_total, 0)
+    )
+
+
+def _unpaid():
+    return func.coalesce(Invoice.status, "Unpaid") != "Paid"
+
+
+def ar_aging_report(session, as_of=None):
+    """Outstanding balance by days since invoice date, aggregated in one query over unpaid invoices."""
+    as_of = as_of or date.today()
+    total = _invoice_total()
+    columns = []
+    for low, high, label in AGING_BUCKETS:
+        in_bucket = Invoice.invoice_date >= as_of - timedelta(days=high)
+        if low:
+            in_bucket &= Invoice.invoice_date <= as_of - timedelta(days=low)
+        columns.append(func.sum(case((in_bucket, total), else_=0)).label(label))
+    overflow_cutoff = as_of - timedelta(days=AGING_BUCKETS[-1][1] + 1)
+    columns.append(func.sum(case((Invoice.invoice_date <= overflow_cutoff, total), else_=0)).label(AGING_OVERFLOW))
+    columns.append(func.count().label("invoice_count"))
+
+    row = session.query(*columns).filter(_unpaid()).one()
+    report = {key: round(value or 0.0, 2) for key, value in row._mapping.items() if key != "invoice_count"}
+    report["invoice_count"] = row.invoice_count
+    report["as_of"] = as_of.isoformat()
+    return report
+
+
+def outstanding_by_customer(session):
+    """Unpaid balance per customer, largest first."""
+    balance = func.sum(_invoice_total()).label("balance")
+    rows = session.query(
+        Invoice.customer_id, Customer.name, func.count(Invoice.id), balance
+    ).outerjoin(Customer, Invoice.customer_id == Customer.id).filter(_unpaid()).group_by(
+        Invoice.customer_id, Customer.name
+    ).order_by(balance.desc()).all()
+    return [
+        {"customer_id": customer_id, "name": name or "Deleted Customer", "invoice_count": count, "balance": round(amount or 0.0, 2)}
+        for customer_id, name, count, amount in rows
+    ]
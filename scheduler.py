@@ -0,0 +1,281 @@
+"""
+In-process scheduler for self-hosted deployments (gunicorn with several workers).
+
+Off unless SCHEDULER_ENABLED=1, and never on Vercel, where vercel.json's cron hits
+/run-today instead. Every worker starts a scheduler, but only one of them is the
+leader: the holder of the "scheduler" job lease, renewed every SCHEDULER_LEASE_TTL / 3
+seconds. The leader attaches the persistent job store (table apscheduler_jobs), so
+billing, archiving and the rollup rebuild run in exactly one worker, and a run missed
+while no worker was up is caught up by whoever leads next (see SCHEDULER_MISFIRE_GRACE
+and SCHEDULER_COALESCE). A worker that loses the lease detaches the store again.
+
+Cache warming is the exception: the render cache lives in each worker's memory, so
+every worker warms its own from an in-memory job store.
+
+    python scheduler.py            # run the scheduler on its own, without the web app
+    python scheduler.py --status   # who leads, and when each persistent job runs next
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from models import engine, init_db, SessionLocal, Invoice
+from job_lease import JobAlreadyRunning, job_lease, try_lease, get_job_status
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1" and not os.getenv("VERCEL")
+SCHEDULER_TIMEZONE = os.getenv("SCHEDULER_TIMEZONE", "UTC")
+SCHEDULER_LEASE_TTL = int(os.getenv("SCHEDULER_LEASE_TTL", "60"))  # seconds; a dead leader is replaced after this
+# How late a missed run may still start (seconds); later ones are skipped until the next fire time
+SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", "21600"))
+# Run several missed fire times once instead of once each
+SCHEDULER_COALESCE = os.getenv("SCHEDULER_COALESCE", "1") == "1"
+WARM_CACHE_LIMIT = int(os.getenv("WARM_CACHE_LIMIT", "200"))  # most recent unpaid invoices to prerender
+
+LEADER_LEASE = "scheduler"
+JOBSTORE_TABLE = "apscheduler_jobs"
+
+logger = logging.getLogger(__name__)
+
+
+def run_billing():
+    """Daily billing, recorded as a "billing" run like /run-today."""
+    from app import JOBS
+    from job_events import start_job
+    try:
+        run = start_job("billing", JOBS["billing"], background=False)
+    except JobAlreadyRunning:
+        logger.info("scheduled billing skipped, already running", extra={"job": "billing"})
+        return
+    logger.info("scheduled billing finished", extra={"job": "billing", "status": run.status})
+
+
+def run_archive():
+    from archive import archive_paid_invoices
+    try:
+        with job_lease("archiving"):
+            count = archive_paid_invoices()
+    except JobAlreadyRunning:
+        logger.info("scheduled archive skipped, already running", extra={"job": "archiving"})
+        return
+    logger.info("scheduled archive finished", extra={"job": "archiving", "archived": count})
+
+
+def run_rollups():
+    from reports import rebuild_rollups
+    # Billing updates the rollups as it goes, so a rebuild waits for it rather than racing it
+    try:
+        with job_lease("billing"):
+            session = SessionLocal()
+            try:
+                rebuild_rollups(session)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+    except JobAlreadyRunning:
+        logger.info("scheduled rollup rebuild skipped, billing is running", extra={"job": "rollups"})
+        return
+    logger.info("scheduled rollup rebuild finished", extra={"job": "rollups"})
+
+
+def warm_cache(limit=None):
+    """Prerender this worker's most recent unpaid invoices; returns how many were queued."""
+    import prerender
+    session = SessionLocal()
+    try:
+        ids = [row.id for row in session.query(Invoice.id).filter(Invoice.status == "Unpaid")
+               .order_by(Invoice.invoice_date.desc(), Invoice.id.desc()).limit(limit or WARM_CACHE_LIMIT)]
+    finally:
+        session.close()
+    return prerender.schedule(ids)
+
+
+# id -> (function, crontab from the environment, default crontab); an empty crontab disables the job
+LEADER_JOBS = {
+    "billing": (run_billing, "SCHEDULER_BILLING_CRON", "0 6 * * *"),
+    "archive": (run_archive, "SCHEDULER_ARCHIVE_CRON", "0 3 * * *"),
+    "rollups": (run_rollups, "SCHEDULER_ROLLUPS_CRON", "30 3 * * *"),
+}
+WORKER_JOBS = {
+    "warm-cache": (warm_cache, "SCHEDULER_WARM_CACHE_CRON", "15 * * * *"),
+}
+
+
+def _crontabs(jobs):
+    return {job_id: (func, os.getenv(env, default)) for job_id, (func, env, default) in jobs.items()}
+
+
+class LeaderScheduler:
+    """A BackgroundScheduler that attaches the persistent job store only while it holds the leader lease."""
+
+    def __init__(self, leader_jobs=None, worker_jobs=None, ttl=SCHEDULER_LEASE_TTL,
+                 misfire_grace=SCHEDULER_MISFIRE_GRACE, coalesce=SCHEDULER_COALESCE, timezone=SCHEDULER_TIMEZONE):
+        from apscheduler.schedulers.background import BackgroundScheduler
+        self.leader_jobs = _crontabs(LEADER_JOBS) if leader_jobs is None else leader_jobs
+        self.worker_jobs = _crontabs(WORKER_JOBS) if worker_jobs is None else worker_jobs
+        self.ttl = ttl
+        self.timezone = timezone
+        self.job_defaults = {"misfire_grace_time": misfire_grace, "coalesce": coalesce, "max_instances": 1}
+        self.scheduler = BackgroundScheduler(timezone=timezone, job_defaults=self.job_defaults)
+        self.lease = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_leader(self):
+        return self.lease is not None
+
+    def _trigger(self, crontab):
+        from apscheduler.triggers.cron import CronTrigger
+        return CronTrigger.from_crontab(crontab, timezone=self.timezone)
+
+    def start(self, paused=False, heartbeat=True):
+        self.scheduler.start(paused=paused)
+        for job_id, (func, crontab) in self.worker_jobs.items():
+            if crontab:
+                # Also once right away: a fresh worker starts with an empty cache
+                self.scheduler.add_job(func, self._trigger(crontab), id=job_id, replace_existing=True,
+                                       next_run_time=datetime.now(self.scheduler.timezone))
+        if heartbeat:
+            self._thread = threading.Thread(target=self._run, name="scheduler-leader", daemon=True)
+            self._thread.start()
+        else:
+            self.tick()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("scheduler leader election failed")
+            if self._stop.wait(max(self.ttl / 3, 1)):
+                return
+
+    def tick(self):
+        """Renew or try to take the leader lease, attaching or detaching the persistent store to match."""
+        with self._lock:
+            if self.lease is not None and not self.lease.renew():
+                logger.warning("scheduler leadership lost", extra={"owner": self.lease.owner})
+                self._demote()
+            if self.lease is None:
+                lease = try_lease(LEADER_LEASE, ttl=self.ttl)
+                if lease is not None:
+                    self.lease = lease
+                    try:
+                        self._promote()
+                    except Exception:
+                        self._demote()
+                        lease.release()
+                        raise
+            return self.is_leader
+
+    def _promote(self):
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        self.scheduler.add_jobstore(SQLAlchemyJobStore(engine=engine, tablename=JOBSTORE_TABLE), "persistent")
+        for job_id, (func, crontab) in self.leader_jobs.items():
+            existing = self.scheduler.get_job(job_id, jobstore="persistent")
+            if not crontab:
+                if existing is not None:
+                    existing.remove()
+                continue
+            trigger = self._trigger(crontab)
+            if existing is not None and str(existing.trigger) == str(trigger):
+                # Keep the stored next_run_time so a run missed while nobody led is caught up
+                existing.modify(**self.job_defaults)
+            else:
+                self.scheduler.add_job(func, trigger, id=job_id, jobstore="persistent", replace_existing=True)
+        logger.info("scheduler leadership taken", extra={"owner": self.lease.owner})
+
+    def _demote(self):
+        try:
+            self.scheduler.remove_jobstore("persistent", shutdown=False)
+        except KeyError:
+            pass  # _promote failed before attaching it
+        self.lease = None
+
+    def shutdown(self):
+        """Stop scheduling and hand the leadership over right away instead of letting it expire."""
+        self._stop.set()
+        with self._lock:
+            if self.lease is not None:
+                lease = self.lease
+                self._demote()
+                lease.release()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+
+_scheduler = None
+_scheduler_pid = None
+_start_lock = threading.Lock()
+
+
+def start_scheduler():
+    """Start this process's scheduler once (again in a forked child); None when disabled."""
+    global _scheduler, _scheduler_pid
+    if not SCHEDULER_ENABLED:
+        return None
+    with _start_lock:
+        if _scheduler_pid != os.getpid():
+            # Before the election thread starts, so it never races a request's init_db in this process
+            init_db()  # the leader lease lives in job_leases
+            _scheduler = LeaderScheduler().start()
+            _scheduler_pid = os.getpid()
+            atexit.register(_scheduler.shutdown)
+        return _scheduler
+
+
+def init_app(app):
+    if not SCHEDULER_ENABLED:
+        return
+    # Threads do not survive a fork, so with gunicorn --preload each worker starts its own on first request
+    @app.before_request
+    def ensure_scheduler():
+        start_scheduler()  # returns the scheduler, which Flask would take for the response
+
+    start_scheduler()
+
+
+def scheduler_status():
+    """The leader lease and the persistent jobs' next run times, read straight from the database."""
+    from sqlalchemy import inspect as sa_inspect, text
+    jobs = {}
+    if sa_inspect(engine).has_table(JOBSTORE_TABLE):
+        with engine.connect() as conn:
+            for job_id, next_run in conn.execute(text(f"SELECT id, next_run_time FROM {JOBSTORE_TABLE}")):
+                jobs[job_id] = None if next_run is None else datetime.fromtimestamp(next_run, timezone.utc).isoformat()
+    return {"enabled": SCHEDULER_ENABLED, "leader": get_job_status(LEADER_LEASE), "jobs": jobs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="print the leader and next run times as JSON")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        json.dump(scheduler_status(), sys.stdout, indent=2)
+        print()
+        return 0
+    # The jobs import app, which would otherwise start a second scheduler in this process
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    init_db()
+    scheduler = LeaderScheduler().start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
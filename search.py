@@ -0,0 +1,203 @@
+import re
+from sqlalchemy import text
+
+# Full-text index over customers, properties, invoices and archived invoices.
+#
+# SQLite: one FTS5 table kept in sync by triggers on the source tables. The
+# FTS rowid encodes (kind, source id) so trigger updates and deletes are
+# rowid lookups instead of scans of the index.
+#
+# Postgres: a generated tsvector column plus a GIN index on each source table,
+# so the database keeps the index current on every write.
+
+KIND_CODES = {"customer": 1, "property": 2, "invoice": 3, "archived_invoice": 4}
+KIND_STRIDE = 8
+
+SQLITE_SOURCES = {
+    "customer": {
+        "table": "customers",
+        "link": "NEW.id",
+        "title": "NEW.name",
+        "body": "NEW.name || ' ' || coalesce(NEW.email, '') || ' ' || coalesce(NEW.property_address, '')",
+    },
+    "property": {
+        "table": "properties",
+        "link": "NEW.customer_id",
+        "title": "NEW.address",
+        "body": "NEW.address || ' ' || coalesce(NEW.city, '')",
+    },
+    "invoice": {
+        "table": "invoices",
+        "link": "NEW.customer_id",
+        "title": "NEW.email_subject",
+        "body": "NEW.period_label || ' ' || coalesce(NEW.email_subject, '')",
+    },
+    "archived_invoice": {
+        "table": "invoices_archive",
+        "link": "NEW.customer_id",
+        "title": "NEW.email_subject",
+        "body": "NEW.period_label || ' ' || coalesce(NEW.email_subject, '')",
+    },
+}
+
+POSTGRES_SOURCES = {
+    "customer": ("customers", "coalesce(name, '') || ' ' || coalesce(email, '') || ' ' || coalesce(property_address, '')"),
+    "property": ("properties", "coalesce(address, '') || ' ' || coalesce(city, '')"),
+    "invoice": ("invoices", "coalesce(period_label, '') || ' ' || coalesce(email_subject, '')"),
+    "archived_invoice": ("invoices_archive", "coalesce(period_label, '') || ' ' || coalesce(email_subject, '')"),
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _rowid_sql(kind, id_expr):
+    return f"({id_expr}) * {KIND_STRIDE} + {KIND_CODES[kind]}"
+
+
+def _sqlite_has_fts5(conn):
+    try:
+        conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)"))
+        conn.execute(text("DROP TABLE temp._fts5_probe"))
+        return True
+    except Exception:
+        return False
+
+
+def _sqlite_triggers(kind, src):
+    """{trigger name: CREATE TRIGGER statement} keeping `kind`'s index rows in step with its table."""
+    table = src["table"]
+    values = (
+        f"{_rowid_sql(kind, 'NEW.id')}, '{kind}', NEW.id, {src['link']}, "
+        f"coalesce({src['title']}, ''), {src['body']}"
+    )
+    insert_sql = f"INSERT INTO search_index(rowid, kind, ref_id, link_id, title, body) VALUES ({values});"
+    delete_sql = f"DELETE FROM search_index WHERE rowid = {_rowid_sql(kind, 'OLD.id')};"
+    return {
+        f"{table}_search_ai": f"CREATE TRIGGER {table}_search_ai AFTER INSERT ON {table} BEGIN {insert_sql} END",
+        f"{table}_search_au": f"CREATE TRIGGER {table}_search_au AFTER UPDATE ON {table} BEGIN {delete_sql} {insert_sql} END",
+        f"{table}_search_ad": f"CREATE TRIGGER {table}_search_ad AFTER DELETE ON {table} BEGIN {delete_sql} END",
+    }, values
+
+
+def _stale_kinds(conn):
+    """Kinds whose triggers are missing or differ from the definitions above, as after a change to SQLITE_SOURCES."""
+    stored = dict(conn.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")).all())
+    return [kind for kind, src in SQLITE_SOURCES.items()
+            if any(stored.get(name) != sql for name, sql in _sqlite_triggers(kind, src)[0].items())]
+
+
+def _ensure_sqlite_index(conn):
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'search_index'")).first()
+    if not exists:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, link_id UNINDEXED, title, body, tokenize = 'unicode61')"
+        ))
+    if not _stale_kinds(conn):
+        return
+
+    # pysqlite would run the DDL outside a transaction; this also makes other workers wait
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+    for kind in _stale_kinds(conn):
+        src = SQLITE_SOURCES[kind]
+        triggers, values = _sqlite_triggers(kind, src)
+        for name, sql in triggers.items():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(sql))
+        # Reindex the kind's rows as the new triggers would have written them
+        conn.execute(text("DELETE FROM search_index WHERE kind = :kind"), {"kind": kind})
+        select_values = values.replace("NEW.", "")
+        conn.execute(text(
+            f"INSERT INTO search_index(rowid, kind, ref_id, link_id, title, body) SELECT {select_values} FROM {src['table']}"
+        ))
+
+
+def _ensure_postgres_index(conn):
+    for kind, (table, document) in POSTGRES_SOURCES.items():
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED"
+        ))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"))
+
+
+def ensure_search_index(engine):
+    """Create the full-text index for this database if it is missing (safe to run multiple times)."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            if _sqlite_has_fts5(conn):
+                _ensure_sqlite_index(conn)
+        elif engine.dialect.name == "postgresql":
+            _ensure_postgres_index(conn)
+
+
+def _tokens(query):
+    return _TOKEN_RE.findall(query or "")[:10]
+
+
+def _search_sqlite_fts(session, tokens, limit):
+    # Quote every token so user input can't inject FTS5 syntax; '*' makes the last one a prefix match
+    match = " ".join(f'"{t}"' for t in tokens[:-1])
+    match = f'{match} "{tokens[-1]}"*'.strip()
+    rows = session.execute(text(
+        "SELECT kind, ref_id, link_id, title, snippet(search_index, 4, '', '', '…', 12) AS detail "
+        "FROM search_index WHERE search_index MATCH :match ORDER BY rank LIMIT :limit"
+    ), {"match": match, "limit": limit})
+    return [dict(row._mapping) for row in rows]
+
+
+def _search_postgres(session, tokens, limit):
+    tsquery = " & ".join(f"{t}:*" for t in tokens)
+    rows = session.execute(text(
+        "SELECT kind, ref_id, link_id, title, detail FROM ("
+        " SELECT 'customer' AS kind, id AS ref_id, id AS link_id, name AS title, property_address AS detail,"
+        "  ts_rank(search_vector, q) AS rank FROM customers, to_tsquery('simple', :q) q WHERE search_vector @@ q"
+        " UNION ALL"
+        " SELECT 'property', id, customer_id, address, city, ts_rank(search_vector, q)"
+        "  FROM properties, to_tsquery('simple', :q) q WHERE search_vector @@ q"
+        " UNION ALL"
+        " SELECT 'invoice', id, customer_id, email_subject, period_label, ts_rank(search_vector, q)"
+        "  FROM invoices, to_tsquery('simple', :q) q WHERE search_vector @@ q"
+        " UNION ALL"
+        " SELECT 'archived_invoice', id, customer_id, email_subject, period_label, ts_rank(search_vector, q)"
+        "  FROM invoices_archive, to_tsquery('simple', :q) q WHERE search_vector @@ q"
+        ") hits ORDER BY rank DESC LIMIT :limit"
+    ), {"q": tsquery, "limit": limit})
+    return [dict(row._mapping) for row in rows]
+
+
+def _search_like(session, tokens, limit):
+    # Fallback for databases without a full-text engine: correct but unindexed
+    from models import Customer, Property, Invoice, ArchivedInvoice
+
+    results = []
+    pattern = "%" + "%".join(tokens) + "%"
+    for c in session.query(Customer).filter(
+        (Customer.name.ilike(pattern)) | (Customer.email.ilike(pattern)) | (Customer.property_address.ilike(pattern))
+    ).limit(limit):
+        results.append({"kind": "customer", "ref_id": c.id, "link_id": c.id, "title": c.name, "detail": c.property_address})
+    for p in session.query(Property).filter(Property.address.ilike(pattern)).limit(limit):
+        results.append({"kind": "property", "ref_id": p.id, "link_id": p.customer_id, "title": p.address, "detail": p.city})
+    for kind, model in (("invoice", Invoice), ("archived_invoice", ArchivedInvoice)):
+        for inv in session.query(model).filter(
+            (model.period_label.ilike(pattern)) | (model.email_subject.ilike(pattern))
+        ).limit(limit):
+            results.append({"kind": kind, "ref_id": inv.id, "link_id": inv.customer_id, "title": inv.email_subject, "detail": inv.period_label})
+    return results[:limit]
+
+
+def search(session, query, limit=50):
+    """
+    Search customers, properties and invoices.
+    Returns a list of dicts with kind, ref_id, link_id (customer id), title and detail.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return _search_postgres(session, tokens, limit)
+    if dialect == "sqlite" and session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'search_index'")).first():
+        return _search_sqlite_fts(session, tokens, limit)
+    return _search_like(session, tokens, limit)
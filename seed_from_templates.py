@@ -1,190 +1,187 @@
+import argparse
+import hashlib
+import multiprocessing
 import os
-import re
-from docx import Document
-from models import SessionLocal, Customer, FeeType, init_db
-from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from docx_text import iter_paragraphs
+from field_extraction import LOW_CONFIDENCE, customer_extractor, parse_address
+from sqlalchemy import insert, update
+from models import SessionLocal, Customer, FeeType, TemplateManifest, init_db
+from job_events import describe_event
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, "invoice_templates")
+SEED_WORKERS = int(os.getenv("SEED_WORKERS", str(min(os.cpu_count() or 1, 4))))
+SEED_PARALLEL_MIN_FILES = 500  # a spawned worker costs ~0.5s to start; parsing a template ~1ms
+NEW_CUSTOMER_BILL_DATE = date(2025, 10, 1)
 
-def extract_money(text):
-    # Find all money patterns like $150 or $1,200.50
-    matches = re.findall(r'\$\s?([0-9,]+(?:\.[0-9]{2})?)', text)
-    if matches:
-        # Return the last one found in the line, assuming it's the total for that line
-        return float(matches[-1].replace(',', ''))
-    return 0.0
-
-def parse_address(full_address):
-    """Parse full address into street, city, state, zip components."""
-    # Common patterns:
-    # "1214 S 115th ST, West Allis, WI  53214"
-    # "N62W12921 River Heights Dr"
-    # "2085 Le Jardin Ct."
-    
-    street = ""
-    city = ""
-    state = ""
-    zip_code = ""
-    
-    # Try to find zip code (5 digits)
-    zip_match = re.search(r'\b(\d{5})\b', full_address)
-    if zip_match:
-        zip_code = zip_match.group(1)
-        # Remove zip from address
-        full_address = full_address.replace(zip_code, '').strip()
-    
-    # Try to find state (2 uppercase letters)
-    state_match = re.search(r'\b([A-Z]{2})\b', full_address)
-    if state_match:
-        state = state_match.group(1)
-        # Remove state from address
-        full_address = full_address.replace(state, '').strip()
-    
-    # Split by comma to separate street from city
-    parts = [p.strip() for p in full_address.split(',')]
-    
-    if len(parts) >= 2:
-        street = parts[0]
-        city = parts[1]
-    elif len(parts) == 1:
-        street = parts[0]
-    
-    # Clean up trailing commas
-    street = street.rstrip(',').strip()
-    city = city.rstrip(',').strip()
-    
-    return street, city, state, zip_code
-
-def seed_customers():
-    print("Initializing DB...")
+def parse_template(path):
+    """
+    Extract customer fields from one invoice template. Returns a dict with the file
+    name plus name/address/email/rate/cadence and a confidence per field, or with an
+    "error" key if the file can't be read.
+    Runs in worker processes, so it must stay a plain top-level function.
+    """
+    filename = os.path.basename(path)
+    try:
+        # Body paragraphs only, as the templates keep customer details outside tables
+        fields = customer_extractor.extract(p.text for p in iter_paragraphs(path) if p.table is None)
+    except Exception as e:
+        return {"file": filename, "error": str(e)}
+
+    result = {"file": filename}
+    result.update((name, field.value) for name, field in fields.items())
+    result["confidence"] = {name: field.confidence for name, field in fields.items()}
+    return result
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _parse_all(paths, workers):
+    """Yield parse_template results in input order, in a process pool when it is worth it."""
+    if workers <= 1 or len(paths) < SEED_PARALLEL_MIN_FILES:
+        yield from map(parse_template, paths)
+        return
+    try:
+        # spawn, not fork: the web process has logging and warmer threads running
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=multiprocessing.get_context("spawn"))
+    except (OSError, NotImplementedError):
+        # No multiprocessing support (e.g. some serverless sandboxes)
+        yield from map(parse_template, paths)
+        return
+    try:
+        yield from executor.map(parse_template, paths)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def _print_event(kind, **data):
+    if kind != "progress" or "message" in data:
+        print(describe_event(kind, data))
+
+def seed_customers(events=None, workers=SEED_WORKERS, force=False, template_dir=TEMPLATE_DIR):
+    """
+    Create or update customers from the invoice templates.
+
+    Templates whose size/mtime or content hash match the manifest from the last run are
+    skipped (unless force is set or their customer has since been deleted). The rest are
+    parsed in a process pool, matched to existing customers with one query by name, and
+    written with one bulk insert and one bulk update. Existing customers keep their
+    next_bill_date. Reports each file through events(kind, **data) (printed when not
+    given) and returns counts of added/updated/unchanged customers.
+    """
+    emit = events or _print_event
     init_db()
     session = SessionLocal()
-    
-    # Ensure Management Fee exists
-    if not session.query(FeeType).filter_by(name="Management Fee").first():
-        session.add(FeeType(name="Management Fee"))
-        session.commit()
 
-    files = [f for f in os.listdir(TEMPLATE_DIR) if f.lower().endswith('.docx')]
-    
-    count = 0
-    for f in files:
-        if f == "base_invoice_template.docx" or f.startswith("~"):
-            continue
-            
-        path = os.path.join(TEMPLATE_DIR, f)
-        print(f"Processing {f}...")
-        
-        try:
-            doc = Document(path)
-            
-            name = ""
-            address = ""
-            email = ""
-            rate = 0.0
-            cadence = "monthly" # Default
-            fee_type = "Management Fee"
-            
-            for p in doc.paragraphs:
-                text = p.text.strip()
-                if not text:
-                    continue
-                
-                # Extract Name
-                if text.upper().startswith("TO:"):
-                    # Try to get name from same line
-                    parts = text.split(":", 1)
-                    if len(parts) > 1 and parts[1].strip():
-                        name = parts[1].strip()
-                    else:
-                        # Name might be on next line, but simple parsing is hard here.
-                        # Let's assume it's on the same line for now based on analysis.
-                        pass
-                
-                # Extract Address
-                if text.upper().startswith("FOR:"):
-                    parts = text.split(":", 1)
-                    if len(parts) > 1 and parts[1].strip():
-                        address = parts[1].strip()
-                
-                # Extract Email
-                email_matches = re.findall(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text)
-                for email_match in email_matches:
-                    # Filter out sender emails
-                    if "linda" not in email_match.lower() and "stonegate" not in email_match.lower():
-                         # Assume the first non-sender email is the customer's
-                         if not email or email == "change@me.com":
-                             email = email_match
-
-                # Extract Rate & Cadence from management line
-                if "management" in text.lower() or "quarter" in text.lower():
-                    line_rate = extract_money(text)
-                    if line_rate > 0:
-                        rate = line_rate
-                    
-                    if "quarter" in text.lower():
-                        cadence = "quarterly"
-                    elif "year" in text.lower() or "annual" in text.lower():
-                        cadence = "yearly"
-            
-            # Fallback for rate if not found in management line
-            if rate == 0:
-                for p in doc.paragraphs:
-                    if "Total due" in p.text:
-                        rate = extract_money(p.text)
-                        break
-
-            if name and address:
+    try:
+        # Ensure Management Fee exists
+        if not session.query(FeeType).filter_by(name="Management Fee").first():
+            session.add(FeeType(name="Management Fee"))
+            session.commit()
+
+        files = sorted(
+            f for f in os.listdir(template_dir)
+            if f.lower().endswith('.docx') and f != "base_invoice_template.docx" and not f.startswith("~")
+        )
+        manifest = {m.filename: m for m in session.query(TemplateManifest)}
+        existing = dict(session.query(Customer.name, Customer.id))
+
+        # Decide which files need parsing: size/mtime first, content hash when those changed
+        to_parse, file_info = [], {}
+        unchanged = 0
+        for f in files:
+            path = os.path.join(template_dir, f)
+            st = os.stat(path)
+            entry = manifest.get(f)
+            same_stat = entry is not None and entry.size == st.st_size and entry.mtime == st.st_mtime
+            digest = None if same_stat else _file_digest(path)
+            still_there = entry is not None and (entry.customer_name is None or entry.customer_name in existing)
+            if not force and still_there and (same_stat or entry.sha256 == digest):
+                if not same_stat:
+                    entry.mtime = st.st_mtime  # touched but not edited
+                unchanged += 1
+                emit("skipped", file=f, reason="unchanged", message=f"  -> Unchanged, skipping {f}")
+                continue
+            file_info[f] = (st.st_size, st.st_mtime, digest or _file_digest(path))
+            to_parse.append(path)
+
+        emit("progress", done=unchanged, total=len(files), message=f"Parsing {len(to_parse)} of {len(files)} templates...")
+
+        new_rows, updates, manifest_rows = {}, {}, []
+        for n, result in enumerate(_parse_all(to_parse, workers), start=unchanged + 1):
+            f = result["file"]
+            size, mtime, digest = file_info[f]
+            name = result.get("name")
+
+            if "error" in result:
+                emit("error", file=f, error=result["error"], message=f"  -> Error processing {f}: {result['error']}")
+            elif not (name and result["address"]):
+                emit("skipped", file=f, reason="no name or address",
+                     message=f"  -> Could not extract Name or Address from {f}")
+                manifest_rows.append(dict(filename=f, size=size, mtime=mtime, sha256=digest, customer_name=None))
+            else:
                 # Parse address into components
-                street, city, state, zip_code = parse_address(address)
-                
-               # Check if exists
-                existing = session.query(Customer).filter(Customer.name == name).first()
-                if not existing:
-                    print(f"  -> Adding {name} ({street}, {city}, {state} {zip_code}) - ${rate} {cadence}")
-                    c = Customer(
-                        name=name,
-                        email=email if email else "change@me.com",
-                        property_address=street,
-                        property_city=city,
-                        property_state=state,
-                        property_zip=zip_code,
-                        rate=rate,
-                        cadence=cadence,
-                        fee_type=fee_type,
-                        next_bill_date=date(2025, 10, 1)
-                    )
-                    session.add(c)
-                    count += 1
+                street, city, state, zip_code = parse_address(result["address"])
+                values = dict(
+                    name=name,
+                    property_address=street,
+                    property_city=city,
+                    property_state=state,
+                    property_zip=zip_code,
+                    rate=result["rate"],
+                    cadence=result["cadence"],
+                    fee_type="Management Fee",
+                )
+                if result["email"]:
+                    values["email"] = result["email"]
+                # A missing email is normal; other guesses are worth checking by hand
+                doubtful = [k for k, c in result["confidence"].items() if c < LOW_CONFIDENCE and k != "email"]
+                note = f" [check {', '.join(doubtful)}]" if doubtful else ""
+
+                # Later files for the same customer win, as they did when files were applied one by one
+                if name in existing:
+                    updates[name] = dict(values, id=existing[name])
+                    emit("customer", action="updated", file=f, name=name, check=doubtful,
+                         message=f"  -> Updating existing customer: {name}{note}")
+                elif name in new_rows:
+                    new_rows[name].update(values)
+                    emit("customer", action="updated", file=f, name=name, check=doubtful,
+                         message=f"  -> Updating existing customer: {name}{note}")
                 else:
-                    print(f"  -> Updating existing customer: {name}")
-                    # Force update all fields to match template
-                    existing.property_address = street
-                    existing.property_city = city
-                    existing.property_state = state
-                    existing.property_zip = zip_code
-                    existing.rate = rate
-                    existing.cadence = cadence
-                    existing.fee_type = fee_type
-                    # Reset next_bill_date to today so "Run Daily Batch" picks them up
-                    existing.next_bill_date = date(2025, 10, 1)
-                    
-                    if email:
-                        existing.email = email
-                    
-                    session.add(existing)
-                    count += 1
-            else:
-                print(f"  -> Could not extract Name or Address from {f}")
+                    values.setdefault("email", "change@me.com")
+                    # New customers start from the first billing period the templates cover
+                    new_rows[name] = dict(values, next_bill_date=NEW_CUSTOMER_BILL_DATE)
+                    emit("customer", action="added", file=f, name=name, check=doubtful,
+                         message=f"  -> Adding {name} ({street}, {city}, {state} {zip_code}) - ${result['rate']} {result['cadence']}{note}")
+                manifest_rows.append(dict(filename=f, size=size, mtime=mtime, sha256=digest, customer_name=name))
 
-        except Exception as e:
-            print(f"  -> Error processing {f}: {e}")
+            emit("progress", done=n, total=len(files))
+
+        if new_rows:
+            session.execute(insert(Customer), list(new_rows.values()))
+        if updates:
+            # next_bill_date is deliberately not part of the update
+            session.execute(update(Customer), list(updates.values()))
+        for row in manifest_rows:
+            session.merge(TemplateManifest(ingested_at=datetime.utcnow(), **row))
+        session.commit()
+    finally:
+        # A cancelled or failed run leaves the database as it was
+        session.close()
 
-    session.commit()
-    session.close()
-    print(f"Done! Added {count} new customers.")
+    summary = {"added": len(new_rows), "updated": len(updates), "unchanged": unchanged}
+    emit("progress", done=len(files), total=len(files),
+         message=f"Done! Added {summary['added']} new customers, updated {summary['updated']}, {unchanged} unchanged.")
+    return summary
 
 if __name__ == "__main__":
-    from datetime import date
-    seed_customers()
+    parser = argparse.ArgumentParser(description="Create or update customers from the invoice templates.")
+    parser.add_argument("--force", action="store_true", help="re-parse templates even if unchanged since the last run")
+    parser.add_argument("--workers", type=int, default=SEED_WORKERS, help="parser processes (1 = serial)")
+    args = parser.parse_args()
+    seed_customers(workers=args.workers, force=args.force)
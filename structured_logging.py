@@ -0,0 +1,167 @@
+"""
+JSON logging for the app. Records are formatted as one JSON object per line and
+handed to a QueueHandler; a background QueueListener thread does the actual I/O
+so a request never waits on stderr or the log file.
+
+Environment:
+    LOG_LEVEL              default level for all loggers (INFO)
+    LOG_LEVELS             per-module overrides, e.g. "invoice_generator=DEBUG,werkzeug=WARNING"
+    LOG_DEBUG_SAMPLE_RATE  fraction of requests whose DEBUG records are kept (0.1)
+    LOG_FILE               also write records to this file
+    LOG_CUSTOMER_DATA      set to 1 to log customer fields unredacted (off by default)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from flask import request, g, has_app_context
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_FILE = os.getenv("LOG_FILE")
+LOG_CUSTOMER_DATA = os.getenv("LOG_CUSTOMER_DATA") == "1"
+
+# Extra fields that can identify a customer; replaced unless LOG_CUSTOMER_DATA=1
+SENSITIVE_FIELDS = {
+    "customer_name", "email", "property_address", "property_city", "property_state",
+    "property_zip", "address", "form", "email_body",
+}
+REDACTED = "[redacted]"
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request id (or None outside a request) to every record."""
+
+    def filter(self, record):
+        record.request_id = g.get("request_id") if has_app_context() else None
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keep DEBUG records for a sample of requests. The decision is made per request id,
+    so a sampled request keeps its whole debug trail instead of scattered lines.
+    """
+
+    def __init__(self, rate=LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        if self.rate <= 0:
+            return False
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random.random() < self.rate
+        return zlib.crc32(request_id.encode()) % 10000 < self.rate * 10000
+
+
+class RedactingFilter(logging.Filter):
+    def __init__(self, enabled=not LOG_CUSTOMER_DATA):
+        super().__init__()
+        self.enabled = enabled
+
+    def filter(self, record):
+        if self.enabled:
+            for key in SENSITIVE_FIELDS & set(vars(record)):
+                setattr(record, key, REDACTED)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=LOG_LEVEL, levels=LOG_LEVELS, log_file=LOG_FILE):
+    """Route the root logger through a queue to a background writer thread. Safe to call repeatedly."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    # Records are filtered and rendered to JSON on the caller's thread, where the request
+    # context lives; the listener thread only writes the finished lines
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.setFormatter(JsonFormatter())
+    for log_filter in (RequestContextFilter(), DebugSamplingFilter(), RedactingFilter()):
+        queue_handler.addFilter(log_filter)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    for name, module_level in _parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def init_app(app):
+    """Give each request an id (honouring X-Request-ID) and log one line per completed request."""
+    configure_logging()
+    access_log = logging.getLogger("invoice_app.request")
+
+    @app.before_request
+    def assign_request_id():
+        g.request_started = time.perf_counter()
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+    @app.after_request
+    def log_request(response):
+        response.headers["X-Request-ID"] = g.get("request_id", "")
+        if "request_started" in g:
+            access_log.debug(
+                "request completed",
+                extra={
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "duration_ms": round((time.perf_counter() - g.request_started) * 1000, 1),
+                },
+            )
+        return response
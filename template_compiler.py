@@ -0,0 +1,257 @@
+"""
+Template compiler and linter.
+
+Checks every .docx in invoice_templates/ against the placeholders the generator
+fills (invoice_generator.PLACEHOLDERS) and records which paragraphs hold which
+placeholders in a manifest, invoice_templates/placeholders.json. The renderer
+loads it once and visits only those paragraphs, instead of reading the text of
+every paragraph and table cell on every render.
+
+    python template_compiler.py            # lint, exit 1 on errors
+    python template_compiler.py --write    # lint and rewrite the manifest
+    python template_compiler.py --check    # also exit 1 if the manifest is out of date
+
+Errors are placeholders the generator never fills, placeholders the renderer
+can't see (in a tracked change, field, text box, header or footer), stray
+"{{" or "}}", and placeholders on the line (paragraph or table row) of
+{{ADDITIONAL_FEE_LINE}}, which is repeated once per fee line item. Warnings are placeholders split across runs and generator
+placeholders a template doesn't use. Legacy invoices without any placeholder
+are skipped.
+
+The manifest is keyed by each template's SHA-256; when it is missing or stale
+the renderer compiles the template in memory (and logs a warning) rather than
+writing to the read-only deployment filesystem.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, "invoice_templates")
+MANIFEST_PATH = os.path.join(TEMPLATE_DIR, "placeholders.json")
+MANIFEST_VERSION = 1
+
+PLACEHOLDER = re.compile(r"{{.*?}}")
+
+_loaded = {}  # template path -> ((mtime_ns, size), entries)
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _paragraphs(doc):
+    """(location, paragraph) for every paragraph the renderer fills, in the order it fills them."""
+    for i, p in enumerate(doc.paragraphs):
+        yield ("body", i), p
+    for t, table in enumerate(doc.tables):
+        for r, row in enumerate(table.rows):
+            seen = set()
+            for c, cell in enumerate(row.cells):
+                # A merged cell is repeated in row.cells; record it once
+                if cell._tc in seen:
+                    continue
+                seen.add(cell._tc)
+                for k, p in enumerate(cell.paragraphs):
+                    yield ("table", t, r, c, k), p
+
+
+def _other_paragraphs(doc):
+    for s, section in enumerate(doc.sections):
+        for part in ("header", "footer"):
+            container = getattr(section, part)
+            if not container.is_linked_to_previous:
+                for i, p in enumerate(container.paragraphs):
+                    yield (part, s, i), p
+
+
+def _all_text(paragraph):
+    """Text of every w:t under the paragraph, including what python-docx leaves out of p.text."""
+    from docx.oxml.ns import qn
+    return "".join(t.text or "" for t in paragraph._p.iter(qn("w:t")))
+
+
+def compile_template(path, placeholders=None):
+    """
+    Return the manifest entry for one template: its sha256, the paragraphs holding
+    placeholders ({"location", "placeholders"}) and lint problems ({"level", "message",
+    "location"}). Returns None for a document without any placeholder.
+    """
+    from docx import Document
+    from invoice_generator import REPEATED_LINE_PLACEHOLDER
+    if placeholders is None:
+        from invoice_generator import PLACEHOLDERS as placeholders
+
+    doc = Document(path)
+    paragraphs, problems, used = [], [], set()
+
+    def problem(level, message, location):
+        problems.append({"level": level, "message": message, "location": list(location)})
+
+    for location, p in _paragraphs(doc):
+        text = p.text
+        names = PLACEHOLDER.findall(text)
+        for name in _missing(PLACEHOLDER.findall(_all_text(p)), names):
+            problem("error", f"{name} is in a tracked change, field or text box, so it is never replaced", location)
+        stray = PLACEHOLDER.sub("", text)
+        if "{{" in stray or "}}" in stray:
+            problem("error", f"stray braces in {text.strip()!r}; is a placeholder mistyped?", location)
+        if not names:
+            continue
+        runs = [r.text for r in p.runs]
+        for name in dict.fromkeys(names):
+            if name not in placeholders:
+                problem("error", f"{name} is never filled by the generator and would stay in every invoice", location)
+            if not any(name in run for run in runs):
+                problem("warning", f"{name} is split across runs; retype it in one go", location)
+        used.update(names)
+        paragraphs.append({"location": list(location), "placeholders": list(dict.fromkeys(names))})
+
+    lines = {}
+    for entry in paragraphs:
+        location = entry["location"]
+        lines.setdefault(tuple(location[:3]), []).extend(entry["placeholders"])
+    for line, names in lines.items():
+        if REPEATED_LINE_PLACEHOLDER in names:
+            for name in dict.fromkeys(names):
+                if name != REPEATED_LINE_PLACEHOLDER:
+                    problem("error", f"{name} shares a line with {REPEATED_LINE_PLACEHOLDER}, "
+                                     "so it would be repeated on every fee line", line)
+
+    for location, p in _other_paragraphs(doc):
+        for name in dict.fromkeys(PLACEHOLDER.findall(_all_text(p))):
+            problem("error", f"{name} is in a {location[0]}, which the renderer doesn't fill", location)
+
+    if not paragraphs and not problems:
+        return None
+    for name in placeholders:
+        if name not in used:
+            problems.append({"level": "warning", "message": f"{name} is not used by the template", "location": None})
+    return {"sha256": file_sha256(path), "paragraphs": paragraphs, "problems": problems}
+
+
+def _missing(found, present):
+    remaining = list(present)
+    for name in found:
+        if name in remaining:
+            remaining.remove(name)
+        else:
+            yield name
+
+
+def compile_templates(template_dir=TEMPLATE_DIR):
+    """Compile every template in the directory into a manifest dict; documents without placeholders are left out."""
+    templates = {}
+    for filename in sorted(os.listdir(template_dir)):
+        if not filename.lower().endswith(".docx") or filename.startswith("~"):
+            continue
+        entry = compile_template(os.path.join(template_dir, filename))
+        if entry is not None:
+            templates[filename] = entry
+    return {"version": MANIFEST_VERSION, "templates": templates}
+
+
+def write_manifest(manifest, path=MANIFEST_PATH):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def read_manifest(path=MANIFEST_PATH):
+    """The manifest dict, or None if it is missing, unreadable or from another version."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def placeholder_paragraphs(template_path, manifest_path=MANIFEST_PATH):
+    """
+    Paragraph entries of the manifest for template_path, loaded once per template
+    version. A missing or stale manifest entry is compiled in memory instead.
+    """
+    stat = os.stat(template_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _loaded.get(template_path)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    manifest = read_manifest(manifest_path) or {"templates": {}}
+    entry = manifest["templates"].get(os.path.basename(template_path))
+    if entry is None or entry["sha256"] != file_sha256(template_path):
+        logger.warning("placeholder manifest missing or stale, compiling template",
+                       extra={"template": os.path.basename(template_path)})
+        entry = compile_template(template_path) or {"paragraphs": []}
+    entries = [(tuple(p["location"]), tuple(p["placeholders"])) for p in entry["paragraphs"]]
+    _loaded[template_path] = (version, entries)
+    return entries
+
+
+def scan(doc):
+    """Manifest-style paragraph entries found by reading every paragraph of a loaded document."""
+    entries = []
+    for location, p in _paragraphs(doc):
+        names = PLACEHOLDER.findall(p.text)
+        if names:
+            entries.append((location, tuple(dict.fromkeys(names))))
+    return entries
+
+
+def locate(doc, entries):
+    """
+    Resolve manifest entries against a freshly loaded document: a list of
+    (paragraph, line, placeholders), where line is the element to drop to remove
+    the paragraph's line (the paragraph itself, or its table row). Resolve before
+    removing anything, as removals shift the recorded positions. Raises IndexError
+    if the document doesn't have a recorded position.
+    """
+    located = []
+    for location, names in entries:
+        if location[0] == "body":
+            p = doc.paragraphs[location[1]]
+            located.append((p, p._p, names))
+        else:
+            _, t, r, c, k = location
+            row = doc.tables[t].rows[r]
+            located.append((row.cells[c].paragraphs[k], row._tr, names))
+    return located
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=TEMPLATE_DIR)
+    parser.add_argument("--write", action="store_true", help="rewrite placeholders.json in --dir")
+    parser.add_argument("--check", action="store_true", help="fail if placeholders.json is out of date")
+    args = parser.parse_args(argv)
+
+    manifest_path = os.path.join(args.dir, os.path.basename(MANIFEST_PATH))
+    manifest = compile_templates(args.dir)
+    errors = 0
+    for filename, entry in manifest["templates"].items():
+        count = sum(len(p["placeholders"]) for p in entry["paragraphs"])
+        print(f"{filename}: {count} placeholders in {len(entry['paragraphs'])} paragraphs")
+        for problem in entry["problems"]:
+            where = "" if problem["location"] is None else " at " + "/".join(map(str, problem["location"]))
+            print(f"  {problem['level']}{where}: {problem['message']}")
+            errors += problem["level"] == "error"
+
+    if args.write:
+        write_manifest(manifest, manifest_path)
+        print(f"wrote {manifest_path}")
+    elif args.check and read_manifest(manifest_path) != manifest:
+        print(f"{manifest_path} is out of date; run with --write")
+        errors += 1
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
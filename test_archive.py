@@ -0,0 +1,153 @@
+import unittest
+from datetime import date, timedelta
+from app import app, init_db, SessionLocal
+from sqlalchemy import text
+from models import Customer, Invoice, InvoiceLine, ArchivedInvoice, migrate_autoincrement
+from reports import outstanding_by_customer
+from archive import archive_paid_invoices
+from search import search, ensure_search_index
+from testing import use_temp_database
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+        self.engine = use_temp_database(self)  # archiving moves every old paid invoice it finds
+
+    def test_archive_moves_old_paid_invoices(self):
+        print("\nTesting archive of old paid invoices...")
+        session = SessionLocal()
+        c = Customer(name="Archive Customer", email="a@example.com", property_address="5 Quillfeather Ln",
+                     rate=300.0, cadence="yearly", next_bill_date=date.today())
+        session.add(c)
+        session.commit()
+        old_paid = Invoice(customer_id=c.id, invoice_date=date.today() - timedelta(days=800),
+                           period_label="2023", amount=300.0, file_path="Invoice_2023_Quillfeather_Ln.docx",
+                           email_subject="Invoice – 2023 – 5 Quillfeather Ln", email_body="Body",
+                           status="Paid", paid_date=date.today() - timedelta(days=790))
+        old_unpaid = Invoice(customer_id=c.id, invoice_date=date.today() - timedelta(days=800),
+                             period_label="2023", amount=300.0, file_path="unpaid.docx",
+                             email_subject="Unpaid", email_body="Body")
+        session.add_all([old_paid, old_unpaid])
+        session.commit()
+        paid_id, unpaid_id = old_paid.id, old_unpaid.id
+        session.close()
+
+        self.assertEqual(archive_paid_invoices(max_age_days=365), 1)
+
+        session = SessionLocal()
+        self.assertIsNone(session.query(Invoice).get(paid_id))
+        self.assertIsNotNone(session.query(Invoice).get(unpaid_id))
+        archived = session.query(ArchivedInvoice).get(paid_id)
+        self.assertIsNotNone(archived)
+        self.assertEqual(archived.paid_date, date.today() - timedelta(days=790))
+        self.assertTrue(archived.document.startswith(b"PK"))
+
+        # Still findable and downloadable through the archive path
+        hits = search(session, "quillfeather")
+        self.assertIn(("archived_invoice", paid_id), [(r["kind"], r["ref_id"]) for r in hits])
+        session.close()
+
+        response = self.client.get(f'/archive/{paid_id}/download')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data.startswith(b"PK"))
+
+    def test_new_invoice_does_not_inherit_archived_lines(self):
+        session = SessionLocal()
+        c = Customer(name="Archive Lines Customer", email="l@example.com", property_address="9 Reuse Rd",
+                     rate=100.0, cadence="yearly", next_bill_date=date.today())
+        session.add(c)
+        session.commit()
+        # Newest invoice, so SQLite hands its id out again once it is archived
+        old = Invoice(customer_id=c.id, invoice_date=date.today() - timedelta(days=800), period_label="2023",
+                      amount=100.0, file_path="reuse.docx", email_subject="Old", email_body="Body",
+                      status="Paid", paid_date=date.today() - timedelta(days=790),
+                      lines=[InvoiceLine(fee_type="Trash", amount=25.0, position=0)])
+        session.add(old)
+        session.commit()
+        old_id, customer_id = old.id, c.id
+        session.close()
+
+        archive_paid_invoices(max_age_days=365, render=False)
+
+        session = SessionLocal()
+        new = Invoice(customer_id=customer_id, invoice_date=date.today(), period_label="2026",
+                      amount=100.0, file_path="new.docx", email_subject="New", email_body="Body")
+        session.add(new)
+        session.commit()
+        self.assertEqual(new.lines, [])
+        balances = {row["customer_id"]: row["balance"] for row in outstanding_by_customer(session)}
+        self.assertEqual(balances[customer_id], 100.0)
+        archived = session.query(ArchivedInvoice).get(old_id)
+        self.assertEqual([(l.fee_type, l.amount) for l in archived.lines], [("Trash", 25.0)])
+        session.close()
+
+    def _paid_invoice(self, session, customer_id, label):
+        invoice = Invoice(customer_id=customer_id, invoice_date=date.today() - timedelta(days=800), period_label=label,
+                          amount=100.0, file_path=f"{label}.docx", email_subject=label, email_body="Body",
+                          status="Paid", paid_date=date.today() - timedelta(days=790),
+                          lines=[InvoiceLine(fee_type="Trash", amount=25.0, position=0)])
+        session.add(invoice)
+        session.commit()
+        return invoice.id, invoice.lines[0].id
+
+    def test_archiving_twice_never_reuses_an_id(self):
+        session = SessionLocal()
+        c = Customer(name="Archive Twice Customer", email="t@example.com", property_address="3 Twice Ct",
+                     rate=100.0, cadence="yearly", next_bill_date=date.today())
+        session.add(c)
+        session.commit()
+        customer_id = c.id
+        first = self._paid_invoice(session, customer_id, "First")
+        session.close()
+        self.assertEqual(archive_paid_invoices(max_age_days=365, render=False), 1)
+
+        session = SessionLocal()
+        second = self._paid_invoice(session, customer_id, "Second")
+        session.close()
+        self.assertGreater(second, first)  # both the invoice and its line id
+        self.assertEqual(archive_paid_invoices(max_age_days=365, render=False), 1)
+
+        session = SessionLocal()
+        archived = {a.id: (a.period_label, [l.id for l in a.lines]) for a in session.query(ArchivedInvoice)}
+        self.assertEqual(archived, {first[0]: ("First", [first[1]]), second[0]: ("Second", [second[1]])})
+        session.close()
+
+    def test_existing_tables_are_rebuilt_with_autoincrement(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP TABLE invoices"))
+            # As created before the tables were declared with AUTOINCREMENT
+            conn.execute(text(
+                "CREATE TABLE invoices (id INTEGER NOT NULL PRIMARY KEY, customer_id INTEGER NOT NULL, "
+                "invoice_date DATE NOT NULL, period_label VARCHAR NOT NULL, amount FLOAT NOT NULL, "
+                "file_path VARCHAR NOT NULL, email_subject VARCHAR NOT NULL, email_body TEXT NOT NULL, status VARCHAR)"
+            ))
+            conn.execute(text("CREATE INDEX ix_invoices_status_date ON invoices (status, invoice_date)"))
+            conn.execute(text(
+                "INSERT INTO invoices (id, customer_id, invoice_date, period_label, amount, file_path, email_subject, "
+                "email_body, status) VALUES (4, 1, '2026-01-01', 'Kept', 10, 'k.docx', 'Kept', 'Body', 'Unpaid')"
+            ))
+            conn.execute(text(
+                "INSERT INTO invoices_archive (id, customer_id, invoice_date, period_label, amount, file_path, "
+                "email_subject, email_body, archived_at) VALUES (9, 1, '2024-01-01', 'Gone', 10, 'g.docx', 'Gone', 'Body', '2026-01-01')"
+            ))
+
+        self.assertEqual(migrate_autoincrement(self.engine), ["invoices"])
+        self.assertEqual(migrate_autoincrement(self.engine), [])
+        ensure_search_index(self.engine)  # as init_db does next
+
+        session = SessionLocal()
+        self.assertEqual(session.query(Invoice).get(4).period_label, "Kept")
+        new = Invoice(customer_id=1, invoice_date=date.today(), period_label="New", amount=10.0,
+                      file_path="n.docx", email_subject="New", email_body="Body")
+        session.add(new)
+        session.commit()
+        self.assertEqual(new.id, 10)  # past the archived invoice, not 5
+        self.assertIn(("invoice", new.id), [(r["kind"], r["ref_id"]) for r in search(session, "new")])
+        session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
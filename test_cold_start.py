@@ -0,0 +1,21 @@
+import subprocess
+import sys
+import unittest
+from profile_startup import BASE_DIR, LAZY_MODULES
+
+
+class TestColdStart(unittest.TestCase):
+    def test_import_app_skips_heavy_modules(self):
+        check = f"import sys, app; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", check], cwd=BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), [])
+
+    def test_first_request_creates_schema(self):
+        from app import app
+        response = app.test_client().get('/customers')
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import io
+import unittest
+from unittest.mock import patch
+import cold_starts
+from cold_starts import analyze
+
+
+def request(ts, route, duration, instance, deployment="dpl_a", concurrency=1, memory=128):
+    return {"timestampInMs": str(ts), "requestPath": "host.vercel.app" + route, "durationMs": str(duration),
+            "instanceId": instance, "deploymentId": deployment, "concurrency": str(concurrency),
+            "maxMemoryUsed": str(memory)}
+
+
+# Newest first, like log_analytics.iter_rows
+ROWS = [
+    request(9000, "/customers", 60, "i2", "dpl_b"),
+    request(8000, "/customers", 900, "i2", "dpl_b"),  # i2's cold start after an import-time fix
+    request(7000, "/run-today", 3000, "", "dpl_b"),  # crashed while starting
+    request(5000, "/customers", 40, "i1", concurrency=3, memory=140),
+    request(4000, "/customers", 50, "i1"),
+    request(3000, "/run-today", 45, "i1"),
+    request(1000, "/customers", 2550, "i1"),  # i1's cold start
+]
+
+
+class TestColdStarts(unittest.TestCase):
+    def test_instance_lifecycle_and_penalties(self):
+        analysis = analyze(ROWS)
+        summary = analysis.summary()
+        self.assertEqual((summary["instances"], summary["failed_starts"], summary["requests"]), (2, 1, 7))
+        self.assertEqual((summary["max_concurrency"], summary["peak_memory_mb"]), (3, 140))
+        self.assertEqual(summary["median_lifetime_s"], 2.5)  # i1 lived 4s, i2 1s
+
+        customers = analysis.routes["/customers"].as_dict()
+        self.assertEqual((customers["cold_starts"], customers["warm_requests"]), (2, 3))
+        self.assertEqual(customers["warm_p50_ms"], 50)
+        self.assertEqual(customers["excess_ms"], (2550 - 50) + (900 - 50))
+        self.assertEqual(analysis.routes["/run-today"].as_dict()["failed_starts"], 1)
+
+        self.assertEqual(analysis.deployments["dpl_a"].as_dict()["penalty_p50_ms"], 2500)
+        self.assertEqual(analysis.deployments["dpl_b"].as_dict()["penalty_p50_ms"], 850)
+        self.assertEqual(summary["cold_start_excess_ms"], 3350)
+
+    def test_route_with_only_a_cold_start(self):
+        analysis = analyze([request(3000, "/customers", 50, "i1"), request(2000, "/customers", 500, "i1"),
+                            request(1000, "/only", 100, "i9")])
+        only = analysis.routes["/only"].as_dict()
+        self.assertEqual((only["cold_starts"], only["warm_requests"]), (1, 0))
+        self.assertEqual(only["excess_ms"], 50)  # against the warm median of all routes
+
+    def test_repo_exports(self):
+        with patch("sys.stdout", io.StringIO()) as out:
+            self.assertEqual(cold_starts.main(["--routes", "3"]), 0)
+        self.assertIn("cold starts cost", out.getvalue())
+        self.assertIn("deployment (oldest first)", out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import os
+import unittest
+import zipfile
+from unittest.mock import patch
+from docx import Document
+import docx_text
+from docx_text import Paragraph, iter_paragraphs, iter_table_rows
+from seed_from_templates import TEMPLATE_DIR, parse_template
+
+TEMPLATES = sorted(
+    os.path.join(TEMPLATE_DIR, f) for f in os.listdir(TEMPLATE_DIR)
+    if f.lower().endswith(".docx") and not f.startswith("~")
+)
+
+DOCUMENT_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+<w:body>
+<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/></w:tabs></w:pPr>
+  <w:r><w:t>TO:</w:t><w:tab/><w:t xml:space="preserve">Smith &amp; Sons </w:t></w:r>
+  <w:hyperlink><w:r><w:t>&lt;link&gt;</w:t></w:r></w:hyperlink>
+  <w:ins><w:r><w:t>tracked</w:t></w:r></w:ins>
+</w:p>
+<w:p><w:r><w:t>line</w:t><w:br/><w:t>next</w:t><w:br w:type="page"/><w:t/></w:r></w:p>
+<w:p/>
+<w:p><w:r><w:t>outer</w:t><w:drawing><w:txbxContent><w:p><w:r><w:t>boxed</w:t></w:r></w:p></w:txbxContent></w:drawing></w:r></w:p>
+<w:tbl>
+  <w:tr><w:tc><w:p><w:r><w:t>a1</w:t></w:r></w:p><w:p><w:r><w:t>a2</w:t></w:r></w:p></w:tc><w:tc><w:p/></w:tc></w:tr>
+  <w:tr><w:tc><w:tbl><w:tr><w:tc><w:p><w:r><w:t>inner</w:t></w:r></w:p></w:tc></w:tr></w:tbl><w:p/></w:tc></w:tr>
+</w:tbl>
+<w:sectPr/>
+</w:body>
+</w:document>"""
+
+
+def make_docx(document_xml):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("word/document.xml", document_xml)
+    buffer.seek(0)
+    return buffer
+
+
+class TestDocxText(unittest.TestCase):
+    def test_matches_python_docx_on_templates(self):
+        print("\nTesting streaming docx text against python-docx...")
+        for path in TEMPLATES:
+            doc = Document(path)
+            paragraphs = list(iter_paragraphs(path))
+            with self.subTest(template=os.path.basename(path)):
+                self.assertEqual([p.text for p in paragraphs if p.table is None],
+                                 [p.text for p in doc.paragraphs])
+                self.assertEqual([cells for _, _, cells in iter_table_rows(path)],
+                                 [[c.text for c in row.cells] for t in doc.tables for row in t.rows])
+
+    def test_text_rules(self):
+        self.assertEqual(list(iter_paragraphs(make_docx(DOCUMENT_XML))), [
+            Paragraph("TO:\tSmith & Sons <link>", None, None, None),
+            Paragraph("line\nnext", None, None, None),
+            Paragraph("", None, None, None),
+            Paragraph("outer", None, None, None),
+            Paragraph("a1", 0, 0, 0),
+            Paragraph("a2", 0, 0, 0),
+            Paragraph("", 0, 0, 1),
+            Paragraph("inner", 0, 1, 0),
+            Paragraph("", 0, 1, 0),
+        ])
+
+    def test_small_chunks(self):
+        expected = list(iter_paragraphs(make_docx(DOCUMENT_XML)))
+        for size in (1, 7, 64):
+            with patch.object(docx_text, "CHUNK_SIZE", size):
+                self.assertEqual(list(iter_paragraphs(make_docx(DOCUMENT_XML))), expected)
+
+    def test_other_namespace_prefix(self):
+        xml = DOCUMENT_XML.replace("w:", "x:").replace("xmlns:w=", "xmlns:x=")
+        self.assertEqual(list(iter_paragraphs(make_docx(xml))), list(iter_paragraphs(make_docx(DOCUMENT_XML))))
+
+    def test_unreadable_template(self):
+        path = os.path.join(os.path.dirname(TEMPLATES[0]), "..", "requirements.txt")
+        self.assertIn("error", parse_template(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import email
+import smtplib
+import socket
+import unittest
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import email_outbox
+from app import app, init_db, SessionLocal
+from email_outbox import SmtpUnavailable, deliver_outbox
+from models import Customer, OutboxEmail
+from testing import use_temp_database
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class Recorder:
+    """aiosmtpd handler that keeps every message and refuses the recipients in `refuse`."""
+
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+        self.refuse = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return self.refuse[address]
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.add(session.peer)
+        self.messages.append(email.message_from_bytes(envelope.content))
+        return "250 Message accepted for delivery"
+
+
+class FakeSmtp:
+    def __init__(self, sent, disconnect_once=False):
+        self.sent = sent
+        self.disconnect_once = disconnect_once
+
+    def send_message(self, message):
+        if self.disconnect_once:
+            self.disconnect_once = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.sent.append(message["To"])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestEmailOutbox(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+        # deliver_outbox sends everything queued, so each test gets an outbox of its own
+        use_temp_database(self)
+
+    def _invoices(self, count, invoice_date):
+        session = SessionLocal()
+        customers = [
+            Customer(name=f"Mail {i}", email=f"mail{i}@example.com", property_address=f"{i} Mail St",
+                     rate=100.0 + i, cadence="monthly", next_bill_date=date.today())
+            for i in range(count)
+        ]
+        session.add_all(customers)
+        session.commit()
+        ids = [c.id for c in customers]
+        session.close()
+        response = self.client.post('/api/invoices/generate', json={"customer_ids": ids, "invoice_date": invoice_date})
+        return [r["invoice_id"] for r in response.get_json()["results"]]
+
+    def _outbox(self):
+        session = SessionLocal()
+        rows = {row.invoice_id: row for row in session.query(OutboxEmail)}
+        session.close()
+        return rows
+
+    def _smtp_server(self):
+        handler = Recorder()
+        controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+        controller.start()
+        self.addCleanup(controller.stop)
+        for name, value in (("SMTP_HOST", "127.0.0.1"), ("SMTP_PORT", controller.port),
+                            ("SMTP_STARTTLS", False), ("SMTP_USER", ""), ("EMAIL_FROM", "billing@example.com")):
+            patcher = patch.object(email_outbox, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return handler
+
+    @unittest.skipUnless(Controller, "aiosmtpd is not installed")
+    @patch.object(email_outbox, "EMAIL_BATCH_SIZE", 25)
+    def test_one_pass_sends_the_period_over_one_connection(self):
+        print("\nTesting batched outbox delivery...")
+        handler = self._smtp_server()
+        invoice_ids = self._invoices(60, "2034-03-01")
+        response = self.client.post('/api/invoices/email', json={"period_label": "March 2034"})
+        self.assertEqual([r["status"] for r in response.get_json()["results"]], ["queued"] * 60)
+        response = self.client.post('/api/invoices/email', json={"ids": invoice_ids[:1] + [999999]})
+        self.assertEqual([r["status"] for r in response.get_json()["results"]], ["already_queued", "not_found"])
+
+        self.assertEqual(deliver_outbox(), {"sent": 60, "retrying": 0, "failed": 0})
+        self.assertEqual(len(handler.messages), 60)
+        self.assertEqual(len(handler.peers), 1)
+        message = handler.messages[0]
+        self.assertEqual(message["From"], "billing@example.com")
+        attachment = next(part for part in message.walk() if part.get_filename())
+        self.assertTrue(attachment.get_filename().endswith(".docx"))
+        self.assertTrue(attachment.get_payload(decode=True).startswith(b"PK"))
+        self.assertEqual({row.status for row in self._outbox().values()}, {"sent"})
+
+        self.assertEqual(deliver_outbox(), {"sent": 0, "retrying": 0, "failed": 0})
+        response = self.client.post('/api/invoices/email', json={"ids": invoice_ids[:1]})
+        self.assertEqual(response.get_json()["results"][0]["status"], "already_sent")
+
+    @unittest.skipUnless(Controller, "aiosmtpd is not installed")
+    def test_temporary_failures_back_off_and_permanent_ones_fail(self):
+        handler = self._smtp_server()
+        invoice_ids = self._invoices(3, "2034-04-01")
+        self.client.post('/api/invoices/email', json={"ids": invoice_ids})
+        handler.refuse = {"mail0@example.com": "451 4.3.0 Try again later",
+                          "mail1@example.com": "550 5.1.1 No such user"}
+
+        started = datetime.utcnow()
+        self.assertEqual(deliver_outbox(), {"sent": 1, "retrying": 1, "failed": 1})
+        rows = self._outbox()
+        retrying, failed = rows[invoice_ids[0]], rows[invoice_ids[1]]
+        self.assertEqual((retrying.status, retrying.attempts), ("queued", 1))
+        self.assertGreaterEqual(retrying.next_attempt_at, started + timedelta(seconds=email_outbox.EMAIL_RETRY_DELAY))
+        self.assertIn("451", retrying.last_error)
+        self.assertEqual(failed.status, "failed")
+        self.assertEqual(rows[invoice_ids[2]].status, "sent")
+
+        # Not due yet, then sent once the backoff has passed
+        handler.refuse = {}
+        self.assertEqual(deliver_outbox()["sent"], 0)
+        later = lambda: datetime.utcnow() + timedelta(seconds=email_outbox.EMAIL_RETRY_DELAY + 1)
+        self.assertEqual(deliver_outbox(now=later), {"sent": 1, "retrying": 0, "failed": 0})
+        self.assertEqual(self._outbox()[invoice_ids[0]].attempts, 2)
+
+    @patch.object(email_outbox, "EMAIL_BATCH_SIZE", 2)
+    @patch.object(email_outbox, "EMAIL_MAX_PER_MINUTE", 60)
+    def test_rate_limit_and_reconnect(self):
+        invoice_ids = self._invoices(5, "2034-05-01")
+        self.client.post('/api/invoices/email', json={"ids": invoice_ids})
+        sent, connections, waits = [], [], []
+
+        def connect():
+            connections.append(FakeSmtp(sent, disconnect_once=not connections))
+            return connections[-1]
+
+        self.assertEqual(deliver_outbox(connect=connect, sleep=waits.append)["sent"], 5)
+        self.assertEqual(len(sent), 5)
+        self.assertEqual(len(connections), 2)  # the first one hung up
+        self.assertEqual(len(waits), 2)  # between the three batches
+        self.assertTrue(all(1.5 < wait <= 2 for wait in waits))
+
+    def test_unreachable_server_leaves_queue_untouched(self):
+        invoice_ids = self._invoices(2, "2034-06-01")
+        self.client.post('/api/invoices/email', json={"ids": invoice_ids})
+
+        def connect():
+            raise ConnectionRefusedError("Connection refused")
+
+        with self.assertRaises(SmtpUnavailable):
+            deliver_outbox(connect=connect)
+        self.assertEqual({(row.status, row.attempts) for row in self._outbox().values()}, {("queued", 0)})
+
+    def test_new_invoice_is_not_taken_for_a_deleted_one(self):
+        # The newest invoice's id is the one SQLite would hand out again without AUTOINCREMENT
+        sent = []
+        old_id = self._invoices(1, "2034-07-01")[0]
+        self.client.post('/api/invoices/email', json={"ids": [old_id]})
+        deliver_outbox(connect=lambda: FakeSmtp(sent))
+        self.client.post(f'/invoices/{old_id}/delete')
+
+        new_id = self._invoices(1, "2034-08-01")[0]
+        self.assertNotEqual(new_id, old_id)
+        response = self.client.post('/api/invoices/email', json={"ids": [new_id]})
+        self.assertEqual(response.get_json()["results"], [{"id": new_id, "status": "queued"}])
+        self.assertEqual(deliver_outbox(connect=lambda: FakeSmtp(sent))["sent"], 1)
+        self.assertEqual(len(sent), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
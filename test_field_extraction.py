@@ -0,0 +1,77 @@
+import os
+import unittest
+from field_extraction import Extractor, Field, Rule, customer_extractor, parse_address
+from seed_from_templates import TEMPLATE_DIR, parse_template
+
+# What a person reading each template would enter: name, (street, city, state, zip), email, rate, cadence
+EXPECTED = {
+    'Comm inv 3rd quarter 2025 Georges and Tanglewood + Golf View release.docx': (
+        'Bashar Ayoub & Kristen Gebhart', ('1160 Georges Ave', 'Brookfield', '', ''), '', 300.0, 'quarterly'),
+    'Comm inv. River Heights 2025 3rd quarter.docx': (
+        'Suresh Gopalakrishnan', ('N62W12921 River Heights Dr', '', '', ''), 'Suresh.gopalakrishnan@yahoo.com', 150.0, 'quarterly'),
+    'Comm. inv. 2025 2nd quarter 115th ST.docx': (
+        'Greenfield Park Lutheran Church', ('1214 S 115th ST', 'West Allis', 'WI', '53214'), '', 150.0, 'quarterly'),
+    'Comm. inv. 3rd quarter 2025 Le Jardin.docx': (
+        'Karthik Palaniappan', ('2085 Le Jardin Ct.', '', '', ''), 'ichbinplk@hotmail.com', 150.0, 'quarterly'),
+    'Comm. invoice 2025 3rd quarter 1133 Sunset Dr  .docx': (
+        'Joyce Hartmann', ('1133 W Sunset DR', 'Waukesha', 'WI', ''), 'Jhartmann4@outlook.com', 150.0, 'quarterly'),
+    'Comm. invoice 3rd quarter 2025 Fairview .docx': (
+        'Alexander Whitfield', ('16840 Fairview Ct', 'Brookfield', '', ''), '', 150.0, 'quarterly'),
+    'Comm. invoice 3rd quarter 2025 Loomis Rd.docx': (
+        'Indian Community School of Milwaukee', ('10398 W Loomis Rd', 'Franklin', 'WI', ''), '', 150.0, 'quarterly'),
+    'Comm. invoice 3rd quarter 2025 Swartz .docx': (
+        'Phillip Smith', ('1701 Swartz Dr', 'Waukesha', 'WI', ''), 'Pwsmith85@yahoo.com', 150.0, 'quarterly'),
+    'Comm. invoice 4th quarter 2025 73rd St.docx': (
+        'Dongyuan Chjeng', ('2626 N 73rd St', 'Wauwatosa', 'WI', ''), '', 150.0, 'quarterly'),
+}
+
+
+class TestFieldExtraction(unittest.TestCase):
+    def test_template_corpus(self):
+        print("\nTesting field extraction on the template corpus...")
+        for filename, (name, address, email, rate, cadence) in EXPECTED.items():
+            result = parse_template(os.path.join(TEMPLATE_DIR, filename))
+            with self.subTest(template=filename):
+                self.assertEqual(result["name"], name)
+                self.assertEqual(parse_address(result["address"]), address)
+                self.assertEqual(result["email"], email)
+                self.assertEqual(result["rate"], rate)
+                self.assertEqual(result["cadence"], cadence)
+                self.assertTrue(all(c >= 0.8 for k, c in result["confidence"].items() if k != "email"))
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address("1214 S 115th ST, West Allis, WI  53214"), ("1214 S 115th ST", "West Allis", "WI", "53214"))
+        self.assertEqual(parse_address("16840 Fairview Ct, Brookfield"), ("16840 Fairview Ct", "Brookfield", "", ""))
+        self.assertEqual(parse_address("Main St 53151-1234"), ("Main St", "", "", "53151-1234"))
+        self.assertEqual(parse_address(""), ("", "", "", ""))
+
+    def test_fallbacks_and_confidence(self):
+        result = customer_extractor.extract([
+            "to: Jane Doe",
+            "FOR: Somewhere",
+            "Billing: linda@stonegaterealty.com, jane@example.com, other@example.com",
+            "Total due:   $1,200.50",
+            "Total due:   $99",
+        ])
+        self.assertEqual(result["name"].value, "Jane Doe")
+        self.assertEqual(result["address"].confidence, 0.6)  # no house number
+        self.assertEqual(result["email"].value, "jane@example.com")
+        # No management line: the first total stands in for the rate, with low confidence
+        self.assertEqual((result["rate"].value, result["rate"].confidence, result["rate"].paragraph), (1200.5, 0.5, 3))
+        self.assertEqual(result["cadence"], ("monthly", 0.0, None))
+
+        result = customer_extractor.extract(["Annual management fee $ 600", "Total due: $650"])
+        self.assertEqual((result["rate"].value, result["cadence"].value), (600.0, "yearly"))
+
+    def test_custom_rules(self):
+        extractor = Extractor([
+            Rule(["invoice #"], Field("number", lambda m: m.group(1)), pattern=r"invoice #\s*(\d+)"),
+            Rule(["ref:"], Field("number", lambda m: m.group(1), confidence=0.4), pattern=r"ref:\s*(\d+)", at_start=True),
+        ], {"number": None})
+        self.assertEqual(extractor.extract(["Ref: 7", "See INVOICE # 1234", "not at start ref: 9"])["number"].value, "1234")
+        self.assertEqual(extractor.extract(["Ref: 7"])["number"].value, "7")
+        self.assertIsNone(extractor.extract(["nothing here"])["number"].value)
+
+
+if __name__ == '__main__':
+    unittest.main()
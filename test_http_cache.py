@@ -0,0 +1,109 @@
+import gzip
+import unittest
+from datetime import date
+from unittest.mock import patch
+import http_cache
+from compression import buffered
+from app import app, init_db, SessionLocal
+from models import Customer, Invoice
+
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+
+    def test_list_pages_revalidate_until_data_changes(self):
+        print("\nTesting conditional GETs on list pages...")
+        etags = {}
+        for path in ('/customers', '/invoices'):
+            first = self.client.get(path)
+            self.assertEqual(first.status_code, 200)
+            first.get_data()  # finish streamed bodies so their request context is released
+            etag = etags[path] = first.headers["ETag"]
+            self.assertIn("no-cache", first.headers["Cache-Control"])
+
+            again = self.client.get(path, headers={"If-None-Match": etag})
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again.data, b"")
+
+        # Any committed write changes the token
+        session = SessionLocal()
+        session.add(Customer(name="Etag Customer", email="etag@example.com", property_address="1 Etag St",
+                             rate=1.0, cadence="monthly", next_bill_date=date.today()))
+        session.commit()
+        session.close()
+        changed = self.client.get('/customers', headers={"If-None-Match": etags['/customers']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn(b"Etag Customer", changed.data)
+
+    def test_deploy_changes_the_etag(self):
+        first = self.client.get('/customers')
+        first.get_data()
+        with patch.object(http_cache, "_build_id", "next-deploy"):
+            after_deploy = self.client.get('/customers', headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(after_deploy.status_code, 200)
+        self.assertIn("next-deploy", after_deploy.headers["ETag"])
+        after_deploy.get_data()
+
+    def test_static_assets_are_fingerprinted(self):
+        page = self.client.get('/customers').data.decode()
+        self.assertRegex(page, r"/static/style\.css\?v=[0-9a-f]{12}")
+        url = page.split('href="/static/style.css?v=')[1].split('"')[0]
+        response = self.client.get(f'/static/style.css?v={url}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 3600)
+        self.assertTrue(response.cache_control.immutable)
+        response.close()
+
+
+class TestStreamingAndCompression(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+        session = SessionLocal()
+        inv = Invoice(customer_id=0, invoice_date=date.today(), period_label="Stream Period", amount=1.0,
+                      file_path="s.docx", email_subject="Stream Subject", email_body="Secret <b>body</b> text")
+        session.add(inv)
+        session.commit()
+        self.invoice_id = inv.id
+        session.close()
+
+    def test_invoice_list_streams_without_email_bodies(self):
+        print("\nTesting streamed invoice list...")
+        response = self.client.get('/invoices')
+        self.assertTrue(response.is_streamed)
+        page = response.get_data(as_text=True)
+        self.assertIn("Stream Period", page)
+        self.assertNotIn("Secret", page)
+
+        email = self.client.get(f'/invoices/{self.invoice_id}/email').get_json()
+        self.assertEqual(email, {"subject": "Stream Subject", "body": "Secret <b>body</b> text"})
+        self.assertEqual(self.client.get('/invoices/999999/email').status_code, 404)
+
+    def test_closing_a_buffered_stream_closes_the_template_stream(self):
+        closed = []
+        def chunks():
+            try:
+                while True:
+                    yield "x" * 100
+            finally:
+                closed.append(True)
+        stream = buffered(chunks(), size=1000)
+        self.assertEqual(len(next(stream)), 1000)
+        stream.close()
+        self.assertEqual(closed, [True])
+
+    def test_gzip_negotiated_for_streamed_and_buffered_pages(self):
+        for path in ('/invoices', '/customers'):
+            plain = self.client.get(path).get_data()
+            response = self.client.get(path, headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+            self.assertIn("Accept-Encoding", response.headers.get("Vary", ""))
+            self.assertEqual(gzip.decompress(response.get_data()), plain)
+
+
+if __name__ == '__main__':
+    unittest.main()
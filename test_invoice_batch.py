@@ -0,0 +1,161 @@
+import threading
+import time
+import unittest
+from datetime import date
+from unittest.mock import patch
+from docx import Document
+import prerender
+from app import app, init_db, SessionLocal
+from sqlalchemy import event
+from models import engine, Customer, CustomerFee, Invoice, InvoiceLine, Property
+from invoice_generator import generate_invoice_buffer, load_property_fees
+from reports import rebuild_rollups, outstanding_by_customer
+from test_reports import _rollup_snapshot
+
+
+class TestInvoiceBatchApi(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+        session = SessionLocal()
+        rebuild_rollups(session)
+        session.commit()
+        customers = [
+            Customer(name=f"Batch {i}", email=f"b{i}@example.com", property_address=f"{i} Batch Ave",
+                     rate=100.0 * (i + 1), cadence="monthly", fee_2_type="Extra", fee_2_rate=10.0,
+                     next_bill_date=date.today())
+            for i in range(3)
+        ]
+        session.add_all(customers)
+        session.commit()
+        self.customer_ids = [c.id for c in customers]
+        session.close()
+
+    def _assert_rollups_consistent(self):
+        session = SessionLocal()
+        incremental = _rollup_snapshot(session)
+        rebuild_rollups(session)
+        self.assertEqual(incremental, _rollup_snapshot(session))
+        session.rollback()
+        session.close()
+
+    def test_batch_lifecycle(self):
+        print("\nTesting batch invoice API...")
+        response = self.client.post('/api/invoices/generate', json={
+            "customer_ids": self.customer_ids + [999999],
+            "invoice_date": "2031-02-01",
+        })
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()["results"]
+        self.assertEqual([r["status"] for r in results], ["created", "created", "created", "not_found"])
+        invoice_ids = [r["invoice_id"] for r in results[:3]]
+
+        # Same period again is skipped
+        response = self.client.post('/api/invoices/generate', json={"customer_ids": self.customer_ids[:1], "invoice_date": "2031-02-15"})
+        self.assertEqual(response.get_json()["results"][0]["status"], "skipped")
+        self._assert_rollups_consistent()
+
+        response = self.client.post('/api/invoices/mark-paid', json={"items": [
+            {"id": invoice_ids[0], "paid_date": "2031-02-10"},
+            {"id": invoice_ids[1], "paid_date": "2031-02-11"},
+            {"id": 999999},
+        ]})
+        self.assertEqual([r["status"] for r in response.get_json()["results"]], ["updated", "updated", "not_found"])
+        response = self.client.post('/api/invoices/mark-paid', json={"items": [{"id": invoice_ids[0]}]})
+        self.assertEqual(response.get_json()["results"][0]["status"], "already_paid")
+
+        session = SessionLocal()
+        paid = session.query(Invoice).get(invoice_ids[1])
+        self.assertEqual((paid.status, paid.paid_date), ("Paid", date(2031, 2, 11)))
+        session.close()
+        self._assert_rollups_consistent()
+
+        response = self.client.post('/api/invoices/delete', json={"ids": invoice_ids[1:] + [999999]})
+        self.assertEqual([r["status"] for r in response.get_json()["results"]], ["deleted", "deleted", "not_found"])
+        session = SessionLocal()
+        self.assertEqual(session.query(Invoice).filter(Invoice.id.in_(invoice_ids)).count(), 1)
+        session.close()
+        self._assert_rollups_consistent()
+
+    def test_customer_fees_become_invoice_lines(self):
+        print("\nTesting customer fee line items...")
+        session = SessionLocal()
+        session.add_all([CustomerFee(customer_id=self.customer_ids[0], fee_type="Snow Removal", amount=40.0, position=0),
+                         CustomerFee(customer_id=self.customer_ids[0], fee_type="Landscaping", amount=25.0, position=1)])
+        session.commit()
+        session.close()
+
+        response = self.client.post('/api/invoices/generate', json={"customer_ids": self.customer_ids[:1], "invoice_date": "2032-03-01"})
+        invoice_id = response.get_json()["results"][0]["invoice_id"]
+        session = SessionLocal()
+        invoice = session.query(Invoice).get(invoice_id)
+        self.assertEqual([(l.fee_type, l.amount) for l in invoice.lines], [("Snow Removal", 40.0), ("Landscaping", 25.0)])
+        self.assertIn("Amount due: $175.00", invoice.email_body)
+        balances = {row["customer_id"]: row["balance"] for row in outstanding_by_customer(session)}
+        self.assertEqual(balances[self.customer_ids[0]], 175.0)
+
+        # The invoice keeps the fees it was billed with
+        session.query(CustomerFee).filter(CustomerFee.customer_id == self.customer_ids[0]).delete()
+        session.commit()
+        _, buffer = generate_invoice_buffer(invoice)
+        session.close()
+        self.assertIn("Landscaping", "\n".join(p.text for p in Document(buffer).paragraphs))
+        self._assert_rollups_consistent()
+
+        self.client.post('/api/invoices/delete', json={"ids": [invoice_id]})
+        session = SessionLocal()
+        self.assertEqual(session.query(InvoiceLine).filter(InvoiceLine.invoice_id == invoice_id).count(), 0)
+        session.close()
+        self._assert_rollups_consistent()
+
+    def test_property_fees_are_read_in_one_query(self):
+        session = SessionLocal()
+        for n, cid in enumerate(self.customer_ids):
+            session.add_all([Property(customer_id=cid, address=f"{n} Side St", fee_amount=5.0 * (n + 1)),
+                             Property(customer_id=cid, address=f"{n} Back St", fee_amount=None)])
+        session.commit()
+        session.close()
+
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append((threading.current_thread().name, statement))
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            # One warmer batch for all three invoices
+            with patch.object(prerender, "PRERENDER_WORKERS", 1):
+                response = self.client.post('/api/invoices/generate', json={"customer_ids": self.customer_ids, "invoice_date": "2032-05-01"})
+            deadline = time.time() + 10
+            while prerender.pending() and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        # One query while generating, one for the pre-render batch
+        self.assertEqual(len([sql for _, sql in statements if "FROM properties" in sql]), 2)
+        # The batch reads invoices, customers, property fees and lines once each, then only renders
+        self.assertEqual(len([sql for name, sql in statements if name.startswith("prerender")]), 4)
+
+        session = SessionLocal()
+        invoices = session.query(Invoice).filter(Invoice.id.in_([r["invoice_id"] for r in response.get_json()["results"]])).all()
+        # rate + fee 2 + property fee
+        self.assertEqual(sorted(float(i.email_body.split("$")[1].split()[0]) for i in invoices), [115.0, 220.0, 325.0])
+        fees = load_property_fees(session, self.customer_ids)
+        self.assertEqual(fees[self.customer_ids[2]], (15.0, [("2 Side St", 15.0)]))
+        session.close()
+
+        statements.clear()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            generate_invoice_buffer(invoices[0], fees[invoices[0].customer_id])
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        self.assertEqual([sql for _, sql in statements if "FROM properties" in sql], [])
+
+    def test_bad_payloads(self):
+        self.assertEqual(self.client.post('/api/invoices/delete', data="nope").status_code, 400)
+        self.assertEqual(self.client.post('/api/invoices/delete', json={"ids": ["x"]}).status_code, 400)
+        self.assertEqual(self.client.post('/api/invoices/mark-paid', json={"items": [{"id": 1, "paid_date": "soon"}]}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
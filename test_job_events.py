@@ -0,0 +1,96 @@
+import threading
+import unittest
+from unittest.mock import patch
+import app as app_module
+from app import app, init_db
+from job_events import JobRun, JobCancelled, sse_format
+from job_lease import get_job_status
+
+
+def counting_job(run):
+    for n in range(1, 4):
+        run.emit("invoice_created", customer_id=n)
+        run.emit("progress", done=n, total=3)
+    return {"created": 3}
+
+
+class TestJobEvents(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+
+    def test_stream_replays_then_follows(self):
+        run = JobRun("test")
+        run.emit("progress", done=1, total=2)
+
+        def finish_later():
+            run.emit("progress", done=2, total=2)
+            run.finish("finished", created=2)
+        threading.Timer(0.05, finish_later).start()
+
+        events = [e for e in run.stream() if e is not None]
+        self.assertEqual([kind for _, kind, _ in events], ["progress", "progress", "finished"])
+        # Resuming after an event id only sends what came later
+        self.assertEqual([seq for seq, _, _ in run.stream(after=2)], [3])
+        self.assertEqual(sse_format(events[-1]), 'id: 3\nevent: finished\ndata: {"created": 2}\n\n')
+
+    def test_stop_request_cancels_at_next_event(self):
+        run = JobRun("test")
+        run.emit("progress", done=0, total=10)
+        run.cancel()
+        with self.assertRaises(JobCancelled):
+            run.emit("progress", done=1, total=10)
+
+    def test_start_route_streams_progress(self):
+        print("\nTesting job progress stream...")
+        with patch.dict(app_module.JOBS, {"billing": counting_job}):
+            response = self.client.post('/jobs/billing/start')
+            self.assertEqual(response.status_code, 202)
+            run = response.get_json()
+            stream = self.client.get(run["events_url"])
+            self.assertEqual(stream.mimetype, "text/event-stream")
+            body = stream.get_data(as_text=True)
+        self.assertEqual(body.count("event: invoice_created"), 3)
+        self.assertIn('event: finished\ndata: {"created": 3}', body)
+
+        self.assertEqual(self.client.post('/jobs/nope/start').status_code, 404)
+        self.assertEqual(self.client.get('/jobs/runs/unknown/events').status_code, 404)
+
+    def test_start_route_runs_in_the_request_on_vercel(self):
+        with patch.dict(app_module.JOBS, {"billing": counting_job}), \
+                patch.object(app_module, "JOBS_IN_BACKGROUND", False):
+            response = self.client.post('/jobs/billing/start')
+        self.assertEqual(response.status_code, 200)
+        run = response.get_json()
+        self.assertEqual(run["status"], "finished")
+        self.assertEqual(run["log"][-1], "finished: created=3")
+        self.assertFalse(get_job_status("billing")["running"])
+
+    def test_stop_route(self):
+        started, stopped = threading.Event(), threading.Event()
+
+        def endless_job(run):
+            try:
+                while True:
+                    run.emit("progress", done=0)
+                    started.set()
+                    stopped.wait(0.01)
+            finally:
+                stopped.set()
+
+        with patch.dict(app_module.JOBS, {"seeding": endless_job}):
+            run = self.client.post('/jobs/seeding/start').get_json()
+            self.assertTrue(started.wait(5))
+            self.assertEqual(self.client.post(run["stop_url"]).status_code, 202)
+            body = self.client.get(run["events_url"]).get_data(as_text=True)
+        self.assertTrue(body.rstrip().endswith("event: cancelled\ndata: {}"))
+
+    def test_jobs_page(self):
+        response = self.client.get('/jobs')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Daily Billing", response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
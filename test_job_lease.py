@@ -0,0 +1,63 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from app import app, init_db
+from models import engine, JobLease
+from job_lease import job_lease, get_job_status, JobAlreadyRunning
+
+
+class TestJobLease(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+        with engine.begin() as conn:
+            conn.execute(JobLease.__table__.delete())
+
+    def test_second_caller_sees_progress(self):
+        with job_lease("test-job") as lease:
+            lease.progress(3, 10)
+            with self.assertRaises(JobAlreadyRunning) as ctx:
+                with job_lease("test-job"):
+                    self.fail("lease should not be granted twice")
+            self.assertTrue(ctx.exception.status["running"])
+            self.assertEqual((ctx.exception.status["done"], ctx.exception.status["total"]), (3, 10))
+
+        status = get_job_status("test-job")
+        self.assertFalse(status["running"])
+        self.assertIsNotNone(status["finished_at"])
+        # Free again once released
+        with job_lease("test-job"):
+            pass
+
+    def test_expired_lease_is_taken_over(self):
+        with engine.begin() as conn:
+            conn.execute(JobLease.__table__.insert().values(
+                name="stale-job", owner="dead-worker", started_at=datetime.utcnow() - timedelta(hours=2),
+                expires_at=datetime.utcnow() - timedelta(hours=1),
+            ))
+        with job_lease("stale-job") as lease:
+            self.assertNotEqual(get_job_status("stale-job")["owner"], "dead-worker")
+            self.assertEqual(lease.name, "stale-job")
+
+    def test_routes_answer_409_while_running(self):
+        print("\nTesting maintenance routes under a held lease...")
+        with job_lease("billing") as lease:
+            lease.progress(1, 4)
+            for path in ('/run-today', '/clear-invoices'):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 409)
+                body = response.get_json()
+                self.assertEqual(body["status"], "already_running")
+                self.assertEqual(body["job"]["done"], 1)
+
+        # Free again once released; the session is a mock so the database's invoices are left alone
+        with patch("app.SessionLocal") as session_factory:
+            session_factory.return_value.query.return_value.count.return_value = 0
+            response = self.client.get('/clear-invoices')
+        self.assertEqual(response.status_code, 200)
+        session_factory.return_value.commit.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import log_analytics
+from log_analytics import Histogram, analyze, iter_rows, route_of
+
+FIELDS = ["TimeUTC", "timestampInMs", "requestPath", "responseStatusCode", "requestId", "level",
+          "durationMs", "maxMemoryUsed", "memorySize", "message", "instanceId"]
+TRACEBACK = 'Exception on /customers [GET]\nTraceback (most recent call last):\n  File "app.py", line 59\nValueError: "bad"'
+
+
+def summary(ts, request_id, path, status, duration, memory=128, instance="i1"):
+    return [f"t{ts}", ts, "host.vercel.app" + path, status, request_id, "error" if status >= 500 else "info",
+            duration, memory, 2048, "", instance]
+
+
+def message(ts, request_id, path, text, level="info"):
+    return [f"t{ts}", ts, "host.vercel.app" + path, -1, request_id, level, -1, -1, -1, text, ""]
+
+
+# Newest first, like Vercel's exports
+ROWS = [
+    summary(1600, "r4", "/invoices/49/download", 200, 120, memory=140, instance="i2"),
+    message(1500, "r3", "/", "Error importing app.py:\nTraceback", level="error"),
+    summary(1450, "r3", "/", 500, 160, memory=53, instance=""),
+    message(1300, "r2", "/customers", '127.0.0.1 - - "GET /customers HTTP/1.1" 500 -'),
+    message(1300, "r2", "/customers", TRACEBACK, level="error"),  # same millisecond as the access log line
+    summary(1290, "r2", "/customers", 500, 40),
+    summary(1100, "r1", "/customers", 200, 2500),
+]
+
+
+class TestLogAnalytics(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def export(self, name, rows):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(FIELDS)
+            writer.writerows(rows)
+        return path
+
+    def test_overlapping_exports_are_deduplicated(self):
+        paths = [self.export("a.csv", ROWS[:5]), self.export("b.csv", ROWS[2:]), self.export("c.csv", ROWS)]
+        rows = list(iter_rows(paths))
+        self.assertEqual(len(rows), len(ROWS))
+        self.assertEqual([int(r["timestampInMs"]) for r in rows], sorted((r[1] for r in ROWS), reverse=True))
+        self.assertIn(TRACEBACK, [r["message"] for r in rows])
+
+    def test_route_stats(self):
+        routes = analyze(iter_rows([self.export("a.csv", ROWS)]))
+        self.assertEqual(sorted(routes), ["/", "/customers", "/invoices/<id>/download"])
+        customers = routes["/customers"].as_dict()
+        self.assertEqual((customers["requests"], customers["p50_ms"], customers["max_ms"]), (2, 40, 2500))
+        self.assertEqual((customers["error_rate"], customers["cold_starts"]), (0.5, 1))
+        self.assertEqual(routes["/"].as_dict()["failed_starts"], 1)
+        self.assertEqual(routes["/invoices/<id>/download"].as_dict()["memory_max_mb"], 140)
+
+    def test_unsorted_export(self):
+        path = self.export("a.csv", list(reversed(ROWS)))
+        with patch("sys.stderr", io.StringIO()) as err:
+            self.assertEqual(log_analytics.main([path]), 1)
+        self.assertIn("not sorted", err.getvalue())
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in range(1, 2001):
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(50), 1000)
+        self.assertEqual(histogram.percentile(99), 1980)
+        self.assertEqual(histogram.max, 2000)
+        self.assertLessEqual(len(histogram.counts), 1100)
+
+    def test_route_of(self):
+        self.assertEqual(route_of("host.vercel.app"), "/")
+        self.assertEqual(route_of("host.vercel.app/customers/13/edit"), "/customers/<id>/edit")
+        self.assertEqual(route_of("host.vercel.app/static/style.css"), "/static/style.css")
+
+    def test_repo_exports(self):
+        with patch("sys.stdout", io.StringIO()) as out:
+            self.assertEqual(log_analytics.main(["--top", "3"]), 0)
+        self.assertIn("(all)", out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
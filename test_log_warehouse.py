@@ -0,0 +1,87 @@
+import csv
+import glob
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import log_warehouse
+from log_analytics import LOG_DIR, iter_rows
+from log_warehouse import connect, errors, ingest, latency_by_route, parse_time
+
+EXPORTS = sorted(glob.glob(os.path.join(LOG_DIR, "*.csv")))
+
+
+class TestLogWarehouse(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.conn = connect(os.path.join(self.dir, "warehouse.db"))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.dir)
+
+    def count(self, table):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_incremental_ingest(self):
+        print("\nTesting incremental log ingestion...")
+        first = ingest(self.conn, EXPORTS[:10])
+        self.assertTrue(all(added is not None for added in first.values()))
+        before = self.count("requests")
+        self.assertEqual(set(ingest(self.conn, EXPORTS[:10]).values()), {None})  # already ingested
+        self.assertEqual(self.count("requests"), before)
+
+        ingest(self.conn, EXPORTS)
+        expected = [r for r in iter_rows(EXPORTS) if r["durationMs"] != "-1"]
+        self.assertEqual(self.count("requests"), len(expected))
+        self.assertEqual(self.count("messages"), sum(1 for r in iter_rows(EXPORTS) if r["message"]))
+
+    def test_overlapping_export_adds_only_new_rows(self):
+        path = os.path.join(self.dir, "export.csv")
+        with open(EXPORTS[0], newline="") as f:
+            rows = list(csv.reader(f))
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerows(rows[:-1])
+        ingest(self.conn, [path])
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+        requests, messages = ingest(self.conn, [path])[path]
+        self.assertEqual(requests + messages, 1)
+
+    def test_queries(self):
+        ingest(self.conn, EXPORTS)
+        deployment = "dpl_5dQti4BBGKZvrF2E9ePHdBoghnd4"
+        routes = {row[0]: row for row in latency_by_route(self.conn, deployment=deployment)}
+        durations = sorted(r[0] for r in self.conn.execute(
+            "SELECT duration_ms FROM requests WHERE deployment_id = ? AND route = '/customers'", (deployment,)))
+        _, count, p50, p95, p99, longest, _ = routes["/customers"]
+        self.assertEqual((count, p50, longest), (len(durations), durations[(len(durations) + 1) // 2 - 1], durations[-1]))
+        self.assertLessEqual(p95, p99)
+
+        recent = errors(self.conn, since=parse_time("2025-11-26"))
+        self.assertTrue(recent)
+        self.assertTrue(all(status >= 500 for _, _, status, _, _ in recent))
+        self.assertTrue(recent[0][4].startswith("jinja2.exceptions.TemplateSyntaxError"))
+        self.assertEqual(errors(self.conn, since=parse_time("24h")), [])
+
+        plan = " ".join(str(row) for row in self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM requests WHERE deployment_id = ?", (deployment,)))
+        self.assertIn("requests_deployment", plan)
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("24h", now=100000), (100000 - 86400) * 1000)
+        self.assertEqual(parse_time("2025-11-21"), 1763683200000)
+
+    def test_cli(self):
+        db = os.path.join(self.dir, "cli.db")
+        with patch("sys.stdout", io.StringIO()) as out, patch("sys.stderr", io.StringIO()):
+            log_warehouse.main(["--db", db, "ingest", EXPORTS[0]])
+            log_warehouse.main(["--db", db, "latency"])
+        self.assertIn("requests", out.getvalue())
+        self.assertIn("p95", out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import json
+import logging
+import unittest
+from app import app
+from structured_logging import JsonFormatter, RequestContextFilter, DebugSamplingFilter, RedactingFilter, REDACTED
+
+
+class TestStructuredLogging(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.handler.setFormatter(JsonFormatter())
+        for log_filter in (RequestContextFilter(), DebugSamplingFilter(rate=1), RedactingFilter(enabled=True)):
+            self.handler.addFilter(log_filter)
+        self.logger = logging.getLogger("test_logging")
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def records(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_record_with_request_id_and_redaction(self):
+        with app.test_request_context("/"):
+            from flask import g
+            g.request_id = "abc123"
+            self.logger.info("billing customer", extra={"customer_id": 7, "email": "x@y.com", "customer_name": "Jane"})
+        record = self.records()[0]
+        self.assertEqual(record["msg"], "billing customer")
+        self.assertEqual(record["logger"], "test_logging")
+        self.assertEqual(record["request_id"], "abc123")
+        self.assertEqual(record["customer_id"], 7)
+        self.assertEqual((record["email"], record["customer_name"]), (REDACTED, REDACTED))
+
+    def test_debug_sampling_is_per_request(self):
+        sampler = DebugSamplingFilter(rate=0.5)
+        kept = 0
+        for n in range(200):
+            record = logging.LogRecord("x", logging.DEBUG, "", 0, "m", (), None)
+            record.request_id = f"req-{n}"
+            decision = sampler.filter(record)
+            # Same request, same decision
+            self.assertEqual(decision, sampler.filter(record))
+            kept += decision
+        self.assertTrue(40 < kept < 160)
+
+        info = logging.LogRecord("x", logging.INFO, "", 0, "m", (), None)
+        self.assertTrue(DebugSamplingFilter(rate=0).filter(info))
+
+    def test_exception_is_captured(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("failed")
+        self.assertIn("ValueError: boom", self.records()[0]["exc"])
+
+    def test_request_id_header(self):
+        client = app.test_client()
+        response = client.get('/customers', headers={"X-Request-ID": "given-id"})
+        self.assertEqual(response.headers["X-Request-ID"], "given-id")
+        response = client.get('/customers')
+        self.assertEqual(len(response.headers["X-Request-ID"]), 32)
+
+
+if __name__ == '__main__':
+    unittest.main()
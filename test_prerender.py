@@ -0,0 +1,81 @@
+import time
+import unittest
+from datetime import date
+from unittest.mock import patch
+import prerender
+from app import app, init_db, SessionLocal
+from models import Customer, Invoice
+from invoice_generator import generate_invoice_for_customer
+from prerender import RenderCache, render_cache, render_fingerprint
+
+
+class TestPrerender(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+        render_cache.clear()
+
+    def _wait_for_warmer(self, timeout=10):
+        deadline = time.time() + timeout
+        while prerender.pending() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(prerender.pending(), 0)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = RenderCache(max_bytes=10)
+        cache.put("a", "a.docx", b"12345")
+        cache.put("b", "b.docx", b"12345")
+        cache.get("a")
+        cache.put("c", "c.docx", b"12345")
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        cache.put("huge", "h.docx", b"x" * 11)
+        self.assertNotIn("huge", cache)
+
+    @patch.object(prerender, "PRERENDER_WORKERS", 1)
+    def test_new_invoice_is_warmed_before_first_download(self):
+        print("\nTesting background pre-render...")
+        session = SessionLocal()
+        c = Customer(name="Warm Customer", email="warm@example.com", property_address="1 Warm St",
+                     rate=120.0, cadence="monthly", next_bill_date=date(2025, 10, 1))
+        session.add(c)
+        session.commit()
+        session.refresh(c)
+        _ = c.properties
+        session.close()
+
+        generate_invoice_for_customer(c, date(2025, 10, 1))
+        self._wait_for_warmer()
+
+        session = SessionLocal()
+        invoice = session.query(Invoice).filter_by(customer_id=c.id).one()
+        customer = session.get(Customer, c.id)
+        key = render_fingerprint(invoice, customer)
+        self.assertIn(key, render_cache)
+
+        # The download is served from the cache without rendering again
+        with patch("invoice_generator._generate_invoice_logic", side_effect=AssertionError("rendered again")):
+            response = self.client.get(f'/invoices/{invoice.id}/download')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, render_cache.get(key)[1])
+
+        # Editing the customer changes the fingerprint, so the stale document isn't reused
+        for field, value in (("property_address", "2 Warm St"), ("fee_type", "Leasing Fee"), ("rate", 999.0)):
+            setattr(customer, field, value)
+            self.assertNotEqual(render_fingerprint(invoice, customer), key, field)
+            key = render_fingerprint(invoice, customer)
+        session.close()
+
+    @patch.object(prerender, "PRERENDER_WORKERS", 1)
+    @patch.object(prerender, "PRERENDER_QUEUE_LIMIT", 0)
+    def test_full_queue_skips_without_blocking(self):
+        self.assertEqual(prerender.schedule([1, 2, 3]), 0)
+
+    @patch.object(prerender, "PRERENDER_WORKERS", 0)
+    def test_disabled_warmer_queues_nothing(self):
+        self.assertEqual(prerender.schedule([1]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from datetime import date, timedelta
+from app import app, init_db, SessionLocal
+from models import engine, Customer, Invoice, InvoiceRollup
+from reports import apply_invoice, rebuild_rollups, revenue_report, ar_aging_report
+
+
+def _rollup_snapshot(session):
+    rows = session.query(InvoiceRollup.period_label, InvoiceRollup.status, InvoiceRollup.fee_type,
+                         InvoiceRollup.line_count, InvoiceRollup.amount)
+    return sorted((p, s, f, n, round(a, 2)) for p, s, f, n, a in rows if n)
+
+
+class TestReports(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+        session = SessionLocal()
+        rebuild_rollups(session)
+        session.commit()
+        session.close()
+
+    def _create_invoice(self, **fields):
+        session = SessionLocal()
+        c = Customer(name="Report Customer", email="r@example.com", property_address="1 Report Rd",
+                     rate=200.0, cadence="quarterly", next_bill_date=date.today())
+        session.add(c)
+        session.commit()
+        inv = Invoice(customer_id=c.id, invoice_date=fields.pop("invoice_date", date.today()),
+                      period_label=fields.pop("period_label", "Report Period"), amount=200.0, file_path="r.docx",
+                      email_subject="Report", email_body="Report", **fields)
+        session.add(inv)
+        apply_invoice(session, inv)
+        session.commit()
+        inv_id = inv.id
+        session.close()
+        return inv_id
+
+    def test_incremental_rollups_match_rebuild(self):
+        print("\nTesting incremental rollups against a full rebuild...")
+        inv_id = self._create_invoice(fee_2_type="Late Fee", fee_2_amount=25.0, additional_fee_amount=10.0)
+
+        self.client.post(f'/invoices/{inv_id}/toggle-status', data={'paid_date': date.today().isoformat()})
+        session = SessionLocal()
+        period = [r for r in revenue_report(session) if r["key"] == "Report Period"][0]
+        self.assertEqual(period["paid"], 235.0)
+        incremental = _rollup_snapshot(session)
+        rebuild_rollups(session)
+        self.assertEqual(incremental, _rollup_snapshot(session))
+        session.rollback()
+        session.close()
+
+        self.client.post(f'/invoices/{inv_id}/delete')
+        session = SessionLocal()
+        incremental = _rollup_snapshot(session)
+        rebuild_rollups(session)
+        self.assertEqual(incremental, _rollup_snapshot(session))
+        session.close()
+
+    def test_blank_fee_types_land_in_the_same_rollup_after_a_rebuild(self):
+        inv_id = self._create_invoice(period_label="Blank Fee Period", fee_type="", fee_2_type="", fee_2_amount=15.0)
+        session = SessionLocal()
+        rebuild_rollups(session)
+        session.commit()
+        session.close()
+
+        # The incremental update has to take back exactly what the rebuild counted
+        self.client.post(f'/invoices/{inv_id}/delete')
+        session = SessionLocal()
+        rows = session.query(InvoiceRollup.fee_type, InvoiceRollup.line_count, InvoiceRollup.amount).filter(
+            InvoiceRollup.period_label == "Blank Fee Period").all()
+        self.assertEqual({fee_type for fee_type, _, _ in rows}, {"Management Fee", "Fee"})
+        self.assertEqual({(count, amount) for _, count, amount in rows}, {(0, 0.0)})
+        session.close()
+
+    def test_rollup_table_is_backfilled_when_created(self):
+        self._create_invoice(fee_2_type="Late Fee", fee_2_amount=25.0)
+        session = SessionLocal()
+        expected = _rollup_snapshot(session)
+        session.close()
+        self.assertTrue(expected)
+
+        # As on an install from before the rollups: invoices, but no rollup table
+        InvoiceRollup.__table__.drop(engine)
+        init_db()
+        session = SessionLocal()
+        self.assertEqual(_rollup_snapshot(session), expected)
+        # Or a table created empty by /migrate-db's create_all
+        session.query(InvoiceRollup).delete()
+        session.commit()
+        session.close()
+        init_db()
+        session = SessionLocal()
+        self.assertEqual(_rollup_snapshot(session), expected)
+        session.close()
+
+    def test_ar_aging_buckets(self):
+        print("\nTesting AR aging buckets...")
+        session = SessionLocal()
+        before = ar_aging_report(session)
+        session.close()
+
+        self._create_invoice(invoice_date=date.today() - timedelta(days=45), fee_3_amount=5.0)
+        session = SessionLocal()
+        after = ar_aging_report(session)
+        session.close()
+        self.assertAlmostEqual(after["31-60"] - before["31-60"], 205.0)
+        self.assertEqual(after["invoice_count"], before["invoice_count"] + 1)
+
+    def test_report_routes(self):
+        self.assertEqual(self.client.get('/reports').status_code, 200)
+        for name in ("ar-aging", "revenue", "outstanding"):
+            self.assertEqual(self.client.get(f'/reports/{name}').status_code, 200)
+        self.assertEqual(self.client.get('/reports/nope').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -67,6 +67,34 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"New Guy", response.data)
 
+    def test_reference_cache_invalidated_on_write(self):
+        print("\nTesting reference data cache invalidation...")
+        from reference_cache import get_fee_types, get_customer_index
+
+        # Prime both caches
+        get_fee_types()
+        get_customer_index()
+
+        # Writes through the routes must be visible on the next GET
+        self.client.post('/settings/fee-types', data={"name": "Cache Test Fee"})
+        self.assertIn("Cache Test Fee", [ft.name for ft in get_fee_types()])
+        response = self.client.get('/customers/new')
+        self.assertIn(b"Cache Test Fee", response.data)
+
+        self.client.post('/customers/new', data={
+            "name": "Cache Picker Guy",
+            "email": "cache@guy.com",
+            "property_address": "1 Cache Ln",
+            "property_city": "",
+            "property_state": "",
+            "property_zip": "",
+            "rate": "10.00",
+            "cadence": "monthly",
+            "next_bill_date": date.today().isoformat()
+        })
+        response = self.client.get('/generate-invoice')
+        self.assertIn(b"Cache Picker Guy", response.data)
+
     def test_invoices_route(self):
         print("\nTesting /invoices route...")
         response = self.client.get('/invoices')
@@ -74,6 +102,7 @@ class TestRoutes(unittest.TestCase):
             print(f"FAILED: {response.status_code}")
             print(response.data.decode('utf-8'))
         self.assertEqual(response.status_code, 200)
+        response.close()
 
     def test_delete_invoice(self):
         print("\nTesting DELETE /invoices/<id>/delete...")
@@ -180,6 +209,7 @@ class TestRoutes(unittest.TestCase):
             "additional_fee_amount": ""
         }, follow_redirects=True)
         self.assertEqual(response.status_code, 200)
+        response.close()  # the redirect lands on the streamed invoice list
 
         # 3. Verify Invoice Record
         session = SessionLocal()
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import inspect, text
+from app import app, init_db
+from models import engine, JobLease
+from job_lease import get_job_status
+from scheduler import LeaderScheduler, LEADER_LEASE, JOBSTORE_TABLE, run_billing, run_rollups, scheduler_status
+
+JOBS = {"billing": (run_billing, "0 6 * * *"), "rollups": (run_rollups, "30 3 * * *")}
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        init_db()
+        with engine.begin() as conn:
+            conn.execute(JobLease.__table__.delete())
+            if inspect(conn).has_table(JOBSTORE_TABLE):
+                conn.execute(text(f"DELETE FROM {JOBSTORE_TABLE}"))
+
+    def _scheduler(self, jobs=JOBS, **kwargs):
+        # Paused: jobs land in the stores but never run
+        scheduler = LeaderScheduler(leader_jobs=jobs, worker_jobs={}, ttl=300, **kwargs)
+        scheduler.start(paused=True, heartbeat=False)
+        self.addCleanup(scheduler.shutdown)
+        return scheduler
+
+    def test_one_leader_among_workers(self):
+        print("\nTesting scheduler leader election...")
+        first, second = self._scheduler(), self._scheduler()
+        self.assertTrue(first.is_leader)
+        self.assertFalse(second.is_leader)
+        self.assertEqual(get_job_status(LEADER_LEASE)["owner"], first.lease.owner)
+        self.assertEqual({job.id for job in first.scheduler.get_jobs()}, {"billing", "rollups"})
+        self.assertEqual(second.scheduler.get_jobs(), [])
+        self.assertEqual(set(scheduler_status()["jobs"]), {"billing", "rollups"})
+
+        # Still the leader on the next heartbeat; the other still waits
+        self.assertTrue(first.tick())
+        self.assertFalse(second.tick())
+
+        # A clean shutdown hands over on the next tick instead of after the lease expires
+        first.shutdown()
+        self.assertTrue(second.tick())
+        self.assertEqual({job.id for job in second.scheduler.get_jobs()}, {"billing", "rollups"})
+
+    def test_expired_leader_is_replaced(self):
+        first, second = self._scheduler(), self._scheduler()
+        with engine.begin() as conn:
+            conn.execute(JobLease.__table__.update().where(JobLease.name == LEADER_LEASE)
+                         .values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        self.assertTrue(second.tick())
+        # The stalled worker finds out on its next heartbeat and stops scheduling
+        self.assertFalse(first.tick())
+        self.assertEqual(first.scheduler.get_jobs(), [])
+
+    def test_missed_run_survives_a_change_of_leader(self):
+        first = self._scheduler(misfire_grace=60, coalesce=False)
+        missed = datetime.now(timezone.utc) - timedelta(hours=2)
+        first.scheduler.modify_job("billing", jobstore="persistent", next_run_time=missed)
+        first.shutdown()
+
+        second = self._scheduler(misfire_grace=7200, coalesce=True)
+        job = second.scheduler.get_job("billing", jobstore="persistent")
+        self.assertEqual(job.next_run_time, missed)  # still due, so it is caught up
+        self.assertEqual((job.misfire_grace_time, job.coalesce), (7200, True))
+
+        # A changed schedule replaces the stored job; an empty one removes it
+        second.shutdown()
+        third = self._scheduler(jobs={"billing": (run_billing, "0 7 * * *"), "rollups": (run_rollups, "")})
+        job = third.scheduler.get_job("billing", jobstore="persistent")
+        self.assertEqual((job.next_run_time.hour, job.next_run_time.minute), (7, 0))
+        self.assertIsNone(third.scheduler.get_job("rollups", jobstore="persistent"))
+
+    def test_requests_with_the_scheduler_enabled(self):
+        # SCHEDULER_ENABLED is read at import, so the app runs in its own process
+        check = ("import app, scheduler; client = app.app.test_client(); "
+                 "print(client.get('/customers').status_code, scheduler._scheduler is not None); "
+                 "scheduler._scheduler.shutdown()")
+        env = dict(os.environ, SCHEDULER_ENABLED="1", SCHEDULER_WARM_CACHE_CRON="", SCHEDULER_BILLING_CRON="",
+                   SCHEDULER_ARCHIVE_CRON="", SCHEDULER_ROLLUPS_CRON="")
+        env.pop("VERCEL", None)
+        result = subprocess.run([sys.executable, "-c", check], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=env, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split()[-2:], ["200", "True"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from datetime import date
+from app import app, init_db, SessionLocal
+from models import Customer, Property, Invoice
+from sqlalchemy import text
+from search import search, ensure_search_index
+from testing import use_temp_database
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        init_db()
+
+    def test_index_follows_writes(self):
+        print("\nTesting search index stays in sync...")
+        session = SessionLocal()
+        c = Customer(
+            name="Zebulon Quirk",
+            email="zeb@quirk.com",
+            property_address="77 Xylophone Way",
+            rate=100.0,
+            cadence="quarterly",
+            next_bill_date=date.today()
+        )
+        session.add(c)
+        session.commit()
+        session.add(Property(customer_id=c.id, address="12 Yarrow Ct", fee_amount=25.0))
+        session.add(Invoice(
+            customer_id=c.id,
+            invoice_date=date.today(),
+            period_label="4th quarter 2025",
+            amount=100.0,
+            file_path="search.docx",
+            email_subject="Invoice – 4th quarter 2025 – 77 Xylophone Way",
+            email_body="Body"
+        ))
+        session.commit()
+        c_id = c.id
+
+        kinds = {r["kind"] for r in search(session, "xylophone")}
+        self.assertEqual(kinds, {"customer", "invoice"})
+        self.assertEqual([r["link_id"] for r in search(session, "yarr")], [c_id])
+        self.assertTrue(search(session, "zeb quirk"))
+
+        # Updates replace the indexed text
+        c.name = "Zebulon Renamed"
+        session.commit()
+        self.assertEqual(search(session, "Quirk com")[0]["title"], "Zebulon Renamed")
+
+        # Deletes remove it (properties cascade with the customer)
+        session.delete(c)
+        session.commit()
+        self.assertEqual({r["kind"] for r in search(session, "yarrow zebulon")}, set())
+        session.close()
+
+    def test_search_route(self):
+        response = self.client.get('/search?q=Test')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/search?q=%22%29+OR+*&format=json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_changed_triggers_reach_an_existing_index(self):
+        engine = use_temp_database(self)
+        session = SessionLocal()
+        customer = Customer(name="Trigger Wombat", email="w@trigger.com", property_address="3 Burrow Ln",
+                            rate=10.0, cadence="monthly", next_bill_date=date.today())
+        session.add(customer)
+        session.commit()
+        with engine.begin() as conn:
+            # As left by an older definition that did not follow updates
+            conn.execute(text("DROP TRIGGER customers_search_au"))
+            conn.execute(text("CREATE TRIGGER customers_search_au AFTER UPDATE ON customers BEGIN SELECT 1; END"))
+            conn.execute(text("DELETE FROM search_index WHERE kind = 'customer'"))
+
+        ensure_search_index(engine)
+        self.assertEqual([r["ref_id"] for r in search(session, "wombat")], [customer.id])
+        customer.name = "Trigger Quokka"
+        session.commit()
+        self.assertEqual([r["ref_id"] for r in search(session, "quokka")], [customer.id])
+        self.assertEqual(search(session, "wombat"), [])
+        session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+import seed_from_templates
+from seed_from_templates import seed_customers, parse_template, TEMPLATE_DIR
+from models import init_db, SessionLocal, Customer
+from testing import use_temp_database
+
+SAMPLES = sorted(
+    f for f in os.listdir(TEMPLATE_DIR)
+    if f.lower().endswith(".docx") and f != "base_invoice_template.docx" and not f.startswith("~")
+)[:3]
+
+
+class TestSeedTemplates(unittest.TestCase):
+    def setUp(self):
+        init_db()
+        self.dir = tempfile.mkdtemp()
+        for f in SAMPLES:
+            shutil.copy2(os.path.join(TEMPLATE_DIR, f), self.dir)
+        self.names = {parse_template(os.path.join(self.dir, f))["name"] for f in SAMPLES} - {""}
+        # Seeding adds customers named after the real templates, so keep them out of the dev database
+        use_temp_database(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def seed(self, **kwargs):
+        events = []
+        summary = seed_customers(events=lambda kind, **data: events.append((kind, data)),
+                                 template_dir=self.dir, **kwargs)
+        return summary, events
+
+    def test_unchanged_templates_are_skipped(self):
+        print("\nTesting incremental template seeding...")
+        summary, _ = self.seed()
+        self.assertEqual(summary["added"], len(self.names))
+
+        # Keep a customer's schedule to check it isn't reset later
+        session = SessionLocal()
+        customer = session.query(Customer).filter(Customer.name.in_(self.names)).first()
+        customer.next_bill_date = date(2030, 1, 1)
+        customer_id = customer.id
+        session.commit()
+        session.close()
+
+        # Touching a file changes its mtime but not its hash
+        path = os.path.join(self.dir, SAMPLES[0])
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) + 10))
+        with patch.object(seed_from_templates, "parse_template", side_effect=AssertionError("re-parsed")):
+            summary, events = self.seed()
+        self.assertEqual(summary["unchanged"], len(SAMPLES))
+        self.assertTrue(all(d["reason"] == "unchanged" for k, d in events if k == "skipped"))
+
+        summary, _ = self.seed(force=True)
+        self.assertEqual(summary["updated"], len(self.names))
+        session = SessionLocal()
+        self.assertEqual(session.get(Customer, customer_id).next_bill_date, date(2030, 1, 1))
+        session.close()
+
+    def test_deleted_customer_is_recreated(self):
+        self.seed()
+        session = SessionLocal()
+        for customer in session.query(Customer).filter(Customer.name.in_(self.names)):
+            session.delete(customer)  # through the ORM, so their properties and fees go too
+        session.commit()
+        session.close()
+        summary, _ = self.seed()
+        self.assertEqual(summary["added"], len(self.names))
+
+    @patch.object(seed_from_templates, "SEED_PARALLEL_MIN_FILES", 1)
+    def test_process_pool_matches_serial(self):
+        serial = [parse_template(os.path.join(self.dir, f)) for f in SAMPLES]
+        parallel = list(seed_from_templates._parse_all([os.path.join(self.dir, f) for f in SAMPLES], workers=2))
+        self.assertEqual(parallel, serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from sqlalchemy import create_engine, text
+from models import configure_sqlite_engine
+
+WORKERS = 4
+WRITES_PER_WORKER = 50
+
+
+def _writer(url, worker_id, writes, errors):
+    engine = configure_sqlite_engine(create_engine(url), profile="production")
+    try:
+        for n in range(writes):
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO events (worker, n) VALUES (:w, :n)"), {"w": worker_id, "n": n})
+                conn.execute(text("SELECT count(*) FROM events")).scalar()
+    except Exception as e:
+        errors.put(f"worker {worker_id}: {e}")
+    finally:
+        engine.dispose()
+
+
+def _read_then_writer(url, worker_id, writes, errors):
+    # Reads first, so the transaction is not a writer yet when it starts. timeout=0 turns off
+    # pysqlite's own 5s wait, leaving the profile's busy_timeout as the only thing that waits.
+    engine = configure_sqlite_engine(create_engine(url, connect_args={"timeout": 0}), profile="production")
+    try:
+        for n in range(writes):
+            with engine.begin() as conn:
+                seen = conn.execute(text("SELECT count(*) FROM events WHERE worker = :w"), {"w": worker_id}).scalar()
+                conn.execute(text("INSERT INTO events (worker, n) VALUES (:w, :n)"), {"w": worker_id, "n": seen})
+    except Exception as e:
+        errors.put(f"worker {worker_id}: {e}")
+    finally:
+        engine.dispose()
+
+
+class TestSqliteProfile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.tmpdir.name, 'contention.db')}"
+        engine = configure_sqlite_engine(create_engine(self.url), profile="production")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE events (id INTEGER PRIMARY KEY, worker INTEGER, n INTEGER)"))
+        self.engine = engine
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_pragmas_applied(self):
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar().lower(), "wal")
+            self.assertEqual(conn.execute(text("PRAGMA synchronous")).scalar(), 1)  # NORMAL
+            self.assertGreater(conn.execute(text("PRAGMA busy_timeout")).scalar(), 0)
+
+    def _run_workers(self, target):
+        ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+        errors = ctx.Queue()
+        procs = [ctx.Process(target=target, args=(self.url, i, WRITES_PER_WORKER, errors)) for i in range(WORKERS)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(timeout=60)
+
+        failures = []
+        while not errors.empty():
+            failures.append(errors.get())
+        return failures
+
+    def test_concurrent_writers_do_not_lock(self):
+        print("\nTesting multi-process SQLite writers...")
+        self.assertEqual(self._run_workers(_writer), [])
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT count(*) FROM events")).scalar(), WORKERS * WRITES_PER_WORKER)
+
+    def test_read_then_write_transactions_do_not_lock(self):
+        self.assertEqual(self._run_workers(_read_then_writer), [])
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("SELECT worker, n FROM events ORDER BY worker, id")).all()
+        # Each worker saw all of its own earlier rows when it wrote the next one
+        self.assertEqual(rows, [(w, n) for w in range(WORKERS) for n in range(WRITES_PER_WORKER)])
+
+
+if __name__ == '__main__':
+    unittest.main()
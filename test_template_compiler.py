@@ -0,0 +1,153 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import patch
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+import invoice_generator
+import template_compiler
+from template_compiler import compile_template, compile_templates, placeholder_paragraphs, read_manifest
+
+
+def make_template(path):
+    doc = Document()
+    doc.add_paragraph("TO: {{CUSTOMER_NAME}}")
+    split = doc.add_paragraph("Date: {{INVOICE_")
+    split.add_run("DATE}}")
+    doc.add_paragraph("{{FEE_LINE_1}}")
+    doc.add_paragraph("Total: {{TOTAL_AMOUNT}")
+    tracked = doc.add_paragraph("Period: ")
+    tracked._p.append(parse_xml(f'<w:ins {nsdecls("w")} w:id="1" w:author="a"><w:r><w:t>{{{{PERIOD}}}}</w:t></w:r></w:ins>'))
+    table = doc.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "{{FEE_LINE_2}}"
+    table.cell(0, 1).text = "{{AMOUNT}}"
+    table.cell(1, 0).text = "{{ADDITIONAL_FEE_LINE}}"
+    doc.sections[0].header.is_linked_to_previous = False
+    doc.sections[0].header.paragraphs[0].text = "{{CUSTOMER_EMAIL}}"
+    doc.save(path)
+
+
+def customer(**fields):
+    values = dict(id=1, name="Jane Doe", email="jane@example.com", property_address="12 Elm St",
+                  property_city="Town", property_state="WI", property_zip="53000", fee_type=None, properties=[], fees=[],
+                  fee_2_type=None, fee_2_rate=None, fee_3_type=None, fee_3_rate=None,
+                  additional_fee_desc=None, additional_fee_amount=None)
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+def render(**fees):
+    _, buffer, _ = invoice_generator._generate_invoice_logic(
+        customer(), date(2025, 8, 1), "3rd quarter 2025", "07/01/2025 - 09/30/2025", 150.0, **fees)
+    return Document(buffer)
+
+
+class TestTemplateCompiler(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.template = os.path.join(self.dir, "test_template.docx")
+        make_template(self.template)
+        template_compiler._loaded.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        template_compiler._loaded.clear()
+
+    def test_base_template_is_clean_and_manifest_current(self):
+        entry = compile_template(invoice_generator.TEMPLATE_PATH)
+        self.assertEqual(entry["problems"], [])
+        found = [name for p in entry["paragraphs"] for name in p["placeholders"]]
+        self.assertEqual(sorted(found), sorted(invoice_generator.PLACEHOLDERS))
+        # Legacy invoices without placeholders are left out of the manifest
+        self.assertEqual(read_manifest(), compile_templates())
+
+    def test_lint_problems(self):
+        entry = compile_template(self.template)
+        problems = [(p["level"], p["location"], p["message"].split(" ")[0]) for p in entry["problems"]]
+        self.assertIn(("warning", ["body", 1], "{{INVOICE_DATE}}"), problems)  # split across runs
+        self.assertIn(("error", ["body", 2], "{{FEE_LINE_1}}"), problems)  # never filled
+        self.assertIn(("error", ["body", 3], "stray"), problems)
+        self.assertIn(("error", ["body", 4], "{{PERIOD}}"), problems)  # inside a tracked change
+        self.assertIn(("error", ["header", 0, 0], "{{CUSTOMER_EMAIL}}"), problems)
+        self.assertIn(("warning", None, "{{PROPERTY_ZIP}}"), problems)  # unused
+        self.assertEqual([p["location"] for p in entry["paragraphs"]],
+                         [["body", 0], ["body", 1], ["body", 2], ["table", 0, 0, 0, 0], ["table", 0, 0, 1, 0],
+                          ["table", 0, 1, 0, 0]])
+
+    def test_cli(self):
+        with patch("sys.stdout", io.StringIO()) as out:
+            self.assertEqual(template_compiler.main(["--dir", self.dir, "--check"]), 1)
+            self.assertIn("out of date", out.getvalue())
+            self.assertEqual(template_compiler.main(["--dir", self.dir, "--write"]), 1)  # lint errors
+        self.assertIn("test_template.docx", read_manifest(os.path.join(self.dir, "placeholders.json"))["templates"])
+
+    def test_stale_manifest_is_compiled_in_memory(self):
+        manifest_path = os.path.join(self.dir, "placeholders.json")
+        manifest = compile_templates(self.dir)
+        manifest["templates"]["test_template.docx"]["paragraphs"] = []
+        template_compiler.write_manifest(manifest, manifest_path)
+        self.assertEqual(placeholder_paragraphs(self.template, manifest_path), [])
+
+        doc = Document(self.template)
+        doc.add_paragraph("{{PERIOD}}")
+        doc.save(self.template)
+        with self.assertLogs("template_compiler", "WARNING"):
+            entries = placeholder_paragraphs(self.template, manifest_path)
+        self.assertIn((("body", 5), ("{{PERIOD}}",)), entries)
+        self.assertIs(placeholder_paragraphs(self.template, manifest_path), entries)
+
+    def test_render_fills_every_placeholder(self):
+        doc = render()
+        text = "\n".join(p.text for p in doc.paragraphs)
+        self.assertNotIn("{{", text)
+        self.assertIn("TO:        Jane Doe", text)
+        self.assertEqual(len(doc.paragraphs), len(Document(invoice_generator.TEMPLATE_PATH).paragraphs) - 3)
+
+        doc = render(fee_2_type="Snow", fee_2_amount=40.0, additional_fee_desc="Repair", additional_fee_amount=9.0)
+        text = "\n".join(p.text for p in doc.paragraphs)
+        self.assertIn("3rd quarter 2025 Snow (07/01/2025 - 09/30/2025) = $40.00", text)
+        self.assertIn("Repair = $9.00", text)
+        self.assertIn("$199.00", text)
+
+    def test_render_removes_empty_fee_rows(self):
+        with patch.object(invoice_generator, "TEMPLATE_PATH", self.template):
+            doc = render(additional_fee_desc="Repair", additional_fee_amount=9.0)
+        rows = [[c.text for c in row.cells] for row in doc.tables[0].rows]
+        self.assertEqual(rows, [["Repair = $9.00", ""]])
+        self.assertEqual(doc.paragraphs[1].text, "Date: 08/01/2025")
+
+    def test_render_repeats_the_additional_fee_line_per_item(self):
+        with patch.object(invoice_generator, "TEMPLATE_PATH", self.template):
+            _, buffer, total = invoice_generator._generate_invoice_logic(
+                customer(properties=[SimpleNamespace(address="9 Oak St", fee_amount=15.0)]), date(2025, 8, 1),
+                "3rd quarter 2025", "07/01/2025 - 09/30/2025", 150.0,
+                lines=[("Snow", 40.0), ("Landscaping", 25.0)], additional_fee_desc="Repair", additional_fee_amount=9.0)
+        rows = [[c.text for c in row.cells] for row in Document(buffer).tables[0].rows]
+        self.assertEqual(rows, [
+            ["3rd quarter 2025 Snow (07/01/2025 - 09/30/2025) = $40.00", ""],
+            ["3rd quarter 2025 Landscaping (07/01/2025 - 09/30/2025) = $25.00", ""],
+            ["Repair = $9.00", ""],
+            ["Management Fee (9 Oak St) = $15.00", ""],
+        ])
+        self.assertEqual(total, 239.0)
+
+    def test_repeated_line_must_hold_only_its_placeholder(self):
+        doc = Document(self.template)
+        doc.add_paragraph("{{ADDITIONAL_FEE_LINE}} {{AMOUNT}}")
+        doc.save(self.template)
+        problems = [(p["level"], p["location"], p["message"].split(" ")[0]) for p in compile_template(self.template)["problems"]]
+        self.assertIn(("error", ["body", 5], "{{AMOUNT}}"), problems)
+
+    def test_render_falls_back_to_scan_when_document_does_not_match(self):
+        with patch.object(template_compiler, "placeholder_paragraphs", return_value=[(("body", 99), ("{{PERIOD}}",))]):
+            doc = render()
+        self.assertNotIn("{{", "\n".join(p.text for p in doc.paragraphs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+"""Helpers shared by the test_*.py files."""
+import tempfile
+import time
+from sqlalchemy import create_engine
+import models
+import prerender
+from models import Base, SessionLocal, configure_sqlite_engine
+from reference_cache import invalidate_customers, invalidate_fee_types
+from search import ensure_search_index
+
+
+def _bind(engine):
+    # Let background renders finish first: they read from whichever database is bound
+    deadline = time.time() + 10
+    while prerender.pending() and time.time() < deadline:
+        time.sleep(0.05)
+    SessionLocal.configure(bind=engine)
+    invalidate_customers()
+    invalidate_fee_types()
+
+
+def use_temp_database(test):
+    """
+    Bind SessionLocal to a fresh SQLite file until `test` finishes, so it neither sees nor
+    changes the rows in the dev database. Job leases still use the shared engine.
+    Returns the temporary engine.
+    """
+    tmpdir = tempfile.TemporaryDirectory()
+    engine = configure_sqlite_engine(create_engine(f"sqlite:///{tmpdir.name}/test.db"))
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+    _bind(engine)
+    # Cleanups run last to first: rebind, drop the temporary engine, then delete its file
+    test.addCleanup(tmpdir.cleanup)
+    test.addCleanup(engine.dispose)
+    test.addCleanup(_bind, models.engine)
+    return engine
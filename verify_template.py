@@ -1,4 +1,4 @@
-from docx import Document
+from docx_text import iter_paragraphs
 import os
 
 def verify_template():
@@ -7,8 +7,6 @@ def verify_template():
         print(f"Error: {path} not found.")
         return
 
-    doc = Document(path)
-    
     print(f"--- Inspecting {path} ---")
     
     placeholders = [
@@ -20,8 +18,11 @@ def verify_template():
     
     found = {p: False for p in placeholders}
     
+    paragraphs = list(iter_paragraphs(path))
+
     print("\n[Paragraphs]")
-    for i, p in enumerate(doc.paragraphs):
+    body = (p for p in paragraphs if p.table is None)
+    for i, p in enumerate(body):
         text = p.text
         for ph in placeholders:
             if ph in text:
@@ -32,15 +33,14 @@ def verify_template():
                  print(f"WARNING: Possible split placeholder in paragraph {i}: '{text}'")
 
     print("\n[Tables]")
-    for t_idx, table in enumerate(doc.tables):
-        for r_idx, row in enumerate(table.rows):
-            for c_idx, cell in enumerate(row.cells):
-                for p_idx, p in enumerate(cell.paragraphs):
-                    text = p.text
-                    for ph in placeholders:
-                        if ph in text:
-                            found[ph] = True
-                            print(f"Found {ph} in Table {t_idx}, Row {r_idx}, Cell {c_idx}: '{text}'")
+    for p in paragraphs:
+        if p.table is None:
+            continue
+        text = p.text
+        for ph in placeholders:
+            if ph in text:
+                found[ph] = True
+                print(f"Found {ph} in Table {p.table}, Row {p.row}, Cell {p.cell}: '{text}'")
 
     print("\n--- Summary ---")
     for ph, is_found in found.items():